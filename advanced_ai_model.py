@@ -12,15 +12,15 @@
 """
 
 import numpy as np
-import pandas as pd
-from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
-from sklearn.preprocessing import StandardScaler
-from sklearn.model_selection import train_test_split, cross_val_score
 import joblib
 import os
 import json
+import threading
 from datetime import datetime
 
+from model_artifact import artifact_is_current, export_artifact, load_artifact
+from tree_inference import compile_joint, compile_model
+
 class AdvancedHealthRiskPredictor:
     """
     Advanced Multi-Risk Healthcare AI System
@@ -38,30 +38,230 @@ class AdvancedHealthRiskPredictor:
     - Emergency threshold detection
     """
     
-    def __init__(self):
+    RISK_TYPES = ('heart', 'diabetes', 'respiratory')
+    
+    # Rule tables shared by the single-patient and batch paths. Conditions
+    # use & and | so the same lambda works on one vitals dict or on arrays
+    # of many patients; messages are str.format templates over the vitals.
+    
+    # Life-threatening vitals (determine_emergency_status), in report order
+    CRITICAL_CONDITIONS = [
+        (lambda v: v['spo2'] < 90, "Critical oxygen level"),
+        (lambda v: v['bp_systolic'] > 180, "Hypertensive crisis"),
+        (lambda v: v['bp_systolic'] < 90, "Hypotension"),
+        (lambda v: v['heart_rate'] > 120, "Tachycardia"),
+        (lambda v: v['heart_rate'] < 50, "Bradycardia"),
+        (lambda v: v['blood_sugar'] > 300, "Severe hyperglycemia"),
+        (lambda v: v['blood_sugar'] < 50, "Severe hypoglycemia")
+    ]
+    
+    # Status bands, most severe first: (status, level, immediate_action, message)
+    EMERGENCY_STATUSES = [
+        ("CRITICAL", "emergency", True, "Immediate medical attention required!"),
+        ("HIGH", "urgent", True, "Urgent medical consultation recommended"),
+        ("MODERATE", "warning", False, "Schedule medical checkup soon"),
+        ("LOW", "normal", False, "Continue regular health monitoring")
+    ]
+    
+    # Explanation factors per model, and the text used when none apply
+    EXPLANATION_FACTORS = {
+        'heart': [
+            (lambda v: (v['bp_systolic'] > 140) | (v['bp_diastolic'] > 90),
+             "Elevated blood pressure ({bp_systolic}/{bp_diastolic} mmHg)"),
+            (lambda v: v['heart_rate'] > 100, "Elevated heart rate ({heart_rate} bpm)"),
+            (lambda v: v['heart_rate'] < 60, "Low heart rate ({heart_rate} bpm)"),
+            (lambda v: v['age'] > 60, "Age factor ({age} years)"),
+            (lambda v: v['spo2'] < 95, "Low oxygen saturation ({spo2}%)")
+        ],
+        'diabetes': [
+            (lambda v: v['blood_sugar'] > 140, "Elevated blood sugar ({blood_sugar} mg/dL)"),
+            (lambda v: v['blood_sugar'] > 180, "Significantly high blood sugar"),
+            (lambda v: v['age'] > 50, "Age-related risk ({age} years)"),
+            (lambda v: v['bp_systolic'] > 140, "Hypertension present")
+        ],
+        'respiratory': [
+            (lambda v: v['spo2'] < 95, "Low oxygen saturation ({spo2}%)"),
+            (lambda v: v['spo2'] < 92, "Critically low oxygen level"),
+            (lambda v: v['heart_rate'] > 100, "Compensatory tachycardia ({heart_rate} bpm)"),
+            (lambda v: v['age'] > 65, "Age-related respiratory risk ({age} years)")
+        ]
+    }
+    NORMAL_EXPLANATIONS = {
+        'heart': "All cardiac indicators within normal range",
+        'diabetes': "Blood sugar levels within normal range",
+        'respiratory': "Respiratory function within normal range"
+    }
+    
+    # Recommendations when a model predicts high risk:
+    # (risk_type, condition, [(priority, action, reason template), ...])
+    MODEL_RECOMMENDATIONS = [
+        ('heart', lambda v: v['bp_systolic'] > 140, [
+            ('HIGH', 'Monitor blood pressure regularly', 'Elevated blood pressure detected')
+        ]),
+        ('heart', lambda v: v['heart_rate'] > 100, [
+            ('MEDIUM', 'Reduce stress and avoid stimulants', 'Elevated heart rate')
+        ]),
+        ('diabetes', lambda v: v['blood_sugar'] > 140, [
+            ('HIGH', 'Consult endocrinologist for blood sugar management', 'Blood sugar at {blood_sugar} mg/dL'),
+            ('MEDIUM', 'Follow diabetic diet plan', 'Help regulate blood sugar levels')
+        ]),
+        ('respiratory', lambda v: v['spo2'] < 95, [
+            ('HIGH', 'Consult pulmonologist', 'Low oxygen saturation ({spo2}%)'),
+            ('MEDIUM', 'Avoid strenuous activities', 'Maintain adequate oxygen levels')
+        ])
+    ]
+    
+    # Largest holdout accuracy drop (per risk) allowed for the fused model to serve
+    FUSED_TOLERANCE = 0.005
+    
+    # Artifact name in the model registry (models + scaler dict)
+    REGISTRY_NAME = 'advanced_risk'
+    
+    # Without a registry: pickled models, and their memory-mappable export
+    MODEL_PATH = 'advanced_health_models.pkl'
+    ARTIFACT_PATH = 'advanced_health_models'
+    
+    def __init__(self, inference_client=None, fused=False, registry=None):
         self.models = {
             'heart': None,
             'diabetes': None,
             'respiratory': None
         }
-        self.scaler = StandardScaler()
+        self.scaler = None
         self.feature_names = ['age', 'bp_systolic', 'bp_diastolic', 
                              'blood_sugar', 'heart_rate', 'spo2']
         self.is_trained = False
+        self.trained_at = None
+        self.engines = {}  # risk_type -> compiled flat-array model
+        self.joint_engine = None  # All engines walked in one pass
+        self.importances = None  # risk_type -> feature importance array
+        self._feature_importance = None
+        
+        # Optional fused mode: one multi-output forest for all three risks
+        self.fused = fused
+        self.fused_model = None
+        self.fused_accuracy = None
+        self.fused_engine = None
+        
+        # Optional ModelRegistry: load the active version instead of the model file
+        self.registry = registry
+        self.version = None
+        
+        # Sidecar mode: models live in inference_server.py, not in this process
+        # (sklearn is only imported when training, so clients never load it)
+        self.inference_client = inference_client
+        if inference_client is not None:
+            self.is_trained = True
+            return
         
         # Load or train models
         self.load_or_train_models()
+        self.compile_models()
     
     def load_or_train_models(self):
-        """Load existing models or train new ones"""
-        model_path = 'advanced_health_models.pkl'
+        """
+        Load the registry's active version, else the model file, else train new ones
+        
+        Memory-mapped array exports are preferred; the fused model is only
+        kept in the pickle, so fused mode always unpickles.
+        """
+        model_path = self.MODEL_PATH
         
+        if self.registry is not None and self.registry.active_version(self.REGISTRY_NAME) is not None:
+            if not self.fused and self.registry.has_arrays(self.REGISTRY_NAME):
+                self.version, path = self.registry.load_arrays(self.REGISTRY_NAME)
+                version = self.version
+                self._restore_arrays(path, lambda: self.registry.load(self.REGISTRY_NAME, version)[1])
+            else:
+                self.version, saved_data = self.registry.load(self.REGISTRY_NAME)
+                self._restore(saved_data)
+            print(f"✅ Loaded {self.REGISTRY_NAME} v{self.version} from the model registry")
+        elif self.registry is None and not self.fused and artifact_is_current(self.ARTIFACT_PATH, model_path):
+            self._restore_arrays(self.ARTIFACT_PATH, lambda: joblib.load(model_path))
+            print("✅ Loaded memory-mapped advanced models")
+        else:
+            self._load_or_train_file(model_path)
+            if self.registry is not None:
+                # Empty registry: the models in use become its first version
+                self.version = self.registry.publish(self.REGISTRY_NAME, self._artifact(),
+                                                     metadata={'source': model_path}, export=self.export_arrays)
+            elif not artifact_is_current(self.ARTIFACT_PATH, model_path):
+                try:
+                    self.export_arrays(self.ARTIFACT_PATH)
+                except Exception as export_error:
+                    print(f"⚠️ Could not export model arrays: {export_error}")
+        
+        if self.fused and self.fused_model is None:
+            self.train_fused_model()
+            if self.registry is not None:
+                self.version = self.registry.publish(self.REGISTRY_NAME, self._artifact(),
+                                                     metadata={'source': 'fused model added'},
+                                                     export=self.export_arrays)
+            else:
+                try:
+                    self.save_models(model_path)
+                except Exception as save_error:
+                    print(f"⚠️ Could not save models: {save_error}")
+    
+    def _restore(self, saved_data):
+        """Take models and scaler from a saved artifact dict"""
+        self.models = saved_data['models']
+        self.scaler = saved_data['scaler']
+        self.fused_model = saved_data.get('fused_model')
+        self.fused_accuracy = saved_data.get('fused_accuracy')
+        self.trained_at = saved_data.get('trained_at')
+        self.is_trained = True
+    
+    def _restore_arrays(self, path, load_saved):
+        """
+        Take engines, scaler and importances from a memory-mapped export
+        
+        The sklearn models stay unloaded; load_saved (returning the pickled
+        dict) is called once if a large batch or load_sklearn_models() needs them.
+        """
+        artifact = load_artifact(path, model_loaders=self._model_loaders(load_saved))
+        self.models = dict.fromkeys(self.RISK_TYPES)
+        self.engines = {risk_type: artifact.engines[risk_type] for risk_type in self.RISK_TYPES}
+        self.scaler = artifact.scaler
+        self.importances = artifact.feature_importances
+        self.trained_at = artifact.trained_at
+        self.fused_model = None
+        self.fused_accuracy = None
+        self.is_trained = True
+    
+    @staticmethod
+    def _model_loaders(load_saved):
+        """Per-risk sklearn model loaders sharing one call to load_saved"""
+        saved = []
+        lock = threading.Lock()
+        
+        def loader_for(risk_type):
+            def loader():
+                with lock:
+                    if not saved:
+                        saved.append(load_saved())
+                return saved[0]['models'][risk_type]
+            return loader
+        
+        return {risk_type: loader_for(risk_type) for risk_type in AdvancedHealthRiskPredictor.RISK_TYPES}
+    
+    def export_arrays(self, path):
+        """Write the separate models, scaler and importances as a memory-mappable artifact"""
+        export_artifact(path, {risk_type: self.models[risk_type] for risk_type in self.RISK_TYPES},
+                        self.feature_names, scaler=self.scaler, trained_at=self.trained_at)
+    
+    def load_sklearn_models(self):
+        """risk_type -> fitted sklearn model (unpickled on first call if serving arrays)"""
+        return {
+            risk_type: self.engines[risk_type].sklearn_model() if risk_type in self.engines
+            else self.models[risk_type]
+            for risk_type in self.RISK_TYPES
+        }
+    
+    def _load_or_train_file(self, model_path):
         try:
             if os.path.exists(model_path):
-                saved_data = joblib.load(model_path)
-                self.models = saved_data['models']
-                self.scaler = saved_data['scaler']
-                self.is_trained = True
+                self._restore(joblib.load(model_path))
                 print("✅ Loaded existing advanced models")
             else:
                 print("📚 Training new advanced models...")
@@ -76,7 +276,7 @@ class AdvancedHealthRiskPredictor:
             except Exception as save_error:
                 print(f"⚠️ Could not save models: {save_error}")
     
-    def generate_synthetic_training_data(self, n_samples=1000):
+    def generate_synthetic_training_data(self, n_samples=1000, seed=42):
         """
         Generate realistic synthetic training data for healthcare scenarios
         
@@ -86,7 +286,7 @@ class AdvancedHealthRiskPredictor:
             y_diabetes: Diabetes labels
             y_respiratory: Respiratory labels
         """
-        np.random.seed(42)
+        np.random.seed(seed)
         
         # Generate base features with realistic distributions
         age = np.random.normal(50, 15, n_samples).clip(18, 90)
@@ -142,11 +342,16 @@ class AdvancedHealthRiskPredictor:
     
     def train_models(self):
         """Train all three risk prediction models"""
+        from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
+        from sklearn.preprocessing import StandardScaler
+        
         # Generate training data
         X, y_heart, y_diabetes, y_respiratory = self.generate_synthetic_training_data(1000)
         
         # Normalize features
+        self.scaler = StandardScaler()
         X_scaled = self.scaler.fit_transform(X)
+        self.trained_at = datetime.now().isoformat()
         
         # Train Heart Disease Model
         self.models['heart'] = GradientBoostingClassifier(
@@ -175,6 +380,8 @@ class AdvancedHealthRiskPredictor:
         )
         self.models['respiratory'].fit(X_scaled, y_respiratory)
         
+        self.fused_model = None  # Trained against the old scaler
+        self.fused_accuracy = None
         self.is_trained = True
         
         # Print training summary
@@ -188,15 +395,103 @@ class AdvancedHealthRiskPredictor:
         print(f"Respiratory Model: Gradient Boosting")
         print("="*70 + "\n")
     
-    def save_models(self, path):
-        """Save trained models and scaler"""
-        save_data = {
+    def train_fused_model(self):
+        """Train one multi-output forest predicting all three risks (fused mode)"""
+        from sklearn.ensemble import RandomForestClassifier
+        
+        X, y_heart, y_diabetes, y_respiratory = self.generate_synthetic_training_data(1000)
+        self.fused_model = RandomForestClassifier(
+            n_estimators=100,
+            max_depth=10,
+            min_samples_split=5,
+            random_state=42
+        )
+        self.fused_model.fit(self.scaler.transform(X),
+                             np.column_stack([y_heart, y_diabetes, y_respiratory]))
+        self.fused_accuracy = self.evaluate_fused_model()
+        
+        for risk_type, accuracy in self.fused_accuracy.items():
+            print(f"Fused {risk_type}: {accuracy['fused']:.2%} vs {accuracy['separate']:.2%} separate")
+    
+    def evaluate_fused_model(self, n_samples=20000, seed=7):
+        """Holdout accuracy of the fused model and the separate models, per risk"""
+        X, y_heart, y_diabetes, y_respiratory = self.generate_synthetic_training_data(n_samples, seed)
+        X_scaled = self.scaler.transform(X)
+        fused_predictions = self.fused_model.predict(X_scaled)
+        
+        accuracy = {}
+        for i, (risk_type, y) in enumerate(zip(self.RISK_TYPES, (y_heart, y_diabetes, y_respiratory))):
+            accuracy[risk_type] = {
+                'separate': float(np.mean(self.models[risk_type].predict(X_scaled) == y)),
+                'fused': float(np.mean(fused_predictions[:, i] == y))
+            }
+        return accuracy
+    
+    def fused_within_tolerance(self):
+        """True if the fused model loses at most FUSED_TOLERANCE accuracy on every risk"""
+        if self.fused_accuracy is None:
+            return False
+        return all(accuracy['separate'] - accuracy['fused'] <= self.FUSED_TOLERANCE
+                   for accuracy in self.fused_accuracy.values())
+    
+    def compile_models(self):
+        """Compile each model for fast inference (sklearn is used if one can't be)"""
+        self.fused_engine = None
+        self._feature_importance = None  # Recomputed from the new models on first use
+        if all(model is not None for model in self.models.values()):
+            # Otherwise the engines came precompiled from an array export
+            self.engines = {}
+            self.importances = None
+            for risk_type, model in self.models.items():
+                engine = compile_model(model)
+                if engine is not None:
+                    self.engines[risk_type] = engine
+        
+        # Exact: same probabilities as the separate engines, one tree walk
+        self.joint_engine = compile_joint(self.engines) if len(self.engines) == len(self.models) else None
+        
+        if self.fused and self.fused_model is not None:
+            if self.fused_within_tolerance():
+                self.fused_engine = compile_model(self.fused_model)
+            else:
+                print("⚠️ Fused model outside accuracy tolerance; serving the separate models")
+    
+    def predict_proba_all(self, X_scaled):
+        """
+        Class probabilities of every risk model for scaled rows
+        
+        Returns:
+            dict risk_type -> (n, 2) array, from the fused model if it serves,
+            else one joint walk of the compiled models
+        """
+        if self.fused_engine is not None:
+            return dict(zip(self.RISK_TYPES, self.fused_engine.predict_proba(X_scaled)))
+        if self.joint_engine is not None:
+            return self.joint_engine.predict_proba(X_scaled)
+        return {
+            risk_type: (self.engines.get(risk_type) or self.models[risk_type]).predict_proba(X_scaled)
+            for risk_type in self.RISK_TYPES
+        }
+    
+    def classes(self, risk_type):
+        """Class labels of a risk model"""
+        engine = self.engines.get(risk_type)
+        return engine.classes_ if engine is not None else self.models[risk_type].classes_
+    
+    def _artifact(self):
+        """Trained models and scaler as one saveable dict"""
+        return {
             'models': self.models,
             'scaler': self.scaler,
+            'fused_model': self.fused_model,
+            'fused_accuracy': self.fused_accuracy,
             'feature_names': self.feature_names,
-            'trained_at': datetime.now().isoformat()
+            'trained_at': self.trained_at or datetime.now().isoformat()
         }
-        joblib.dump(save_data, path)
+    
+    def save_models(self, path):
+        """Save trained models and scaler"""
+        joblib.dump(self._artifact(), path)
     
     def normalize_vitals(self, vitals):
         """Normalize input vitals"""
@@ -208,7 +503,8 @@ class AdvancedHealthRiskPredictor:
             vitals['heart_rate'],
             vitals['spo2']
         ]])
-        return self.scaler.transform(X)
+        # Same arithmetic as scaler.transform() without its input validation
+        return (X - self.scaler.mean_) / self.scaler.scale_
 
     
     def predict_all_risks(self, vitals):
@@ -225,16 +521,25 @@ class AdvancedHealthRiskPredictor:
         if not self.is_trained:
             raise Exception("Models not trained yet!")
         
-        # Normalize input
-        X_scaled = self.normalize_vitals(vitals)
-        
         # Get predictions and probabilities for each model
         predictions = {}
         probabilities = {}
         
-        for risk_type, model in self.models.items():
-            pred = model.predict(X_scaled)[0]
-            prob = model.predict_proba(X_scaled)[0]
+        if self.inference_client is not None:
+            # Sidecar scales and scores the raw vitals
+            X = np.array([[vitals[name] for name in self.feature_names]], dtype=float)
+            remote = self.inference_client.predict_all_proba(X)
+        else:
+            # Normalize input
+            local = self.predict_proba_all(self.normalize_vitals(vitals))
+        
+        for risk_type in self.RISK_TYPES:
+            if self.inference_client is not None:
+                prob = remote[risk_type][0]
+                pred = int(np.argmax(prob))  # Binary models: classes are [0, 1]
+            else:
+                prob = local[risk_type][0]
+                pred = self.classes(risk_type)[np.argmax(prob)]
             
             predictions[risk_type] = pred
             probabilities[risk_type] = {
@@ -271,6 +576,85 @@ class AdvancedHealthRiskPredictor:
             )
         }
     
+    def predict_all_risks_batch(self, X):
+        """
+        Vectorized predict_all_risks over many patients
+        
+        Args:
+            X: DataFrame with feature_names columns, or array of shape (n, 6)
+               in feature_names order
+        
+        Returns:
+            RiskBatch: probabilities, emergency probability, status bands,
+            critical-condition and explanation factor masks as arrays;
+            batch[i] is the dict predict_all_risks gives for row i
+        """
+        if not self.is_trained:
+            raise Exception("Models not trained yet!")
+        
+        if hasattr(X, 'columns'):
+            vitals = {name: X[name].to_numpy() for name in self.feature_names}
+        else:
+            X = np.asarray(X)
+            vitals = {name: X[:, i] for i, name in enumerate(self.feature_names)}
+        features = np.column_stack([vitals[name] for name in self.feature_names]).astype(float)
+        
+        # (n, model, [low, high]) probabilities
+        if self.inference_client is not None:
+            # Sidecar frames are capped, so send large batches in pieces
+            from inference_server import MAX_ROWS
+            parts = [self.inference_client.predict_all_proba(features[start:start + MAX_ROWS])
+                     for start in range(0, len(features), MAX_ROWS)]
+            proba = np.stack([np.concatenate([part[risk_type] for part in parts])
+                              for risk_type in self.RISK_TYPES], axis=1)
+            predictions = np.argmax(proba, axis=2)  # Binary models: classes are [0, 1]
+        else:
+            X_scaled = (features - self.scaler.mean_) / self.scaler.scale_
+            local = self.predict_proba_all(X_scaled)
+            proba = np.stack([local[risk_type] for risk_type in self.RISK_TYPES], axis=1)
+            predictions = np.column_stack([
+                self.classes(risk_type).take(np.argmax(local[risk_type], axis=1))
+                for risk_type in self.RISK_TYPES
+            ])
+        
+        high = proba[:, :, 1]
+        emergency_prob = self._emergency_probability_batch(high, vitals)
+        
+        critical = np.column_stack([condition(vitals) for condition, _ in self.CRITICAL_CONDITIONS])
+        status_band = np.select(
+            [critical.any(axis=1) | (emergency_prob > 0.8), emergency_prob > 0.6, emergency_prob > 0.4],
+            [0, 1, 2], default=3
+        )
+        factors = {
+            risk_type: np.column_stack([condition(vitals) for condition, _ in self.EXPLANATION_FACTORS[risk_type]])
+            for risk_type in self.RISK_TYPES
+        }
+        recommendation_rules = np.column_stack([
+            (predictions[:, self.RISK_TYPES.index(risk_type)] == 1) & condition(vitals)
+            for risk_type, condition, _ in self.MODEL_RECOMMENDATIONS
+        ])
+        
+        return RiskBatch(
+            self, vitals, proba, predictions, emergency_prob, critical,
+            status_band, factors, recommendation_rules
+        )
+    
+    @staticmethod
+    def _emergency_probability_batch(high, vitals):
+        """calculate_emergency_probability over arrays (same operation order)"""
+        base_prob = high[:, 0] * 0.40 + high[:, 1] * 0.30 + high[:, 2] * 0.30
+        
+        spo2 = vitals['spo2']
+        critical_multiplier = np.where(spo2 < 90, 1.5, np.where(spo2 < 92, 1.3, 1.0))
+        critical_multiplier = critical_multiplier * np.where(
+            (vitals['bp_systolic'] > 180) | (vitals['bp_systolic'] < 90), 1.4, 1.0)
+        critical_multiplier = critical_multiplier * np.where(
+            (vitals['heart_rate'] > 120) | (vitals['heart_rate'] < 50), 1.3, 1.0)
+        critical_multiplier = critical_multiplier * np.where(
+            (vitals['blood_sugar'] > 300) | (vitals['blood_sugar'] < 50), 1.3, 1.0)
+        
+        return np.minimum(base_prob * critical_multiplier, 1.0)
+    
     def calculate_emergency_probability(self, probabilities, vitals):
         """
         Calculate overall emergency probability
@@ -327,45 +711,21 @@ class AdvancedHealthRiskPredictor:
             dict with status, level, and immediate_action flag
         """
         # Critical thresholds that trigger immediate emergency
-        critical_conditions = []
-        
-        if vitals['spo2'] < 90:
-            critical_conditions.append("Critical oxygen level")
-        if vitals['bp_systolic'] > 180:
-            critical_conditions.append("Hypertensive crisis")
-        if vitals['bp_systolic'] < 90:
-            critical_conditions.append("Hypotension")
-        if vitals['heart_rate'] > 120:
-            critical_conditions.append("Tachycardia")
-        if vitals['heart_rate'] < 50:
-            critical_conditions.append("Bradycardia")
-        if vitals['blood_sugar'] > 300:
-            critical_conditions.append("Severe hyperglycemia")
-        if vitals['blood_sugar'] < 50:
-            critical_conditions.append("Severe hypoglycemia")
+        critical_conditions = [name for condition, name in self.CRITICAL_CONDITIONS if condition(vitals)]
         
         # Determine status
         if critical_conditions or emergency_prob > 0.8:
-            status = "CRITICAL"
-            level = "emergency"
-            immediate_action = True
-            message = "Immediate medical attention required!"
+            band = 0
         elif emergency_prob > 0.6:
-            status = "HIGH"
-            level = "urgent"
-            immediate_action = True
-            message = "Urgent medical consultation recommended"
+            band = 1
         elif emergency_prob > 0.4:
-            status = "MODERATE"
-            level = "warning"
-            immediate_action = False
-            message = "Schedule medical checkup soon"
+            band = 2
         else:
-            status = "LOW"
-            level = "normal"
-            immediate_action = False
-            message = "Continue regular health monitoring"
-        
+            band = 3
+        return self._emergency_status(band, critical_conditions)
+    
+    def _emergency_status(self, band, critical_conditions):
+        status, level, immediate_action, message = self.EMERGENCY_STATUSES[band]
         return {
             'status': status,
             'level': level,
@@ -374,6 +734,15 @@ class AdvancedHealthRiskPredictor:
             'critical_conditions': critical_conditions
         }
     
+    @staticmethod
+    def _risk_band(probability):
+        """HIGH / MODERATE / LOW band of one model's high-risk probability"""
+        if probability > 0.7:
+            return "HIGH"
+        elif probability > 0.4:
+            return "MODERATE"
+        return "LOW"
+    
     def generate_explanations(self, vitals, probabilities):
         """
         Generate human-readable explanations for each risk prediction
@@ -381,102 +750,54 @@ class AdvancedHealthRiskPredictor:
         Uses feature importance and threshold analysis
         """
         explanations = {}
-        
-        # Heart Disease Explanation
-        heart_factors = []
-        if vitals['bp_systolic'] > 140 or vitals['bp_diastolic'] > 90:
-            heart_factors.append(f"Elevated blood pressure ({vitals['bp_systolic']}/{vitals['bp_diastolic']} mmHg)")
-        if vitals['heart_rate'] > 100:
-            heart_factors.append(f"Elevated heart rate ({vitals['heart_rate']} bpm)")
-        if vitals['heart_rate'] < 60:
-            heart_factors.append(f"Low heart rate ({vitals['heart_rate']} bpm)")
-        if vitals['age'] > 60:
-            heart_factors.append(f"Age factor ({vitals['age']} years)")
-        if vitals['spo2'] < 95:
-            heart_factors.append(f"Low oxygen saturation ({vitals['spo2']}%)")
-        
-        heart_prob = probabilities['heart']['high_risk']
-        if heart_prob > 0.7:
-            heart_risk = "HIGH"
-        elif heart_prob > 0.4:
-            heart_risk = "MODERATE"
-        else:
-            heart_risk = "LOW"
-        
-        explanations['heart'] = {
-            'risk_level': heart_risk,
-            'probability': heart_prob,
-            'factors': heart_factors if heart_factors else ["All cardiac indicators within normal range"],
-            'summary': f"{heart_risk} risk ({heart_prob*100:.1f}% probability)"
-        }
-        
-        # Diabetes Explanation
-        diabetes_factors = []
-        if vitals['blood_sugar'] > 140:
-            diabetes_factors.append(f"Elevated blood sugar ({vitals['blood_sugar']} mg/dL)")
-        if vitals['blood_sugar'] > 180:
-            diabetes_factors.append(f"Significantly high blood sugar")
-        if vitals['age'] > 50:
-            diabetes_factors.append(f"Age-related risk ({vitals['age']} years)")
-        if vitals['bp_systolic'] > 140:
-            diabetes_factors.append(f"Hypertension present")
-        
-        diabetes_prob = probabilities['diabetes']['high_risk']
-        if diabetes_prob > 0.7:
-            diabetes_risk = "HIGH"
-        elif diabetes_prob > 0.4:
-            diabetes_risk = "MODERATE"
-        else:
-            diabetes_risk = "LOW"
-        
-        explanations['diabetes'] = {
-            'risk_level': diabetes_risk,
-            'probability': diabetes_prob,
-            'factors': diabetes_factors if diabetes_factors else ["Blood sugar levels within normal range"],
-            'summary': f"{diabetes_risk} risk ({diabetes_prob*100:.1f}% probability)"
-        }
-        
-        # Respiratory Explanation
-        respiratory_factors = []
-        if vitals['spo2'] < 95:
-            respiratory_factors.append(f"Low oxygen saturation ({vitals['spo2']}%)")
-        if vitals['spo2'] < 92:
-            respiratory_factors.append(f"Critically low oxygen level")
-        if vitals['heart_rate'] > 100:
-            respiratory_factors.append(f"Compensatory tachycardia ({vitals['heart_rate']} bpm)")
-        if vitals['age'] > 65:
-            respiratory_factors.append(f"Age-related respiratory risk ({vitals['age']} years)")
-        
-        respiratory_prob = probabilities['respiratory']['high_risk']
-        if respiratory_prob > 0.7:
-            respiratory_risk = "HIGH"
-        elif respiratory_prob > 0.4:
-            respiratory_risk = "MODERATE"
-        else:
-            respiratory_risk = "LOW"
-        
-        explanations['respiratory'] = {
-            'risk_level': respiratory_risk,
-            'probability': respiratory_prob,
-            'factors': respiratory_factors if respiratory_factors else ["Respiratory function within normal range"],
-            'summary': f"{respiratory_risk} risk ({respiratory_prob*100:.1f}% probability)"
-        }
-        
+        for risk_type in self.RISK_TYPES:
+            factors = [message.format(**vitals)
+                       for condition, message in self.EXPLANATION_FACTORS[risk_type] if condition(vitals)]
+            explanations[risk_type] = self._explanation(
+                risk_type, probabilities[risk_type]['high_risk'], factors
+            )
         return explanations
     
+    def _explanation(self, risk_type, probability, factors):
+        risk_level = self._risk_band(probability)
+        return {
+            'risk_level': risk_level,
+            'probability': probability,
+            'factors': factors if factors else [self.NORMAL_EXPLANATIONS[risk_type]],
+            'summary': f"{risk_level} risk ({probability*100:.1f}% probability)"
+        }
+    
     def get_feature_importance(self):
         """Get feature importance from models"""
         importance = {}
         
-        for risk_type, model in self.models.items():
-            if hasattr(model, 'feature_importances_'):
-                feature_imp = model.feature_importances_
+        if self.inference_client is not None:
+            return {
+                risk_type: {name: float(imp) for name, imp in zip(self.feature_names, feature_imp)}
+                for risk_type, feature_imp in self.inference_client.feature_importances().items()
+            }
+        
+        if self._feature_importance is None:
+            for risk_type, feature_imp in self.feature_importance_arrays().items():
                 importance[risk_type] = {
                     name: float(imp) 
                     for name, imp in zip(self.feature_names, feature_imp)
                 }
+            self._feature_importance = importance
         
-        return importance
+        # Copies, so callers can't modify the cached values
+        return {risk_type: dict(imp) for risk_type, imp in self._feature_importance.items()}
+    
+    def feature_importance_arrays(self):
+        """risk_type -> feature importance array (precomputed in array exports)"""
+        # feature_importances_ walks every tree on each access, so compute once per model set
+        if self.importances is None:
+            self.importances = {
+                risk_type: model.feature_importances_
+                for risk_type, model in self.models.items()
+                if hasattr(model, 'feature_importances_')
+            }
+        return self.importances
     
     def generate_risk_summary(self, probabilities):
         """Generate overall risk summary"""
@@ -507,6 +828,12 @@ class AdvancedHealthRiskPredictor:
     
     def generate_recommendations(self, predictions, vitals, emergency_status):
         """Generate personalized health recommendations"""
+        fired = [predictions[risk_type] == 1 and bool(condition(vitals))
+                 for risk_type, condition, _ in self.MODEL_RECOMMENDATIONS]
+        return self._recommendations(emergency_status, fired, vitals)
+    
+    def _recommendations(self, emergency_status, fired_rules, vitals):
+        """Recommendation list from the emergency status and fired MODEL_RECOMMENDATIONS rules"""
         recommendations = []
         
         # Emergency recommendations
@@ -517,56 +844,22 @@ class AdvancedHealthRiskPredictor:
                 'reason': emergency_status['message']
             })
             
-            if emergency_status['critical_conditions']:
-                for condition in emergency_status['critical_conditions']:
-                    recommendations.append({
-                        'priority': 'CRITICAL',
-                        'action': f'Address {condition}',
-                        'reason': 'Life-threatening condition detected'
-                    })
-        
-        # Heart disease recommendations
-        if predictions['heart'] == 1:
-            if vitals['bp_systolic'] > 140:
-                recommendations.append({
-                    'priority': 'HIGH',
-                    'action': 'Monitor blood pressure regularly',
-                    'reason': 'Elevated blood pressure detected'
-                })
-            if vitals['heart_rate'] > 100:
+            for condition in emergency_status['critical_conditions']:
                 recommendations.append({
-                    'priority': 'MEDIUM',
-                    'action': 'Reduce stress and avoid stimulants',
-                    'reason': 'Elevated heart rate'
+                    'priority': 'CRITICAL',
+                    'action': f'Address {condition}',
+                    'reason': 'Life-threatening condition detected'
                 })
         
-        # Diabetes recommendations
-        if predictions['diabetes'] == 1:
-            if vitals['blood_sugar'] > 140:
-                recommendations.append({
-                    'priority': 'HIGH',
-                    'action': 'Consult endocrinologist for blood sugar management',
-                    'reason': f'Blood sugar at {vitals["blood_sugar"]} mg/dL'
-                })
-                recommendations.append({
-                    'priority': 'MEDIUM',
-                    'action': 'Follow diabetic diet plan',
-                    'reason': 'Help regulate blood sugar levels'
-                })
-        
-        # Respiratory recommendations
-        if predictions['respiratory'] == 1:
-            if vitals['spo2'] < 95:
-                recommendations.append({
-                    'priority': 'HIGH',
-                    'action': 'Consult pulmonologist',
-                    'reason': f'Low oxygen saturation ({vitals["spo2"]}%)'
-                })
-                recommendations.append({
-                    'priority': 'MEDIUM',
-                    'action': 'Avoid strenuous activities',
-                    'reason': 'Maintain adequate oxygen levels'
-                })
+        # Heart disease, diabetes and respiratory recommendations
+        for (_, _, rule_recommendations), fired in zip(self.MODEL_RECOMMENDATIONS, fired_rules):
+            if fired:
+                for priority, action, reason in rule_recommendations:
+                    recommendations.append({
+                        'priority': priority,
+                        'action': action,
+                        'reason': reason.format(**vitals)
+                    })
         
         # General recommendations
         if vitals['age'] > 60:
@@ -592,6 +885,81 @@ class AdvancedHealthRiskPredictor:
         return recommendations
 
 
+class RiskBatch:
+    """
+    Result of AdvancedHealthRiskPredictor.predict_all_risks_batch
+    
+    Array attributes (n = patients, models in RISK_TYPES order):
+    - probabilities (n, 3, 2), predictions (n, 3), emergency_probability (n,)
+    - status_band (n,): index into EMERGENCY_STATUSES (0 = CRITICAL)
+    - critical (n, 7): CRITICAL_CONDITIONS masks
+    - factors: risk_type -> (n, k) EXPLANATION_FACTORS masks
+    - recommendation_rules (n, 4): MODEL_RECOMMENDATIONS masks
+    
+    batch[i] builds the full predict_all_risks dict for one patient, so
+    callers only pay for text and dicts on the rows they return.
+    """
+    
+    def __init__(self, predictor, vitals, probabilities, predictions, emergency_probability,
+                 critical, status_band, factors, recommendation_rules):
+        self.predictor = predictor
+        self.columns = vitals
+        self.probabilities = probabilities
+        self.predictions = predictions
+        self.emergency_probability = emergency_probability
+        self.critical = critical
+        self.status_band = status_band
+        self.factors = factors
+        self.recommendation_rules = recommendation_rules
+    
+    def __len__(self):
+        return len(self.emergency_probability)
+    
+    def vitals(self, i):
+        """Row i as a vitals dict (Python numbers, like a request payload)"""
+        return {name: column[i].item() for name, column in self.columns.items()}
+    
+    def __getitem__(self, i):
+        predictor = self.predictor
+        vitals = self.vitals(i)
+        
+        predictions, probabilities = {}, {}
+        for m, risk_type in enumerate(predictor.RISK_TYPES):
+            predictions[risk_type] = self.predictions[i, m]
+            probabilities[risk_type] = {
+                'low_risk': float(self.probabilities[i, m, 0]),
+                'high_risk': float(self.probabilities[i, m, 1])
+            }
+        
+        critical_conditions = [name for (_, name), hit in zip(predictor.CRITICAL_CONDITIONS, self.critical[i]) if hit]
+        emergency_status = predictor._emergency_status(int(self.status_band[i]), critical_conditions)
+        
+        explanations = {}
+        for risk_type in predictor.RISK_TYPES:
+            factors = [message.format(**vitals) for (_, message), hit
+                       in zip(predictor.EXPLANATION_FACTORS[risk_type], self.factors[risk_type][i]) if hit]
+            explanations[risk_type] = predictor._explanation(
+                risk_type, probabilities[risk_type]['high_risk'], factors
+            )
+        
+        return {
+            'predictions': predictions,
+            'probabilities': probabilities,
+            'emergency_probability': float(self.emergency_probability[i]),
+            'emergency_status': emergency_status,
+            'explanations': explanations,
+            'feature_importance': predictor.get_feature_importance(),
+            'risk_summary': predictor.generate_risk_summary(probabilities),
+            'recommendations': predictor._recommendations(
+                emergency_status, self.recommendation_rules[i], vitals
+            )
+        }
+    
+    def to_list(self):
+        """Every row as predict_all_risks dicts"""
+        return [self[i] for i in range(len(self))]
+
+
 class EmergencyDecisionEngine:
     """
     Advanced Emergency Decision Engine
@@ -4,20 +4,182 @@ Simple aur explainable model for hackathon
 """
 
 import numpy as np
-from sklearn.ensemble import RandomForestClassifier
-import joblib
 import os
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from model_artifact import artifact_is_current, export_artifact, load_artifact
+from model_registry import RegistryError, ShadowScorer
+from risk_table import RiskTable
+from tree_inference import compile_model
+
+# Model input order (one column per vital)
+FEATURES = ['age', 'bp_systolic', 'bp_diastolic', 'blood_sugar', 'heart_rate', 'spo2']
 
 class HealthRiskPredictor:
     """Health risk prediction using AI"""
     
-    def __init__(self):
-        self.model = None
+    # Artifact name in the model registry
+    REGISTRY_NAME = 'health_risk'
+    
+    # Without a registry: pickled model, and its memory-mappable export
+    MODEL_PATH = 'health_risk_model.pkl'
+    ARTIFACT_PATH = 'health_risk_model'
+    
+    # Seconds to wait for a shared batch before predicting the row alone
+    BATCH_TIMEOUT = 1.0
+    
+    def __init__(self, inference_client=None, background=False, registry=None, risk_table_path=None):
+        started = time.perf_counter()
+        self.model = None  # sklearn model (None when serving a memory-mapped artifact)
+        self.engine = None  # Compiled flat-array copy of the model
+        self.batcher = None  # Optional InferenceBatcher shared by request threads
+        
+        # Optional ModelRegistry: versioned artifacts, hot reload, shadow scoring
+        self.registry = registry
+        self.version = None  # Registry version being served
+        self.shadow = None  # ShadowScorer for a candidate version
+        
+        # Optional precomputed RiskTable (risk_table.py), used while it matches the engine
+        self.risk_table_path = risk_table_path
+        self.risk_table = None
+        
+        # Readiness: until _ready is set, predictions use fallback_prediction
+        self._started = started
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._load_done = threading.Event()
+        self._loader = None
+        self._loader_pid = None
+        self.load_error = None
+        self.startup_ms = None
+        self.ready_ms = None
+        self.fallback_predictions = 0
+        
+        # Sidecar mode: the model lives in inference_server.py, not in this process
+        self.inference_client = inference_client
+        if inference_client is not None:
+            self._mark_ready()
+        elif background:
+            # Return immediately; load or train on a thread
+            self._ensure_loader()
+        else:
+            self._load()
+        self.startup_ms = (time.perf_counter() - started) * 1000
+    
+    def _load(self):
+        """Load (or train) and compile the model, then switch predictions to it"""
         self.load_or_train_model()
+        if self.engine is None:
+            self.engine = compile_model(self.model)
+        if self.risk_table_path:
+            self._load_risk_table()
+        self._mark_ready()
+    
+    def _load_risk_table(self):
+        try:
+            self.risk_table = RiskTable.load(self.risk_table_path)
+        except Exception as e:
+            print(f"⚠️ Risk table unavailable: {e}")
+            return
+        self._bind_risk_table(self.engine)
+    
+    def _bind_risk_table(self, engine):
+        """Point the risk table at engine; it stays unused if built for another model"""
+        if self.risk_table is not None and not self.risk_table.bind(engine):
+            print(f"⚠️ {self.risk_table_path} was built for a different model; predicting without it")
+    
+    def _mark_ready(self):
+        # Model and engine are complete before the Event flips, so a request
+        # sees either the fallback rules or the finished model
+        self.ready_ms = (time.perf_counter() - self._started) * 1000
+        self._ready.set()
+        self._load_done.set()
+    
+    def _load_in_background(self):
+        try:
+            self._load()
+            print(f"✅ Model ready after {self.ready_ms:.0f} ms")
+        except Exception as e:
+            self.load_error = str(e)
+            print(f"❌ Background model load failed: {e}. Serving rule-based predictions")
+        finally:
+            self._load_done.set()
+    
+    def _ensure_loader(self):
+        """Start the loader thread (again, in a forked worker process)"""
+        with self._lock:
+            if self._ready.is_set() or (self._loader is not None and self._loader_pid == os.getpid()):
+                return
+            self._loader_pid = os.getpid()
+            self._load_done.clear()
+            self._loader = threading.Thread(target=self._load_in_background, name='model-loader', daemon=True)
+            self._loader.start()
+    
+    def is_ready(self):
+        """True once the model serves predictions (False: fallback rules)"""
+        if self._ready.is_set():
+            return True
+        if self._loader is not None:
+            self._ensure_loader()  # The loader thread does not survive a fork
+        return False
+    
+    def wait_until_ready(self, timeout=None):
+        """Block until background loading finished; True if the model serves"""
+        if not self.is_ready():
+            self._load_done.wait(timeout)
+        return self._ready.is_set()
+    
+    def get_status(self):
+        """Serving mode and startup timings (ms)"""
+        ready = self.is_ready()
+        if self.inference_client is not None:
+            mode = 'sidecar'
+        else:
+            mode = 'model' if ready else 'rules'
+        return {
+            'ready': ready,
+            'mode': mode,
+            'loading': not ready and self._loader is not None and self._loader.is_alive(),
+            'startup_ms': round(self.startup_ms, 3) if self.startup_ms is not None else None,
+            'ready_ms': round(self.ready_ms, 3) if self.ready_ms is not None else None,
+            'fallback_predictions': self.fallback_predictions,
+            'error': self.load_error,
+            'version': self.version,
+            'shadow': self.shadow.get_metrics() if self.shadow is not None else None,
+            'risk_table': self._risk_table_status()
+        }
+    
+    def _risk_table_status(self):
+        table = self.risk_table
+        if table is None:
+            return None
+        return dict(table.get_metrics(), active=table.engine is not None and table.engine is self.engine)
+    
+    def _count_fallback(self, n=1):
+        with self._lock:
+            self.fallback_predictions += n
     
     def load_or_train_model(self):
-        """Load existing model or train new one"""
-        model_path = 'health_risk_model.pkl'
+        """
+        Load the registry's active version, else the model file, else train one
+        
+        Memory-mapped array exports are preferred (no unpickling, no sklearn
+        import); the pickle is exported to one after loading or training.
+        """
+        import joblib
+        
+        if self.registry is not None and self.registry.active_version(self.REGISTRY_NAME) is not None:
+            self.version, self.model, self.engine = self._open_version()
+            print(f"✅ Loaded {self.REGISTRY_NAME} v{self.version} from the model registry")
+            return
+        
+        model_path = self.MODEL_PATH
+        if self.registry is None and artifact_is_current(self.ARTIFACT_PATH, model_path):
+            self.engine = self._engine_from_artifact(self.ARTIFACT_PATH, lambda: joblib.load(model_path))
+            print("✅ Loaded memory-mapped model from", self.ARTIFACT_PATH)
+            return
         
         try:
             if os.path.exists(model_path):
@@ -35,9 +197,99 @@ class HealthRiskPredictor:
                 joblib.dump(self.model, model_path)
             except Exception as save_error:
                 print(f"⚠️ Could not save model: {save_error}")
+        
+        model = self.model
+        
+        def export(path):
+            export_artifact(path, {self.REGISTRY_NAME: model}, FEATURES)
+        
+        if self.registry is not None:
+            # Empty registry: the model in use becomes its first version
+            self.version = self.registry.publish(self.REGISTRY_NAME, model,
+                                                 metadata={'source': model_path}, export=export)
+            print(f"✅ Published {self.REGISTRY_NAME} v{self.version} to the model registry")
+        else:
+            try:
+                export(self.ARTIFACT_PATH)
+            except Exception as export_error:
+                print(f"⚠️ Could not export model arrays: {export_error}")
+    
+    def _engine_from_artifact(self, path, model_loader):
+        """CompiledForest over a memory-mapped export (sklearn fetched only for large batches)"""
+        artifact = load_artifact(path, model_loaders={self.REGISTRY_NAME: model_loader})
+        return artifact.engines[self.REGISTRY_NAME]
+    
+    def _open_version(self, version=None):
+        """(version, sklearn model or None, engine) for a registry version, arrays preferred"""
+        if self.registry.has_arrays(self.REGISTRY_NAME, version):
+            version, path = self.registry.load_arrays(self.REGISTRY_NAME, version)
+            engine = self._engine_from_artifact(path, lambda: self.registry.load(self.REGISTRY_NAME, version)[1])
+            return version, None, engine
+        version, model = self.registry.load(self.REGISTRY_NAME, version)
+        return version, model, compile_model(model)
+    
+    def load_sklearn_model(self):
+        """The fitted sklearn model (loaded from the pickle if serving memory-mapped arrays)"""
+        engine = self.engine
+        return engine.sklearn_model() if engine is not None else self.model
+    
+    def reload(self, version=None):
+        """
+        Swap in a registry version (default: the active one) without a restart
+        
+        The new model is loaded, checked and compiled first; requests keep
+        using the old one until a single attribute swap. Also starts or stops
+        shadow scoring to match the manifest. Returns the version now serving.
+        """
+        if self.inference_client is not None:
+            raise RegistryError('Models are served by the inference sidecar (reload it with SIGHUP)')
+        if self.registry is None:
+            raise RegistryError('No model registry configured')
+        
+        version, model, engine = self._open_version(version)
+        classes = engine.classes_ if engine is not None else model.classes_
+        if self._ready.is_set() and not np.array_equal(classes, self.get_classes()):
+            raise RegistryError(f'{self.REGISTRY_NAME} v{version} has different classes')
+        self._bind_risk_table(engine)
+        
+        with self._lock:
+            # predict_proba reads self.engine once, so each call sees one model
+            self.model = model
+            self.engine = engine
+            self.version = version
+        if not self._ready.is_set():
+            self._mark_ready()
+        print(f"✅ Serving {self.REGISTRY_NAME} v{version}")
+        
+        shadow_version = self.registry.shadow_version(self.REGISTRY_NAME)
+        if shadow_version is None:
+            self.stop_shadow()
+        elif self.shadow is None or self.shadow.version != shadow_version:
+            self.start_shadow(shadow_version)
+        return version
+    
+    def start_shadow(self, version):
+        """Score registry version on copies of live traffic (not served)"""
+        if self.registry is None:
+            raise RegistryError('No model registry configured')
+        version, model, engine = self._open_version(version)
+        scorer = ShadowScorer((engine or model).predict_proba, version)
+        previous, self.shadow = self.shadow, scorer
+        if previous is not None:
+            previous.close()
+    
+    def stop_shadow(self):
+        """Stop shadow scoring; returns its final metrics (None if none ran)"""
+        scorer, self.shadow = self.shadow, None
+        if scorer is None:
+            return None
+        scorer.close()
+        return scorer.get_metrics()
     
     def train_model(self):
         """Train model with synthetic data (for demo)"""
+        from sklearn.ensemble import RandomForestClassifier  # Only needed to train
+        
         # Enhanced synthetic training data
         # Features: age, bp_systolic, bp_diastolic, blood_sugar, heart_rate, spo2
         
@@ -112,13 +364,25 @@ class HealthRiskPredictor:
         Predict health risk
         Returns: (risk_level, risk_score, recommendations)
         """
+        if not self.is_ready():
+            # Model still loading: rule-based prediction
+            self._count_fallback()
+            return self.fallback_prediction(vitals)
+        
         try:
             # Normalize input
             X = self.normalize_vitals(vitals)
             
-            # Get prediction
-            prediction = self.model.predict(X)[0]
-            probabilities = self.model.predict_proba(X)[0]
+            # Get prediction (one pass over the trees; same label as model.predict)
+            probabilities = None
+            if self.batcher is not None:
+                try:
+                    probabilities = self.batcher.predict(X[0], timeout=self.BATCH_TIMEOUT)
+                except FutureTimeoutError:
+                    print(f"⚠️ Inference batch took over {self.BATCH_TIMEOUT}s, predicting alone")
+            if probabilities is None:
+                probabilities = self.predict_proba(X)[0]
+            prediction = self.get_classes()[np.argmax(probabilities)]
             
             # Map to risk level
             risk_levels = ['Low', 'Medium', 'High']
@@ -134,6 +398,63 @@ class HealthRiskPredictor:
             # Fallback to rule-based prediction
             return self.fallback_prediction(vitals)
     
+    def predict_proba(self, X):
+        """Class probabilities via the compiled engine (bit-identical to sklearn)"""
+        if self.inference_client is not None:
+            return self.inference_client.predict_proba(X)
+        shadow = self.shadow
+        start = time.perf_counter()
+        engine = self.engine  # One read: a reload may swap it concurrently
+        table = self.risk_table
+        if table is not None and table.engine is engine and engine is not None:
+            probabilities = table.predict_proba(X)
+        elif engine is not None:
+            probabilities = engine.predict_proba(X)
+        else:
+            probabilities = self.model.predict_proba(X)
+        if shadow is not None:
+            shadow.submit(X, probabilities, (time.perf_counter() - start) * 1000)
+        return probabilities
+    
+    def get_classes(self):
+        """Class labels in predict_proba column order"""
+        if self.inference_client is not None:
+            return self.inference_client.classes()
+        engine = self.engine
+        return engine.classes_ if engine is not None else self.model.classes_
+    
+    def predict_batch(self, X, vitals_list):
+        """
+        Predict health risk for many readings with one model call
+        
+        X: array of shape (n, 6) in FEATURES order
+        vitals_list: matching list of vitals dicts (for recommendations)
+        Returns: list of (risk_level, risk_score, recommendations)
+        """
+        if not self.is_ready():
+            self._count_fallback(len(vitals_list))
+            return [self.fallback_prediction(vitals) for vitals in vitals_list]
+        
+        try:
+            probabilities = self.predict_proba(np.asarray(X))
+            
+            # Same label predict() would give, without a second pass over the trees
+            best = np.argmax(probabilities, axis=1)
+            predictions = self.get_classes().take(best)
+            risk_scores = probabilities[np.arange(len(best)), best]
+        except Exception as e:
+            print(f"❌ Batch prediction error: {e}")
+            # Fallback to rule-based prediction
+            return [self.fallback_prediction(vitals) for vitals in vitals_list]
+        
+        risk_levels = ['Low', 'Medium', 'High']
+        results = []
+        for vitals, prediction, risk_score in zip(vitals_list, predictions, risk_scores):
+            risk_level = risk_levels[prediction]
+            results.append((risk_level, float(risk_score),
+                            self.generate_recommendations(vitals, risk_level)))
+        return results
+    
     def generate_recommendations(self, vitals, risk_level):
         """Generate personalized recommendations"""
         recommendations = []
@@ -235,6 +556,39 @@ class EmergencyDetector:
         emergency_type = ", ".join(emergency_conditions) if is_emergency else None
         
         return is_emergency, emergency_type
+    
+    def detect_batch(self, X, risk_scores):
+        """
+        Vectorized detect() over many readings
+        
+        X: array of shape (n, 6) in FEATURES order
+        Returns: list of (is_emergency, emergency_type)
+        """
+        X = np.asarray(X, dtype=float)
+        risk_scores = np.asarray(risk_scores, dtype=float)
+        bp_systolic = X[:, FEATURES.index('bp_systolic')]
+        blood_sugar = X[:, FEATURES.index('blood_sugar')]
+        heart_rate = X[:, FEATURES.index('heart_rate')]
+        spo2 = X[:, FEATURES.index('spo2')]
+        
+        # Same conditions and order as detect()
+        conditions = [
+            ("CRITICAL_SPO2", spo2 < 90),
+            ("CRITICAL_HEART_RATE", (heart_rate > 120) | (heart_rate < 50)),
+            ("CRITICAL_BP", (bp_systolic > 180) | (bp_systolic < 90)),
+            ("CRITICAL_SUGAR", (blood_sugar > 300) | (blood_sugar < 50)),
+            ("HIGH_AI_RISK", risk_scores > 0.8)
+        ]
+        masks = np.column_stack([mask for _, mask in conditions])
+        names = [name for name, _ in conditions]
+        
+        results = []
+        for row in masks:
+            if row.any():
+                results.append((True, ", ".join(name for name, hit in zip(names, row) if hit)))
+            else:
+                results.append((False, None))
+        return results
 
 
 # Explanation for hackathon judges
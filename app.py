@@ -1,28 +1,125 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, Response, stream_with_context
 from flask_cors import CORS
 import sqlite3
 import hashlib
-import secrets
-from datetime import datetime
+from datetime import datetime, timezone
 import os
 import json
-from ai_model import HealthRiskPredictor, EmergencyDetector
+import queue
+import time
+import hmac
+import signal
+import threading
+import numpy as np
+from ai_model import HealthRiskPredictor, EmergencyDetector, FEATURES
+from model_registry import DEFAULT_REGISTRY_DIR, ModelRegistry, RegistryError
+from advanced_emergency_system import SeverityScorer
+from database import ConnectionPool
+from persistence_queue import WriteBehindQueue
+from inference_scheduler import InferenceBatcher
+from inference_server import InferenceClient
+from emergency_events import EmergencyEventBus, latest_event_id, record_event
+from emergency_queries import build_emergency_query, encode_emergency_cursor
+from response_cache import VersionedCache
+from schema import create_schema
+from security_privacy_system import PasswordHashingService, HashingOverloaded, SecureTokenManager
 
 app = Flask(__name__, template_folder='templates', static_folder='static')
 # Fix CORS to allow all origins for development
 CORS(app, resources={r"/*": {"origins": "*"}})
 
-# Initialize AI model
-predictor = HealthRiskPredictor()
+# Initialize AI model (in-process, or served by inference_server.py when INFERENCE_SOCKET is set)
+INFERENCE_SOCKET = os.environ.get('INFERENCE_SOCKET')
+inference_client = None
+if INFERENCE_SOCKET:
+    inference_client = InferenceClient(
+        INFERENCE_SOCKET, pool_size=int(os.environ.get('INFERENCE_POOL_SIZE', '4'))
+    )
+# The model loads (or trains) on a background thread so startup returns at once;
+# until it is ready predictions use the fallback_prediction rules
+# (MODEL_BACKGROUND_LOAD=0 loads it before serving instead)
+MODEL_BACKGROUND_LOAD = os.environ.get('MODEL_BACKGROUND_LOAD', '1') != '0'
+
+# Versioned model artifacts (MODEL_REGISTRY_DIR= empty uses the plain model file)
+MODEL_REGISTRY_DIR = os.environ.get('MODEL_REGISTRY_DIR', DEFAULT_REGISTRY_DIR)
+model_registry = ModelRegistry(MODEL_REGISTRY_DIR) if MODEL_REGISTRY_DIR and not inference_client else None
+
+# Optional precomputed lookup table (python risk_table.py builds health_risk_table)
+RISK_TABLE_PATH = os.environ.get('RISK_TABLE_PATH', '')
+predictor = HealthRiskPredictor(inference_client=inference_client, background=MODEL_BACKGROUND_LOAD,
+                                registry=model_registry, risk_table_path=RISK_TABLE_PATH or None)
+
+# Shared secret for /api/admin/models/* (endpoints are disabled without it)
+MODEL_ADMIN_TOKEN = os.environ.get('MODEL_ADMIN_TOKEN', '')
 emergency_detector = EmergencyDetector()
 
+# Concurrent single-row predictions share one model call (INFERENCE_BATCHING=0 disables)
+INFERENCE_BATCH_SIZE = int(os.environ.get('INFERENCE_BATCH_SIZE', '64'))
+INFERENCE_BATCH_WINDOW_MS = float(os.environ.get('INFERENCE_BATCH_WINDOW_MS', '2'))
+inference_batcher = InferenceBatcher(
+    predictor.predict_proba, max_batch_size=INFERENCE_BATCH_SIZE,
+    max_delay=INFERENCE_BATCH_WINDOW_MS / 1000
+)
+if os.environ.get('INFERENCE_BATCHING', '1') != '0':
+    predictor.batcher = inference_batcher
+
+def reload_models():
+    """Serve the registry's active model version (in-flight requests finish on the old one)"""
+    try:
+        return predictor.reload()
+    except Exception as e:
+        print(f"❌ Model reload failed, still serving v{predictor.version}: {e}")
+        return None
+
+# kill -HUP <worker pid> reloads that worker; loading runs off the signal handler
+if model_registry is not None and hasattr(signal, 'SIGHUP'):
+    try:
+        signal.signal(signal.SIGHUP, lambda signum, frame: threading.Thread(
+            target=reload_models, name='model-reload', daemon=True).start())
+    except ValueError:
+        pass  # Imported outside the main thread: admin endpoint only
+
 # Database setup
-DATABASE = 'health_system.db'
+DATABASE = os.environ.get('HEALTH_DB_PATH', 'health_system.db')
+db_pool = ConnectionPool(DATABASE)
 
 def get_db():
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Check out a pooled connection (use as a context manager)"""
+    return db_pool.connection()
+
+# Valid vital ranges: (field, low, high, error message)
+# Checked as low < value < high, except SpO2 which may be exactly 100
+VITAL_RANGES = [
+    ('age', 0, 150, 'Invalid age'),
+    ('bp_systolic', 50, 250, 'Invalid systolic BP'),
+    ('bp_diastolic', 30, 150, 'Invalid diastolic BP'),
+    ('blood_sugar', 20, 500, 'Invalid blood sugar'),
+    ('heart_rate', 30, 200, 'Invalid heart rate'),
+    ('spo2', 70, 100, 'Invalid SpO2')
+]
+
+# Largest accepted /api/health/predict/batch payload
+MAX_BATCH_SIZE = 1000
+
+# /api/health/stream micro-batching: flush after N rows or N seconds
+STREAM_BATCH_SIZE = 100
+STREAM_FLUSH_SECONDS = 1.0
+STREAM_MAX_LINE_BYTES = 16 * 1024
+
+# Password KDF pool: worker threads + waiting logins before we answer 503
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', '2'))
+PASSWORD_HASH_QUEUE = 32
+
+# Signed session token lifetime (seconds); keys come from SESSION_TOKEN_KEYS
+SESSION_TOKEN_TTL = 8 * 3600
+
+# /api/patient/dashboard response cache (entries, seconds)
+DASHBOARD_CACHE_SIZE = 4096
+DASHBOARD_CACHE_TTL = 30
+
+# /api/emergencies/stream: idle heartbeat interval (seconds) and its bounds
+SSE_HEARTBEAT_SECONDS = 15
+SSE_HEARTBEAT_RANGE = (1, 60)
 
 def init_db():
     """Initialize database with tables"""
@@ -31,70 +128,14 @@ def init_db():
     if db_dir and not os.path.exists(db_dir):
         os.makedirs(db_dir)
     
-    conn = get_db()
+    with get_db() as conn:
+        create_schema(conn)
+        _create_demo_users(conn)
+
+def _create_demo_users(conn):
+    """Create demo users"""
     cursor = conn.cursor()
     
-    # Users table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            email TEXT UNIQUE NOT NULL,
-            name TEXT NOT NULL,
-            role TEXT NOT NULL,
-            phone TEXT,
-            password_hash TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Health records table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS health_records (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            age INTEGER,
-            bp_systolic INTEGER,
-            bp_diastolic INTEGER,
-            blood_sugar REAL,
-            heart_rate INTEGER,
-            spo2 INTEGER,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    ''')
-    
-    # Predictions table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS predictions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            record_id INTEGER NOT NULL,
-            risk_level TEXT NOT NULL,
-            risk_score REAL NOT NULL,
-            recommendations TEXT,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id),
-            FOREIGN KEY (record_id) REFERENCES health_records (id)
-        )
-    ''')
-    
-    # Emergencies table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS emergencies (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            emergency_type TEXT NOT NULL,
-            status TEXT DEFAULT 'ACTIVE',
-            location TEXT,
-            doctor_id INTEGER,
-            ambulance_id INTEGER,
-            vitals_summary TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            resolved_at TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    ''')
-    
     # Create demo users with email/password
     demo_users = [
         ('patient@healthcare.com', 'Rahul Kumar', 'patient', '9876543210', 'password123'),
@@ -113,7 +154,111 @@ def init_db():
             pass  # User already exists
     
     conn.commit()
-    conn.close()
+
+def insert_health_predictions(conn, rows):
+    """
+    Insert health records and their linked predictions with executemany
+    
+    rows: [(user_id, vitals, risk_level, risk_score, recommendations)]
+    Must run inside a write transaction: while the write lock is held the
+    new records get consecutive AUTOINCREMENT ids.
+    """
+    cursor = conn.cursor()
+    cursor.executemany('''
+        INSERT INTO health_records (user_id, age, bp_systolic, bp_diastolic, 
+                                   blood_sugar, heart_rate, spo2)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', [(user_id,) + tuple(vitals[field] for field in FEATURES)
+          for user_id, vitals, _, _, _ in rows])
+    
+    last_record_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+    first_record_id = last_record_id - len(rows) + 1
+    
+    cursor.executemany('''
+        INSERT INTO predictions (user_id, record_id, risk_level, risk_score, recommendations)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [(user_id, first_record_id + k, risk_level, risk_score, recommendations)
+          for k, (user_id, _, risk_level, risk_score, recommendations) in enumerate(rows)])
+
+def save_routine_predictions(conn, rows):
+    """Group commit for queued non-emergency predictions"""
+    insert_health_predictions(conn, rows)
+    conn.commit()
+
+# Login / register hashing off the request threads
+password_hasher = PasswordHashingService(PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE)
+
+def upgrade_password_hash(user_id, old_hash, password):
+    """Re-hash a legacy password in the background after a successful login"""
+    def store(future):
+        if future.exception() is not None:
+            return
+        
+        def save(conn):
+            # Only if nobody changed the password in the meantime
+            conn.execute('UPDATE users SET password_hash = ? WHERE id = ? AND password_hash = ?',
+                         (future.result(), user_id, old_hash))
+            conn.commit()
+        
+        try:
+            db_pool.run_with_retry(save)
+        except Exception as e:
+            print(f"⚠️ Password hash upgrade failed for user {user_id}: {e}")
+    
+    try:
+        password_hasher.hash_password_async(password).add_done_callback(store)
+    except HashingOverloaded:
+        pass  # Busy - the next login upgrades it
+
+# Stateless session tokens (HMAC-signed, checked in memory)
+session_tokens = SecureTokenManager.from_env(ttl_seconds=SESSION_TOKEN_TTL)
+
+def bearer_token():
+    """Token of the request's 'Authorization: Bearer <token>' header, or None (other schemes too)"""
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not token.strip():
+        return None
+    return token.strip()
+
+def get_session():
+    """Claims of the request's bearer token, or None"""
+    token = bearer_token()
+    return session_tokens.verify_token(token) if token else None
+
+# Patient dashboard responses, invalidated per user by a version bump
+dashboard_cache = VersionedCache(DASHBOARD_CACHE_SIZE, DASHBOARD_CACHE_TTL)
+
+def invalidate_patient_dashboards(user_ids):
+    """Bump dashboard cache versions after a committed write for these users"""
+    for user_id in set(user_ids):
+        try:
+            dashboard_cache.bump(int(user_id))
+        except (TypeError, ValueError):
+            pass  # Not a valid dashboard id, nothing cached under it
+
+# Non-emergency predictions are persisted write-behind (WRITE_BEHIND=0 disables)
+WRITE_BEHIND_ENABLED = os.environ.get('WRITE_BEHIND', '1') != '0'
+persistence_queue = WriteBehindQueue(
+    db_pool, save_routine_predictions,
+    on_commit=lambda rows: invalidate_patient_dashboards(row[0] for row in rows)
+)
+
+# Live emergency changes for /api/emergencies/stream (every worker polls the event log)
+emergency_events = EmergencyEventBus(db_pool)
+
+def record_created_emergencies(conn, first_id, last_id):
+    """Log 'created' events for a range of emergency ids (inside the inserting transaction)"""
+    emergencies = conn.execute('''
+        SELECT e.*, u.name, u.phone, u.abha_id
+        FROM emergencies e
+        JOIN users u ON e.user_id = u.id
+        WHERE e.id BETWEEN ? AND ?
+        ORDER BY e.id
+    ''', (first_id, last_id)).fetchall()
+    
+    # Same shape as the rows of /api/doctor/emergencies
+    for emergency in emergencies:
+        record_event(conn, 'created', dict(emergency))
 
 # Routes
 @app.route('/')
@@ -162,27 +307,24 @@ def login():
         if not email or not password:
             return jsonify({'error': 'Email and password required'}), 400
         
-        password_hash = hashlib.sha256(password.encode()).hexdigest()
-        
-        conn = get_db()
+        with get_db() as conn:
+            user = conn.execute('SELECT * FROM users WHERE email = ?', (email,)).fetchone()
         
         # Check if role is provided, if yes, verify role matches
-        if role:
-            user = conn.execute(
-                'SELECT * FROM users WHERE email = ? AND password_hash = ? AND role = ?',
-                (email, password_hash, role)
-            ).fetchone()
-        else:
-            user = conn.execute(
-                'SELECT * FROM users WHERE email = ? AND password_hash = ?',
-                (email, password_hash)
-            ).fetchone()
+        if user and role and user['role'] != role:
+            user = None
         
-        conn.close()
+        # KDF runs on the hashing pool; unknown accounts cost the same
+        valid, needs_rehash = password_hasher.verify_password(
+            password, user['password_hash'] if user else None)
+        if not valid:
+            user = None
+        elif needs_rehash:
+            upgrade_password_hash(user['id'], user['password_hash'], password)
         
         if user:
-            # Generate session token (simplified)
-            token = secrets.token_hex(16)
+            # Signed session token (user id, role, expiry)
+            token = session_tokens.generate_token(user['id'], user['role'])
             return jsonify({
                 'success': True,
                 'token': token,
@@ -195,9 +337,36 @@ def login():
             })
         else:
             return jsonify({'error': 'Invalid email, password, or role'}), 401
+    except HashingOverloaded:
+        return jsonify({'error': 'Login service busy, please retry'}), 503, {'Retry-After': '1'}
     except Exception as e:
         return jsonify({'error': f'Login error: {str(e)}'}), 500
 
+@app.route('/api/auth/session', methods=['GET'])
+def get_current_session():
+    """Who the bearer token belongs to (no database lookup)"""
+    session = get_session()
+    if session is None:
+        return jsonify({'error': 'Invalid or expired token'}), 401
+    
+    return jsonify({
+        'user_id': session['user_id'],
+        'role': session['role'],
+        'expires_at': session['expires_at']
+    })
+
+@app.route('/api/auth/logout', methods=['POST'])
+def logout():
+    """Revoke the bearer token until it would have expired"""
+    token = bearer_token()
+    if not token or not session_tokens.revoke_token(token):
+        return jsonify({'error': 'Invalid or expired token'}), 401
+    
+    return jsonify({
+        'success': True,
+        'message': 'Logged out'
+    })
+
 @app.route('/api/auth/register', methods=['POST'])
 def register():
     """Register new user with email/password"""
@@ -219,23 +388,24 @@ def register():
         if role not in ['patient', 'doctor', 'ambulance']:
             return jsonify({'error': 'Invalid role'}), 400
         
-        # Hash password
-        password_hash = hashlib.sha256(password.encode()).hexdigest()
-        
-        conn = get_db()
-        cursor = conn.cursor()
+        # Hash password (scrypt, on the hashing pool)
+        password_hash = password_hasher.hash_password(password)
         
-        try:
+        def create_user(conn):
+            cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO users (email, name, role, phone, password_hash)
                 VALUES (?, ?, ?, ?, ?)
             ''', (email, name, role, phone, password_hash))
-            
-            user_id = cursor.lastrowid
             conn.commit()
+            return cursor.lastrowid
+        
+        try:
+            user_id = db_pool.run_with_retry(create_user)
+            invalidate_patient_dashboards([user_id])  # A miss for this id may be cached
             
-            # Generate session token
-            token = secrets.token_hex(16)
+            # Signed session token (user id, role, expiry)
+            token = session_tokens.generate_token(user_id, role)
             
             return jsonify({
                 'success': True,
@@ -250,43 +420,77 @@ def register():
             })
         except sqlite3.IntegrityError:
             return jsonify({'error': 'Email already registered'}), 409
-        finally:
-            conn.close()
             
+    except HashingOverloaded:
+        return jsonify({'error': 'Registration service busy, please retry'}), 503, {'Retry-After': '1'}
     except Exception as e:
         return jsonify({'error': f'Registration error: {str(e)}'}), 500
 
+def _last_modified(*timestamps):
+    """Newest of some SQLite UTC timestamps, as an aware datetime"""
+    timestamps = [t for t in timestamps if t]
+    if not timestamps:
+        return None
+    return datetime.strptime(max(timestamps), '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+
 @app.route('/api/patient/dashboard/<int:user_id>', methods=['GET'])
 def patient_dashboard(user_id):
-    """Get patient dashboard data"""
-    conn = get_db()
-    
-    # Get user info
-    user = conn.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
-    
-    # Get recent health records
-    records = conn.execute('''
-        SELECT * FROM health_records 
-        WHERE user_id = ? 
-        ORDER BY timestamp DESC 
-        LIMIT 10
-    ''', (user_id,)).fetchall()
-    
-    # Get recent predictions
-    predictions = conn.execute('''
-        SELECT * FROM predictions 
-        WHERE user_id = ? 
-        ORDER BY timestamp DESC 
-        LIMIT 5
-    ''', (user_id,)).fetchall()
-    
-    conn.close()
+    """
+    Get patient dashboard data
     
-    return jsonify({
+    Served from dashboard_cache until the patient submits vitals or SOS.
+    ETag / Last-Modified let the browser revalidate with a 304.
+    """
+    cached = dashboard_cache.get(user_id)
+    if cached is None:
+        version = dashboard_cache.version(user_id)
+        cached = _load_patient_dashboard(user_id)
+        dashboard_cache.put(user_id, version, cached)
+    body, etag, last_modified = cached
+    
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True  # Always revalidate
+    return response.make_conditional(request)
+
+def _load_patient_dashboard(user_id):
+    """Run the dashboard queries; returns (json body, etag, last_modified)"""
+    with get_db() as conn:
+        # Get user info
+        user = conn.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
+        
+        # Get recent health records
+        records = conn.execute('''
+            SELECT * FROM health_records 
+            WHERE user_id = ? 
+            ORDER BY timestamp DESC 
+            LIMIT 10
+        ''', (user_id,)).fetchall()
+        
+        # Get recent predictions
+        predictions = conn.execute('''
+            SELECT * FROM predictions 
+            WHERE user_id = ? 
+            ORDER BY timestamp DESC 
+            LIMIT 5
+        ''', (user_id,)).fetchall()
+    
+    body = jsonify({
         'user': dict(user) if user else None,
         'records': [dict(r) for r in records],
         'predictions': [dict(p) for p in predictions]
-    })
+    }).get_data()
+    
+    # Content-derived validators agree across worker processes
+    etag = hashlib.sha1(body).hexdigest()
+    last_modified = _last_modified(
+        user['created_at'] if user else None,
+        records[0]['timestamp'] if records else None,
+        predictions[0]['timestamp'] if predictions else None
+    )
+    return body, etag, last_modified
 
 @app.route('/api/health/predict', methods=['POST'])
 def predict_health_risk():
@@ -310,54 +514,45 @@ def predict_health_risk():
             return jsonify({'error': 'All vitals and user_id are required'}), 400
         
         # Validate ranges
-        if not (0 < vitals['age'] < 150):
-            return jsonify({'error': 'Invalid age'}), 400
-        if not (50 < vitals['bp_systolic'] < 250):
-            return jsonify({'error': 'Invalid systolic BP'}), 400
-        if not (30 < vitals['bp_diastolic'] < 150):
-            return jsonify({'error': 'Invalid diastolic BP'}), 400
-        if not (20 < vitals['blood_sugar'] < 500):
-            return jsonify({'error': 'Invalid blood sugar'}), 400
-        if not (30 < vitals['heart_rate'] < 200):
-            return jsonify({'error': 'Invalid heart rate'}), 400
-        if not (70 < vitals['spo2'] <= 100):
-            return jsonify({'error': 'Invalid SpO2'}), 400
-        
-        # Save health record
-        conn = get_db()
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO health_records (user_id, age, bp_systolic, bp_diastolic, 
-                                       blood_sugar, heart_rate, spo2)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (user_id, vitals['age'], vitals['bp_systolic'], vitals['bp_diastolic'],
-              vitals['blood_sugar'], vitals['heart_rate'], vitals['spo2']))
-        
-        record_id = cursor.lastrowid
-        
-        # AI Prediction
-        risk_level, risk_score, recommendations = predictor.predict(vitals)
-        
-        # Save prediction
-        cursor.execute('''
-            INSERT INTO predictions (user_id, record_id, risk_level, risk_score, recommendations)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (user_id, record_id, risk_level, risk_score, recommendations))
+        for field, low, high, message in VITAL_RANGES:
+            value = vitals[field]
+            if not (low < value < high or (field == 'spo2' and value == high)):
+                return jsonify({'error': message}), 400
         
-        conn.commit()
+        # AI Prediction (outside the write transaction)
+        risk_level, risk_score, recommendations = predictor.predict(vitals)
         
         # Check for emergency
         is_emergency, emergency_type = emergency_detector.detect(vitals, risk_score)
         
-        if is_emergency:
-            # Create emergency record
-            cursor.execute('''
-                INSERT INTO emergencies (user_id, emergency_type, vitals_summary)
-                VALUES (?, ?, ?)
-            ''', (user_id, emergency_type, str(vitals)))
+        row = (user_id, vitals, risk_level, risk_score, recommendations)
+        
+        def save_prediction(conn):
+            # Save health record + prediction
+            insert_health_predictions(conn, [row])
+            
+            emergency_id = None
+            if is_emergency:
+                # Create emergency record
+                severity, _ = SeverityScorer.calculate_severity(vitals, {}, risk_score)
+                emergency_id = conn.execute('''
+                    INSERT INTO emergencies (user_id, emergency_type, vitals_summary, severity)
+                    VALUES (?, ?, ?, ?)
+                ''', (user_id, emergency_type, str(vitals), severity)).lastrowid
+                record_created_emergencies(conn, emergency_id, emergency_id)
+            
             conn.commit()
+            return emergency_id
         
-        conn.close()
+        if is_emergency or not WRITE_BEHIND_ENABLED:
+            # Emergencies are on disk before the client hears back
+            emergency_id = db_pool.run_with_retry(save_prediction, durable=is_emergency)
+            invalidate_patient_dashboards([user_id])
+            if emergency_id is not None:
+                emergency_events.notify()
+        else:
+            # Routine readings are group-committed in the background
+            persistence_queue.submit(row)
         
         return jsonify({
             'success': True,
@@ -370,6 +565,302 @@ def predict_health_risk():
     except Exception as e:
         return jsonify({'error': f'Prediction error: {str(e)}'}), 500
 
+def validate_vitals_batch(readings, default_user_id=None):
+    """
+    Validate many readings in one vectorized pass
+    
+    Returns: (X, user_ids, errors)
+        X: float array (n, 6) in FEATURES order (NaN where missing)
+        errors: {reading index: message} using the single-reading messages
+    """
+    X = np.full((len(readings), len(FEATURES)), np.nan)
+    user_ids = []
+    for i, reading in enumerate(readings):
+        if not isinstance(reading, dict):
+            user_ids.append(None)
+            continue
+        user_ids.append(reading.get('user_id', default_user_id))
+        for j, field in enumerate(FEATURES):
+            value = reading.get(field)
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                X[i, j] = value
+    
+    missing = np.isnan(X).any(axis=1) | np.array([uid is None for uid in user_ids])
+    
+    # Range check for the whole matrix at once (NaN compares False)
+    lows = np.array([low for _, low, _, _ in VITAL_RANGES])
+    highs = np.array([high for _, _, high, _ in VITAL_RANGES])
+    in_range = (X > lows) & (X < highs)
+    spo2 = FEATURES.index('spo2')
+    in_range[:, spo2] |= X[:, spo2] == highs[spo2]
+    
+    # First failing vital per row, in the same order as the single endpoint
+    first_failure = np.argmin(in_range, axis=1)
+    out_of_range = ~in_range.all(axis=1)
+    
+    errors = {}
+    for i in np.flatnonzero(missing | out_of_range):
+        if missing[i]:
+            errors[int(i)] = 'All vitals and user_id are required'
+        else:
+            errors[int(i)] = VITAL_RANGES[first_failure[i]][3]
+    return X, user_ids, errors
+
+def process_vitals_batch(readings, default_user_id=None):
+    """
+    Validate, predict and persist a batch of readings
+    
+    One predict_proba over the whole matrix, one vectorized emergency
+    check, and one transaction of executemany inserts.
+    Returns: per-reading result dicts (same order as readings)
+    """
+    X, user_ids, errors = validate_vitals_batch(readings, default_user_id)
+    valid = [i for i in range(len(readings)) if i not in errors]
+    
+    results = [{'index': i, 'success': False, 'error': errors[i]} for i in range(len(readings))
+               if i in errors]
+    if not valid:
+        return results
+    
+    X_valid = X[valid]
+    vitals_list = [{field: readings[i][field] for field in FEATURES} for i in valid]
+    predictions = predictor.predict_batch(X_valid, vitals_list)
+    detections = emergency_detector.detect_batch(X_valid, [score for _, score, _ in predictions])
+    
+    prediction_rows = [(user_ids[i], vitals, risk_level, risk_score, recommendations)
+                       for i, vitals, (risk_level, risk_score, recommendations)
+                       in zip(valid, vitals_list, predictions)]
+    
+    emergency_rows = [(user_ids[i], emergency_type, str(vitals),
+                       SeverityScorer.calculate_severity(vitals, {}, risk_score)[0])
+                      for i, vitals, (_, risk_score, _), (is_emergency, emergency_type)
+                      in zip(valid, vitals_list, predictions, detections) if is_emergency]
+    
+    def save_batch(conn):
+        insert_health_predictions(conn, prediction_rows)
+        last_emergency_id = None
+        if emergency_rows:
+            conn.executemany('''
+                INSERT INTO emergencies (user_id, emergency_type, vitals_summary, severity)
+                VALUES (?, ?, ?, ?)
+            ''', emergency_rows)
+            last_emergency_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+            record_created_emergencies(conn, last_emergency_id - len(emergency_rows) + 1, last_emergency_id)
+        conn.commit()
+        return last_emergency_id
+    
+    # Batches containing emergencies are committed durably
+    last_emergency_id = db_pool.run_with_retry(save_batch, durable=bool(emergency_rows))
+    invalidate_patient_dashboards(row[0] for row in prediction_rows)
+    if emergency_rows:
+        emergency_events.notify()
+    
+    for i, (risk_level, risk_score, recommendations), (is_emergency, emergency_type) in zip(
+            valid, predictions, detections):
+        results.append({
+            'index': i,
+            'success': True,
+            'user_id': user_ids[i],
+            'risk_level': risk_level,
+            'risk_score': round(risk_score, 2),
+            'recommendations': recommendations,
+            'is_emergency': is_emergency,
+            'emergency_type': emergency_type
+        })
+    
+    results.sort(key=lambda result: result['index'])
+    return results
+
+@app.route('/api/health/predict/batch', methods=['POST'])
+def predict_health_risk_batch():
+    """AI-powered health risk prediction for many readings in one request"""
+    try:
+        data = request.json
+        
+        # Accept a bare array or {"user_id": ..., "readings": [...]}
+        if isinstance(data, dict):
+            readings = data.get('readings')
+            default_user_id = data.get('user_id')
+        else:
+            readings, default_user_id = data, None
+        
+        if not isinstance(readings, list) or not readings:
+            return jsonify({'error': 'A non-empty readings array is required'}), 400
+        if len(readings) > MAX_BATCH_SIZE:
+            return jsonify({'error': f'At most {MAX_BATCH_SIZE} readings per batch'}), 413
+        
+        results = process_vitals_batch(readings, default_user_id)
+        failed = sum(1 for result in results if not result['success'])
+        
+        return jsonify({
+            'success': True,
+            'total': len(results),
+            'processed': len(results) - failed,
+            'failed': failed,
+            'results': results
+        })
+    except Exception as e:
+        return jsonify({'error': f'Batch prediction error: {str(e)}'}), 500
+
+def iter_ndjson(stream, max_line_bytes=STREAM_MAX_LINE_BYTES):
+    """
+    Parse newline-delimited JSON from a byte stream incrementally
+    
+    Yields (line_number, reading, error). reading and error are both None
+    for a blank line, which clients can send to force a flush. Only one
+    line (at most max_line_bytes) is held in memory at a time.
+    """
+    line_number = 0
+    while True:
+        line = stream.readline(max_line_bytes + 1)
+        if not line:
+            return
+        line_number += 1
+        
+        if len(line) > max_line_bytes and not line.endswith(b'\n'):
+            # Oversized line - discard the rest of it without buffering
+            while line and not line.endswith(b'\n'):
+                line = stream.readline(max_line_bytes + 1)
+            yield line_number, None, f'Line exceeds {max_line_bytes} bytes'
+            continue
+        
+        line = line.strip()
+        if not line:
+            yield line_number, None, None
+            continue
+        try:
+            yield line_number, json.loads(line), None
+        except ValueError:
+            yield line_number, None, 'Invalid JSON'
+
+_STREAM_END = object()  # Reader thread marker: no more lines
+
+def iter_stream_batches(lines, batch_size=STREAM_BATCH_SIZE, flush_seconds=STREAM_FLUSH_SECONDS):
+    """
+    Group parsed NDJSON lines into micro-batches
+    
+    A batch is flushed when it reaches batch_size rows, when its oldest
+    row is flush_seconds old, or on a blank line.
+    Lines are read on a separate thread into a bounded queue, so the
+    flush_seconds deadline holds even while the client sends nothing
+    (a gateway's last reading before it goes quiet is not held back).
+    Yields ([(line_number, reading)], [{'line', 'error'}]).
+    """
+    pending = queue.Queue(maxsize=batch_size)
+    stop = threading.Event()
+    
+    def put(item):
+        while not stop.is_set():
+            try:
+                pending.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def read_lines():
+        failure = None
+        try:
+            for item in lines:
+                if not put(item):
+                    return  # Consumer went away
+        except Exception as e:
+            failure = e
+        put((_STREAM_END, failure, None))
+    
+    threading.Thread(target=read_lines, name='vitals-stream-reader', daemon=True).start()
+    
+    batch, errors, started = [], [], None
+    try:
+        while True:
+            timeout = None if started is None else max(0.0, started + flush_seconds - time.monotonic())
+            try:
+                line_number, reading, error = pending.get(timeout=timeout)
+            except queue.Empty:
+                line_number = None  # Deadline passed with no new line
+            else:
+                if line_number is _STREAM_END:
+                    if reading is not None:
+                        raise reading
+                    break
+            
+            flush_requested = False
+            if line_number is not None:
+                if error:
+                    errors.append({'line': line_number, 'error': error})
+                elif reading is not None:
+                    batch.append((line_number, reading))
+                started = started or time.monotonic()
+                flush_requested = reading is None and error is None
+            
+            if (len(batch) >= batch_size or len(errors) >= batch_size or flush_requested
+                    or (started and time.monotonic() - started >= flush_seconds)):
+                if batch or errors:
+                    yield batch, errors
+                batch, errors, started = [], [], None
+        
+        if batch or errors:
+            yield batch, errors
+    finally:
+        stop.set()
+
+@app.route('/api/health/stream', methods=['POST'])
+def ingest_vitals_stream():
+    """
+    Continuous vitals ingestion for wearable gateways
+    
+    Request body: newline-delimited JSON readings (chunked upload is fine).
+    Response: one NDJSON acknowledgement per micro-batch, streamed back
+    while the upload is still in progress, then a final summary line.
+    """
+    default_user_id = request.args.get('user_id', type=int)
+    stream = request.stream
+    
+    def generate():
+        totals = {'batches': 0, 'processed': 0, 'failed': 0, 'emergencies': 0}
+        
+        for batch, errors in iter_stream_batches(iter_ndjson(stream)):
+            totals['batches'] += 1
+            ack = {
+                'batch': totals['batches'],
+                'processed': 0,
+                'failed': len(errors),
+                'errors': errors,
+                'emergencies': []
+            }
+            
+            if batch:
+                try:
+                    results = process_vitals_batch([reading for _, reading in batch], default_user_id)
+                except Exception as e:
+                    yield json.dumps({'batch': totals['batches'],
+                                      'error': f'Stream ingestion error: {str(e)}'}) + '\n'
+                    return
+                
+                for result in results:
+                    line_number = batch[result['index']][0]
+                    if not result['success']:
+                        ack['failed'] += 1
+                        ack['errors'].append({'line': line_number, 'error': result['error']})
+                        continue
+                    ack['processed'] += 1
+                    if result['is_emergency']:
+                        ack['emergencies'].append({
+                            'line': line_number,
+                            'user_id': result['user_id'],
+                            'emergency_type': result['emergency_type']
+                        })
+            
+            ack['errors'].sort(key=lambda error: error['line'])
+            totals['processed'] += ack['processed']
+            totals['failed'] += ack['failed']
+            totals['emergencies'] += len(ack['emergencies'])
+            yield json.dumps(ack) + '\n'
+        
+        yield json.dumps({'done': True, **totals}) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @app.route('/api/emergency/sos', methods=['POST'])
 def trigger_sos():
     """Emergency SOS button"""
@@ -381,28 +872,36 @@ def trigger_sos():
         if not user_id:
             return jsonify({'error': 'User ID required'}), 400
         
-        conn = get_db()
-        cursor = conn.cursor()
-        
-        # Get latest vitals
-        latest_record = conn.execute('''
-            SELECT * FROM health_records 
-            WHERE user_id = ? 
-            ORDER BY timestamp DESC 
-            LIMIT 1
-        ''', (user_id,)).fetchone()
-        
-        vitals_summary = dict(latest_record) if latest_record else {}
-        
-        # Create emergency
-        cursor.execute('''
-            INSERT INTO emergencies (user_id, emergency_type, status, location, vitals_summary)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (user_id, 'SOS_MANUAL', 'ACTIVE', location, str(vitals_summary)))
+        def create_emergency(conn):
+            cursor = conn.cursor()
+            
+            # Get latest vitals
+            latest_record = conn.execute('''
+                SELECT * FROM health_records 
+                WHERE user_id = ? 
+                ORDER BY timestamp DESC 
+                LIMIT 1
+            ''', (user_id,)).fetchone()
+            
+            vitals_summary = dict(latest_record) if latest_record else {}
+            
+            # A manual SOS counts as full AI risk on top of the latest vitals
+            severity, _ = SeverityScorer.calculate_severity(
+                {k: v for k, v in vitals_summary.items() if v is not None}, {}, 1.0)
+            
+            # Create emergency
+            emergency_id = cursor.execute('''
+                INSERT INTO emergencies (user_id, emergency_type, status, location, vitals_summary, severity)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (user_id, 'SOS_MANUAL', 'ACTIVE', location, str(vitals_summary), severity)).lastrowid
+            record_created_emergencies(conn, emergency_id, emergency_id)
+            
+            conn.commit()
+            return emergency_id
         
-        emergency_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        emergency_id = db_pool.run_with_retry(create_emergency)
+        invalidate_patient_dashboards([user_id])
+        emergency_events.notify()
         
         return jsonify({
             'success': True,
@@ -414,41 +913,95 @@ def trigger_sos():
 
 @app.route('/api/doctor/emergencies', methods=['GET'])
 def get_emergencies():
-    """Get all active emergencies for doctor dashboard"""
-    conn = get_db()
+    """
+    Active emergencies for the doctor dashboard, newest first
     
-    emergencies = conn.execute('''
-        SELECT e.*, u.name, u.phone, u.abha_id
-        FROM emergencies e
-        JOIN users u ON e.user_id = u.id
-        WHERE e.status = 'ACTIVE'
-        ORDER BY e.created_at DESC
-    ''').fetchall()
+    Query params (all optional):
+        limit          page size (default 50, max 500)
+        cursor         next_cursor from the previous page
+        emergency_type one or more types, comma-separated (e.g. CRITICAL_SPO2,SOS_MANUAL)
+        since, until   created_at window (ISO 8601, UTC)
+        min_severity, max_severity  1-10
+        status         ACTIVE (default), DISPATCHED or RESOLVED
+        fields         columns to return, comma-separated (id, created_at always included)
+    """
+    try:
+        sql, params, fields, limit = build_emergency_query(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    with get_db() as conn:
+        # Read before the query: resuming the stream from here may repeat an
+        # event already in the snapshot, but can never miss one
+        last_event_id = latest_event_id(conn)
+        emergencies = conn.execute(sql, params).fetchall()
     
-    conn.close()
+    next_cursor = None
+    if len(emergencies) > limit:
+        emergencies = emergencies[:limit]
+        last = emergencies[-1]
+        next_cursor = encode_emergency_cursor(last['created_at'], last['id'])
     
     return jsonify({
-        'emergencies': [dict(e) for e in emergencies]
+        'emergencies': [dict(e) for e in emergencies],
+        'next_cursor': next_cursor,
+        'last_event_id': last_event_id
     })
 
+@app.route('/api/emergencies/stream', methods=['GET'])
+def stream_emergencies():
+    """
+    Server-Sent Events feed of emergency changes
+    
+    Events: created (full emergency row), dispatched, resolved.
+    Resume: Last-Event-ID header (sent by EventSource on reconnect) or
+    ?last_event_id= (e.g. the value returned with the snapshot).
+    A 'reset' event means the gap can't be replayed - re-fetch the snapshot.
+    Idle connections get a comment line every ?heartbeat= seconds.
+    """
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({'error': 'Invalid Last-Event-ID'}), 400
+    
+    low, high = SSE_HEARTBEAT_RANGE
+    heartbeat = request.args.get('heartbeat', SSE_HEARTBEAT_SECONDS, type=float)
+    heartbeat = min(max(heartbeat, low), high)
+    
+    response = Response(stream_with_context(emergency_events.stream(last_event_id, heartbeat)),
+                        mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Don't let nginx buffer the stream
+    return response
+
 @app.route('/api/ambulance/dispatch', methods=['POST'])
 def dispatch_ambulance():
     """Dispatch ambulance for emergency"""
     data = request.json
     emergency_id = data.get('emergency_id')
     
-    conn = get_db()
-    cursor = conn.cursor()
+    ambulance_id = 1  # Mock ambulance ID
     
-    # Update emergency with ambulance info
-    cursor.execute('''
-        UPDATE emergencies 
-        SET ambulance_id = ?, status = ?
-        WHERE id = ?
-    ''', (1, 'DISPATCHED', emergency_id))  # Mock ambulance ID
+    def mark_dispatched(conn):
+        # Update emergency with ambulance info (only while it is still waiting for one)
+        updated = conn.execute('''
+            UPDATE emergencies 
+            SET ambulance_id = ?, status = ?
+            WHERE id = ? AND status = ?
+        ''', (ambulance_id, 'DISPATCHED', emergency_id, 'ACTIVE')).rowcount
+        if updated:
+            record_event(conn, 'dispatched', {
+                'id': emergency_id,
+                'status': 'DISPATCHED',
+                'ambulance_id': ambulance_id
+            })
+        conn.commit()
+        return updated
     
-    conn.commit()
-    conn.close()
+    if not db_pool.run_with_retry(mark_dispatched):
+        return jsonify({'error': 'Emergency not found or not active'}), 409
+    emergency_events.notify()
     
     return jsonify({
         'success': True,
@@ -456,16 +1009,120 @@ def dispatch_ambulance():
         'eta': '10-15 minutes'
     })
 
+@app.route('/api/emergency/resolve', methods=['POST'])
+def resolve_emergency():
+    """Close an emergency once the patient has been handed over"""
+    data = request.json
+    emergency_id = data.get('emergency_id')
+    
+    if not emergency_id:
+        return jsonify({'error': 'Emergency ID required'}), 400
+    
+    def mark_resolved(conn):
+        updated = conn.execute('''
+            UPDATE emergencies 
+            SET status = ?, resolved_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status != ?
+        ''', ('RESOLVED', emergency_id, 'RESOLVED')).rowcount
+        resolved_at = None
+        if updated:
+            resolved_at = conn.execute('SELECT resolved_at FROM emergencies WHERE id = ?',
+                                       (emergency_id,)).fetchone()[0]
+            record_event(conn, 'resolved', {
+                'id': emergency_id,
+                'status': 'RESOLVED',
+                'resolved_at': resolved_at
+            })
+        conn.commit()
+        return resolved_at
+    
+    resolved_at = db_pool.run_with_retry(mark_resolved)
+    if resolved_at is None:
+        return jsonify({'error': 'Emergency not found or already resolved'}), 404
+    emergency_events.notify()
+    
+    return jsonify({
+        'success': True,
+        'message': 'Emergency resolved'
+    })
+
+@app.route('/api/ready', methods=['GET'])
+def readiness():
+    """Readiness probe: 200 once the model serves, 503 while rules are used"""
+    status = predictor.get_status()
+    return jsonify(status), 200 if status['ready'] else 503
+
+def is_model_admin():
+    """Request carries the X-Admin-Token shared secret"""
+    token = request.headers.get('X-Admin-Token', '')
+    return bool(MODEL_ADMIN_TOKEN) and hmac.compare_digest(token.encode(), MODEL_ADMIN_TOKEN.encode())
+
+@app.route('/api/admin/models', methods=['GET'])
+def get_model_registry():
+    """Registry manifest and what this worker is serving/shadowing"""
+    if not is_model_admin():
+        return jsonify({'error': 'Forbidden'}), 403
+    if model_registry is None:
+        return jsonify({'error': 'No model registry configured'}), 409
+    return jsonify({'manifest': model_registry.manifest(), 'serving': predictor.get_status()})
+
+@app.route('/api/admin/models/reload', methods=['POST'])
+def reload_model_registry():
+    """
+    Activate and/or shadow registry versions, then reload this worker
+    
+    Body (optional): {"version": 3, "shadow": 4}; "shadow": null stops
+    shadow scoring. Other workers pick the change up on SIGHUP.
+    """
+    if not is_model_admin():
+        return jsonify({'error': 'Forbidden'}), 403
+    if model_registry is None:
+        return jsonify({'error': 'No model registry configured'}), 409
+    
+    data = request.get_json(silent=True) or {}
+    try:
+        if data.get('version') is not None:
+            model_registry.activate(predictor.REGISTRY_NAME, int(data['version']))
+        if 'shadow' in data:
+            shadow = data['shadow']
+            model_registry.set_shadow(predictor.REGISTRY_NAME, int(shadow) if shadow is not None else None)
+        
+        start = time.perf_counter()
+        version = predictor.reload()
+        reload_ms = (time.perf_counter() - start) * 1000
+    except (RegistryError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({
+        'success': True,
+        'version': version,
+        'reload_ms': round(reload_ms, 3),
+        'serving': predictor.get_status()
+    })
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Runtime performance metrics"""
+    return jsonify({
+        'model': predictor.get_status(),
+        'db_pool': db_pool.get_metrics(),
+        'inference_batcher': inference_batcher.get_metrics(),
+        'inference_sidecar': inference_client.get_metrics() if inference_client else None,
+        'write_behind': persistence_queue.get_metrics(),
+        'emergency_events': emergency_events.get_metrics(),
+        'dashboard_cache': dashboard_cache.get_metrics(),
+        'password_hashing': password_hasher.get_metrics(),
+        'session_tokens': session_tokens.get_metrics()
+    })
+
 if __name__ == '__main__':
     try:
         print("🏥 Smart Health System starting...")
         print("📊 Initializing database...")
         init_db()
         print("✅ Database initialized")
-        print("🤖 Loading AI model...")
-        # Test model initialization
-        test_predictor = HealthRiskPredictor()
-        print("✅ AI model loaded")
+        status = predictor.get_status()
+        print(f"🤖 AI model: {status['mode']} mode (predictor started in {status['startup_ms']:.1f} ms)")
         print("🚀 Server running on http://localhost:5000")
         print("\n" + "="*50)
         print("Demo Credentials (Email/Password):")
@@ -0,0 +1,1420 @@
+"""
+PERFORMANCE BENCHMARKS
+Throughput + latency measurements for the API, models and data layer
+
+Usage:
+    python benchmarks.py                      # list benchmarks
+    python benchmarks.py batch-predict rows=1000
+"""
+
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """Register a benchmark under a command-line name"""
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+def load_app():
+    """Import app.py against a fresh temporary database"""
+    os.environ['HEALTH_DB_PATH'] = os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+    import app
+
+    app.init_db()
+    app.predictor.wait_until_ready()  # Measure the model, not the startup fallback rules
+    return app
+
+
+def sample_vitals(n, seed=42):
+    """Random in-range vitals readings (as JSON-ready dicts)"""
+    rng = np.random.default_rng(seed)
+    return [
+        {
+            'user_id': 1,
+            'age': int(rng.integers(18, 90)),
+            'bp_systolic': int(rng.integers(90, 200)),
+            'bp_diastolic': int(rng.integers(60, 120)),
+            'blood_sugar': float(rng.integers(70, 320)),
+            'heart_rate': int(rng.integers(50, 130)),
+            'spo2': int(rng.integers(85, 101))
+        }
+        for _ in range(n)
+    ]
+
+
+def report(title, rows):
+    """Print a small aligned results table"""
+    print(f"\n=== {title} ===")
+    for label, value in rows:
+        print(f"   {label:<36} {value}")
+
+
+@benchmark('batch-predict')
+def bench_batch_predict(rows=500, batch_size=500):
+    """Rows/sec: one POST per reading vs /api/health/predict/batch"""
+    app = load_app()
+    client = app.app.test_client()
+    readings = sample_vitals(rows)
+
+    start = time.perf_counter()
+    for reading in readings:
+        client.post('/api/health/predict', json=reading)
+    single_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for offset in range(0, rows, batch_size):
+        response = client.post('/api/health/predict/batch',
+                               json={'readings': readings[offset:offset + batch_size]})
+        assert response.status_code == 200, response.json
+    batch_seconds = time.perf_counter() - start
+
+    report(f'BATCH PREDICT ({rows} readings)', [
+        ('Single endpoint rows/sec', f'{rows / single_seconds:,.0f}'),
+        (f'Batch endpoint rows/sec (batch={batch_size})', f'{rows / batch_seconds:,.0f}'),
+        ('Speedup', f'{single_seconds / batch_seconds:.1f}x')
+    ])
+
+
+def percentiles(samples_ms):
+    """p50 / p99 / max of a latency sample, formatted"""
+    if not samples_ms:
+        return 'n/a'
+    p50, p99 = np.percentile(samples_ms, [50, 99])
+    return f'p50 {p50:.2f} ms, p99 {p99:.2f} ms, max {max(samples_ms):.2f} ms (n={len(samples_ms)})'
+
+
+@benchmark('predict-latency')
+def bench_predict_latency(requests=600, clients=8):
+    """p50/p99 latency of /api/health/predict with and without write-behind"""
+    app = load_app()
+    readings = sample_vitals(requests)
+    chunks = [readings[i::clients] for i in range(clients)]
+
+    rows = []
+    for enabled in (False, True):
+        app.WRITE_BEHIND_ENABLED = enabled
+        latencies = {False: [], True: []}
+
+        def run_client(chunk):
+            client = app.app.test_client()
+            for reading in chunk:
+                start = time.perf_counter()
+                response = client.post('/api/health/predict', json=reading)
+                latencies[response.json['is_emergency']].append((time.perf_counter() - start) * 1000)
+
+        with ThreadPoolExecutor(max_workers=clients) as executor:
+            list(executor.map(run_client, chunks))
+        app.persistence_queue.flush()
+
+        mode = 'write-behind' if enabled else 'synchronous'
+        rows.append((f'{mode} routine', percentiles(latencies[False])))
+        rows.append((f'{mode} emergency', percentiles(latencies[True])))
+
+    rows.append(('write-behind queue', app.persistence_queue.get_metrics()))
+    report(f'PREDICT LATENCY ({requests} requests, {clients} clients)', rows)
+
+
+class _NDJSONBody:
+    """File-like request body that generates NDJSON lines on demand"""
+
+    def __init__(self, readings, rows):
+        self.readings = readings
+        self.rows = rows
+        self.sent = 0
+
+    def readline(self, limit=-1):
+        if self.sent >= self.rows:
+            return b''
+        reading = self.readings[self.sent % len(self.readings)]
+        self.sent += 1
+        return (json.dumps(reading) + '\n').encode()
+
+    def read(self, size=-1):
+        return self.readline()
+
+
+@benchmark('stream-ingest')
+def bench_stream_ingest(rows=20000):
+    """Rows/sec and peak memory of /api/health/stream at growing stream lengths"""
+    from werkzeug.test import EnvironBuilder, run_wsgi_app
+
+    app = load_app()
+    readings = sample_vitals(1000)
+
+    results = []
+    for length in (rows // 10, rows):
+        # Unknown-length (chunked-style) upload read straight from wsgi.input
+        environ = EnvironBuilder(path='/api/health/stream', method='POST',
+                                 content_type='application/x-ndjson').get_environ()
+        environ.pop('CONTENT_LENGTH', None)
+        environ['wsgi.input'] = _NDJSONBody(readings, length)
+        environ['wsgi.input_terminated'] = True
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        app_iter, _, _ = run_wsgi_app(app.app, environ)
+        acks = sum(1 for _ in app_iter)  # consume the streamed acknowledgements
+        seconds = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results.append((f'{length:,} rows ({acks} acks)',
+                        f'{length / seconds:,.0f} rows/sec, peak {peak / 1024:,.0f} KiB'))
+
+    report('STREAM INGEST', results)
+
+
+@benchmark('emergency-list')
+def bench_emergency_list(rows=100000, repeat=20):
+    """Latency of /api/doctor/emergencies pages vs the old unpaginated query"""
+    app = load_app()
+    client = app.app.test_client()
+    rng = np.random.default_rng(7)
+    types = ['SOS_MANUAL', 'CRITICAL_SPO2', 'CRITICAL_BP, HIGH_AI_RISK', 'HIGH_AI_RISK']
+
+    # Spread created_at over the last 30 days, many rows per second
+    start_time = time.time() - 30 * 86400
+    emergency_rows = [
+        (1, types[rng.integers(len(types))], 'ACTIVE', "{'spo2': 88}",
+         time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(start_time + i * 30 * 86400 / rows)),
+         int(rng.integers(1, 11)))
+        for i in range(rows)
+    ]
+    with app.get_db() as conn:
+        conn.executemany('''
+            INSERT INTO emergencies (user_id, emergency_type, status, vitals_summary, created_at, severity)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', emergency_rows)
+        conn.commit()
+
+    def timed(url):
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            response = client.get(url)
+            samples.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.json
+        return percentiles(samples), response
+
+    def unpaginated():
+        # The endpoint before pagination: every ACTIVE row, every column
+        with app.get_db() as conn:
+            emergencies = conn.execute('''
+                SELECT e.*, u.name, u.phone, u.abha_id
+                FROM emergencies e
+                JOIN users u ON e.user_id = u.id
+                WHERE e.status = 'ACTIVE'
+                ORDER BY e.created_at DESC
+            ''').fetchall()
+        return json.dumps({'emergencies': [dict(e) for e in emergencies]})
+
+    samples = []
+    for _ in range(max(1, repeat // 5)):
+        start = time.perf_counter()
+        body = unpaginated()
+        samples.append((time.perf_counter() - start) * 1000)
+    results = [('Unpaginated (old endpoint)', f'{percentiles(samples)}, {len(body) / 2**20:.1f} MiB')]
+
+    first_page, response = timed('/api/doctor/emergencies?limit=50')
+    results.append(('First page (limit=50)', first_page))
+
+    # Walk halfway down with cursors, then time the page there
+    cursor = response.json['next_cursor']
+    for _ in range(rows // 2 // 500):
+        cursor = client.get(f'/api/doctor/emergencies?limit=500&fields=id&cursor={cursor}').json['next_cursor']
+    results.append((f'Page at row {rows // 2:,} (cursor)',
+                    timed(f'/api/doctor/emergencies?limit=50&cursor={cursor}')[0]))
+
+    results.append(('Sparse fields (limit=50)',
+                    timed('/api/doctor/emergencies?limit=50&fields=emergency_type,severity')[0]))
+    results.append(('emergency_type=CRITICAL_SPO2',
+                    timed('/api/doctor/emergencies?limit=50&emergency_type=CRITICAL_SPO2')[0]))
+    results.append(('min_severity=9',
+                    timed('/api/doctor/emergencies?limit=50&min_severity=9')[0]))
+    since = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(start_time + 86400))
+    until = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(start_time + 2 * 86400))
+    results.append(('Time window (1 day, 30 days back)',
+                    timed(f'/api/doctor/emergencies?limit=50&since={since}&until={until}')[0]))
+
+    report(f'EMERGENCY LIST ({rows:,} active emergencies)', results)
+
+
+@benchmark('dashboard-cache')
+def bench_dashboard_cache(requests=2000, users=50):
+    """Patient dashboard latency: uncached vs cache hit vs 304 revalidation"""
+    app = load_app()
+    client = app.app.test_client()
+    readings = sample_vitals(users * 10)
+    for i, reading in enumerate(readings):
+        reading['user_id'] = 1 + i % users
+    client.post('/api/health/predict/batch', json=readings)
+
+    def run(headers_for):
+        samples = []
+        for i in range(requests):
+            user_id = 1 + i % users
+            start = time.perf_counter()
+            client.get(f'/api/patient/dashboard/{user_id}', headers=headers_for(user_id))
+            samples.append((time.perf_counter() - start) * 1000)
+        return percentiles(samples)
+
+    etags = {}
+    for user_id in range(1, users + 1):
+        etags[user_id] = client.get(f'/api/patient/dashboard/{user_id}').headers['ETag']
+
+    results = []
+    app.dashboard_cache.ttl_seconds = 0  # Every lookup misses
+    app.dashboard_cache.clear()
+    results.append(('Uncached (3 queries per request)', run(lambda user_id: {})))
+    app.dashboard_cache.ttl_seconds = app.DASHBOARD_CACHE_TTL
+    results.append(('Cache hit (200)', run(lambda user_id: {})))
+    results.append(('Cache hit + If-None-Match (304)', run(lambda user_id: {'If-None-Match': etags[user_id]})))
+    results.append(('dashboard_cache', app.dashboard_cache.get_metrics()))
+    report(f'PATIENT DASHBOARD ({requests} requests, {users} patients)', results)
+
+
+@benchmark('password-hash')
+def bench_password_hash(logins=200, clients=32, sos=100):
+    """Login throughput/latency and concurrent SOS latency at different KDF pool sizes"""
+    from security_privacy_system import PasswordHashingService, HashingOverloaded
+
+    app = load_app()
+    sos_client = app.app.test_client()
+    original_hasher = app.password_hasher
+
+    results = []
+    for workers in (1, 2, 4, 8):
+        app.password_hasher = PasswordHashingService(max_workers=workers, max_queue=clients)
+        stored = app.password_hasher.hash_password('doctor123')
+        login_ms, sos_ms, rejected = [], [], [0]
+
+        def login(_):
+            start = time.perf_counter()
+            try:
+                app.password_hasher.verify_password('doctor123', stored)
+            except HashingOverloaded:
+                rejected[0] += 1
+                return
+            login_ms.append((time.perf_counter() - start) * 1000)
+
+        def sos_burst():
+            for _ in range(sos):
+                start = time.perf_counter()
+                sos_client.post('/api/emergency/sos', json={'user_id': 1})
+                sos_ms.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients + 1) as executor:
+            sos_future = executor.submit(sos_burst)
+            list(executor.map(login, range(logins)))
+            sos_future.result()
+        seconds = time.perf_counter() - start
+        app.password_hasher.shutdown()
+
+        results.append((f'{workers} workers: logins',
+                        f'{len(login_ms) / seconds:,.1f}/sec, {percentiles(login_ms)}, rejected {rejected[0]}'))
+        results.append((f'{workers} workers: SOS during burst', percentiles(sos_ms)))
+
+    app.password_hasher = original_hasher
+    report(f'PASSWORD HASHING ({logins} logins, {clients} clients, scrypt n=2^14)', results)
+
+
+@benchmark('session-token')
+def bench_session_token(iterations=100000, revoked=10000):
+    """Per-request auth cost (microseconds) of signed session tokens"""
+    from security_privacy_system import SecureTokenManager
+
+    tokens = SecureTokenManager(ttl_seconds=3600)
+    token = tokens.generate_token(42, 'doctor')
+    tampered = token[:-4] + ('AAAA' if not token.endswith('AAAA') else 'BBBB')
+    for user_id in range(revoked):
+        tokens.revoke_token(tokens.generate_token(user_id, 'patient'))
+
+    def per_call_us(func, arg):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func(arg)
+        return f'{(time.perf_counter() - start) / iterations * 1e6:.2f} us'
+
+    results = [
+        ('generate_token', per_call_us(lambda user_id: tokens.generate_token(user_id, 'doctor'), 42)),
+        ('verify_token (valid)', per_call_us(tokens.verify_token, token)),
+        ('verify_token (bad signature)', per_call_us(tokens.verify_token, tampered)),
+        (f'verify_token ({revoked:,} revoked held)', per_call_us(tokens.verify_token, token))
+    ]
+
+    tokens.add_key('k2', os.urandom(32))
+    results.append(('verify_token (old key, rotated)', per_call_us(tokens.verify_token, token)))
+
+    # Whole request: Bearer header parse + verify inside Flask
+    app = load_app()
+    client = app.app.test_client()
+    headers = {'Authorization': f'Bearer {app.session_tokens.generate_token(2, "doctor")}'}
+    samples = []
+    for _ in range(2000):
+        start = time.perf_counter()
+        client.get('/api/auth/session', headers=headers)
+        samples.append((time.perf_counter() - start) * 1000)
+    results.append(('GET /api/auth/session (full request)', percentiles(samples)))
+
+    report('SESSION TOKENS', results)
+
+
+@benchmark('tree-inference')
+def bench_tree_inference(iterations=500, rows=10000):
+    """Per-call latency of sklearn predict/predict_proba vs the compiled tree engine"""
+    from advanced_ai_model import AdvancedHealthRiskPredictor
+    from ai_model import HealthRiskPredictor
+
+    predictor = HealthRiskPredictor()
+    advanced = AdvancedHealthRiskPredictor()
+    readings = sample_vitals(rows)
+    X = np.array([[reading[name] for name in advanced.feature_names] for reading in readings], dtype=float)
+
+    def per_call_ms(func, count=iterations):
+        samples = []
+        for i in range(count):
+            start = time.perf_counter()
+            func(i % rows)
+            samples.append((time.perf_counter() - start) * 1000)
+        return percentiles(samples)
+
+    results = []
+    risk_model = predictor.load_sklearn_model()
+    model, engine = risk_model, predictor.engine
+    results.append(('risk RF sklearn predict+proba', per_call_ms(
+        lambda i: (model.predict(X[i:i + 1]), model.predict_proba(X[i:i + 1])))))
+    results.append(('risk RF compiled', per_call_ms(lambda i: engine.predict_proba(X[i:i + 1]))))
+    results.append(('HealthRiskPredictor.predict()', per_call_ms(lambda i: predictor.predict(readings[i]))))
+
+    X_scaled = advanced.scaler.transform(X)
+    for risk_type, model in advanced.load_sklearn_models().items():
+        engine = advanced.engines[risk_type]
+        label = f"{risk_type} {'GB' if engine.kind == 'boosting' else 'RF'}"
+        results.append((f'{label} sklearn predict+proba', per_call_ms(
+            lambda i: (model.predict(X_scaled[i:i + 1]), model.predict_proba(X_scaled[i:i + 1])))))
+        results.append((f'{label} compiled', per_call_ms(lambda i: engine.predict_proba(X_scaled[i:i + 1]))))
+        assert np.array_equal(engine.predict_proba_compiled(X_scaled), model.predict_proba(X_scaled))
+
+    assert np.array_equal(predictor.engine.predict_proba_compiled(X), risk_model.predict_proba(X))
+    results.append((f'bit-identical on {rows:,} rows', 'yes (all models)'))
+
+    start = time.perf_counter()
+    risk_model.predict_proba(X)
+    sklearn_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    predictor.engine.predict_proba_compiled(X)
+    compiled_seconds = time.perf_counter() - start
+    results.append((f'risk RF batch of {rows:,} (sklearn)', f'{sklearn_seconds * 1000:.1f} ms'))
+    results.append((f'risk RF batch of {rows:,} (compiled walk)', f'{compiled_seconds * 1000:.1f} ms'))
+
+    report(f'TREE INFERENCE ({iterations} single-row calls each)', results)
+
+
+@benchmark('inference-batching')
+def bench_inference_batching(clients=200, requests=4000, sklearn_requests=1000):
+    """Throughput + latency at many concurrent clients, with and without micro-batching"""
+    app = load_app()
+    predictor = app.predictor
+    engine = predictor.engine
+    readings = sample_vitals(requests)
+
+    def run(count, call):
+        # Every client thread starts together, like a burst of dashboard traffic
+        barrier = threading.Barrier(clients)
+        latencies = []
+
+        def client_thread(index):
+            barrier.wait()
+            for reading in readings[index:count:clients]:
+                start = time.perf_counter()
+                call(reading)
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients) as executor:
+            list(executor.map(client_thread, range(clients)))
+        seconds = time.perf_counter() - start
+        return f'{count / seconds:,.0f} req/s, {percentiles(latencies)}'
+
+    http = app.app.test_client()
+    scenarios = [
+        ('predict() compiled', engine, requests, predictor.predict),
+        ('predict() sklearn', None, sklearn_requests, predictor.predict),
+        ('POST /api/health/predict', engine, requests,
+         lambda reading: http.post('/api/health/predict', json=reading))
+    ]
+
+    results = []
+    for label, scenario_engine, count, call in scenarios:
+        predictor.engine = scenario_engine
+        for batching in (False, True):
+            predictor.batcher = app.inference_batcher if batching else None
+            results.append((f"{label} {'batched' if batching else 'direct'}", run(count, call)))
+        app.persistence_queue.flush()
+    predictor.engine = engine
+
+    # Light traffic: a lone client must not pay for the window
+    for batching in (False, True):
+        predictor.batcher = app.inference_batcher if batching else None
+        samples = []
+        for reading in readings[:500]:
+            start = time.perf_counter()
+            predictor.predict(reading)
+            samples.append((time.perf_counter() - start) * 1000)
+        results.append((f"single client {'batched' if batching else 'direct'}", percentiles(samples)))
+
+    results.append(('batcher', app.inference_batcher.get_metrics()))
+    report(f'INFERENCE BATCHING ({clients} concurrent clients)', results)
+
+
+_WORKER_RSS_SCRIPT = '''
+import os, sys, tempfile
+os.environ['HEALTH_DB_PATH'] = os.path.join(tempfile.mkdtemp(), 'worker.db')
+import app
+app.init_db()
+app.predictor.wait_until_ready()
+app.predictor.predict(dict(age=50, bp_systolic=130, bp_diastolic=85, blood_sugar=110, heart_rate=80, spo2=97))
+print([line.split()[1] for line in open('/proc/self/status') if line.startswith('VmRSS')][0])
+'''
+
+
+def _rss_mib(pid):
+    """Resident memory of a running process (Linux /proc)"""
+    with open(f'/proc/{pid}/status') as f:
+        kib = next(int(line.split()[1]) for line in f if line.startswith('VmRSS'))
+    return kib / 1024
+
+
+_STARTUP_SCRIPT = '''
+import json, os, tempfile, time
+os.environ['HEALTH_DB_PATH'] = os.path.join(tempfile.mkdtemp(), 'startup.db')
+start = time.perf_counter()
+import app
+import_ms = (time.perf_counter() - start) * 1000
+app.init_db()
+client = app.app.test_client()
+reading = dict(user_id=1, age=50, bp_systolic=130, bp_diastolic=85, blood_sugar=110, heart_rate=80, spo2=97)
+first = client.post('/api/health/predict', json=reading)
+first_ms = (time.perf_counter() - start) * 1000
+ready_code = client.get('/api/ready').status_code
+app.predictor.wait_until_ready()
+status = app.predictor.get_status()
+print(json.dumps({'import_ms': import_ms, 'first_response_ms': first_ms, 'first_status': first.status_code,
+                  'ready_code': ready_code, 'startup_ms': status['startup_ms'], 'ready_ms': status['ready_ms'],
+                  'fallback_predictions': status['fallback_predictions']}))
+'''
+
+
+@benchmark('startup')
+def bench_startup(runs=3):
+    """App import time and time to model readiness: blocking vs background load, cold vs warm"""
+    import subprocess
+
+    results = []
+    for cold in (True, False):
+        for background in (False, True):
+            env = dict(os.environ, MODEL_BACKGROUND_LOAD='1' if background else '0',
+                       MODEL_REGISTRY_DIR=tempfile.mkdtemp())
+            env.pop('INFERENCE_SOCKET', None)
+            samples = []
+            for _ in range(runs):
+                if cold:
+                    env['MODEL_REGISTRY_DIR'] = tempfile.mkdtemp()  # Empty registry forces training
+                output = subprocess.run([sys.executable, '-c', _STARTUP_SCRIPT], env=env,
+                                        capture_output=True, text=True, check=True).stdout
+                # The loader thread may print on the same line
+                samples.append(json.loads(output[output.index('{"import_ms"'):].split('}')[0] + '}'))
+            if not cold:
+                samples = samples[1:] or samples  # First warm run may still write the model file
+
+            def median(key):
+                return float(np.median([sample[key] for sample in samples]))
+
+            label = f"{'cold (train)' if cold else 'warm (load)'}, {'background' if background else 'blocking'}"
+            results.append((f'{label}: import app', f"{median('import_ms'):,.0f} ms "
+                                                    f"(predictor {median('startup_ms'):,.1f} ms)"))
+            results.append((f'{label}: first response', f"{median('first_response_ms'):,.0f} ms "
+                                                        f"(served by {'rules' if samples[0]['fallback_predictions'] else 'model'})"))
+            results.append((f'{label}: model ready', f"{median('ready_ms'):,.0f} ms after predictor start "
+                                                     f"(/api/ready at first request: {samples[0]['ready_code']})"))
+
+    report(f'STARTUP (median of {runs} runs)', results)
+
+
+_COLD_START_SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+import numpy as np
+mode, path = sys.argv[1:3]
+if mode == 'pickle':
+    import joblib
+    from tree_inference import compile_model
+    saved = joblib.load(path)
+    models = saved['models'] if isinstance(saved, dict) else {'risk': saved}
+    engines = {name: compile_model(model) for name, model in models.items()}
+else:
+    from model_artifact import load_artifact
+    engines = load_artifact(path).engines
+load_ms = (time.perf_counter() - start) * 1000
+for engine in engines.values():
+    engine.predict_proba(np.array([[50, 130, 85, 110, 80, 97]], dtype=float))
+first_ms = (time.perf_counter() - start) * 1000
+print(json.dumps({'load_ms': load_ms, 'first_prediction_ms': first_ms}), flush=True)
+sys.stdin.read()  # Stay resident until the parent has measured memory
+'''
+
+
+def _pss_mib(pid):
+    """Proportional set size (shared pages split between their users), Linux /proc"""
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        kib = next(int(line.split()[1]) for line in f if line.startswith('Pss:'))
+    return kib / 1024
+
+
+@benchmark('cold-start')
+def bench_cold_start(runs=5, workers=4):
+    """Model load time and worker memory: unpickling sklearn vs memory-mapped array artifacts"""
+    import subprocess
+
+    from advanced_ai_model import AdvancedHealthRiskPredictor
+    from ai_model import HealthRiskPredictor
+
+    # Both leave their pickle and an up-to-date array export behind
+    HealthRiskPredictor()
+    AdvancedHealthRiskPredictor()
+    sources = (
+        ('risk', HealthRiskPredictor.MODEL_PATH, HealthRiskPredictor.ARTIFACT_PATH),
+        ('advanced', AdvancedHealthRiskPredictor.MODEL_PATH, AdvancedHealthRiskPredictor.ARTIFACT_PATH)
+    )
+
+    def start(mode, path):
+        return subprocess.Popen([sys.executable, '-c', _COLD_START_SCRIPT, mode, path],
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+
+    results = []
+    for name, pickle_path, artifact_path in sources:
+        for mode, path in (('pickle', pickle_path), ('mmap', artifact_path)):
+            samples = []
+            for _ in range(runs):
+                process = start(mode, path)
+                samples.append(json.loads(process.stdout.readline()))
+                process.communicate('')
+
+            # Concurrent workers, measured once all of them have loaded
+            processes = [start(mode, path) for _ in range(workers)]
+            for process in processes:
+                process.stdout.readline()
+            rss = np.mean([_rss_mib(process.pid) for process in processes])
+            pss = np.mean([_pss_mib(process.pid) for process in processes])
+            for process in processes:
+                process.communicate('')
+
+            size = sum(os.path.getsize(os.path.join(root, file))
+                       for root, _, files in os.walk(path) for file in files) if os.path.isdir(path) \
+                else os.path.getsize(path)
+            median = {key: float(np.median([sample[key] for sample in samples])) for key in samples[0]}
+            label = f'{name} {mode}'
+            results.append((f'{label}: load', f"{median['load_ms']:,.0f} ms "
+                                              f"(first prediction {median['first_prediction_ms']:,.0f} ms)"))
+            results.append((f'{label}: on disk', f'{size / 1024:,.0f} KiB'))
+            results.append((f'{label}: per worker', f'RSS {rss:,.1f} MiB, PSS {pss:,.1f} MiB '
+                                                    f'({workers} workers)'))
+
+    report(f'COLD START (median of {runs} runs, imports included)', results)
+
+
+@benchmark('inference-sidecar')
+def bench_inference_sidecar(workers=4, requests=2000, clients=8):
+    """Memory per web worker and predict latency: in-process model vs inference sidecar"""
+    import subprocess
+
+    from inference_server import InferenceClient
+
+    socket_path = os.path.join(tempfile.mkdtemp(), 'inference.sock')
+    sidecar = subprocess.Popen([sys.executable, 'inference_server.py', socket_path],
+                               stdout=subprocess.DEVNULL)
+    try:
+        deadline = time.time() + 120
+        while not os.path.exists(socket_path):
+            if time.time() > deadline or sidecar.poll() is not None:
+                raise RuntimeError('Inference sidecar did not start')
+            time.sleep(0.1)
+
+        def worker_rss(env_socket):
+            env = dict(os.environ)
+            env.pop('INFERENCE_SOCKET', None)
+            if env_socket:
+                env['INFERENCE_SOCKET'] = env_socket
+            output = subprocess.run([sys.executable, '-c', _WORKER_RSS_SCRIPT], env=env,
+                                    capture_output=True, text=True, check=True).stdout
+            return int(output.strip().splitlines()[-1]) / 1024
+
+        local_mib = worker_rss(None)
+        remote_mib = worker_rss(socket_path)
+        sidecar_mib = _rss_mib(sidecar.pid)
+
+        results = [
+            ('worker RSS, in-process models', f'{local_mib:.1f} MiB'),
+            ('worker RSS, sidecar client', f'{remote_mib:.1f} MiB'),
+            ('sidecar RSS (all models)', f'{sidecar_mib:.1f} MiB'),
+            (f'{workers} workers in-process', f'{workers * local_mib:.1f} MiB'),
+            (f'{workers} workers + sidecar', f'{workers * remote_mib + sidecar_mib:.1f} MiB')
+        ]
+
+        from ai_model import HealthRiskPredictor
+
+        local = HealthRiskPredictor()
+        client = InferenceClient(socket_path, pool_size=clients)
+        remote = HealthRiskPredictor(inference_client=client)
+        readings = sample_vitals(requests)
+        X = np.array([[reading[name] for name in ('age', 'bp_systolic', 'bp_diastolic',
+                                                   'blood_sugar', 'heart_rate', 'spo2')]
+                      for reading in readings], dtype=float)
+        assert np.array_equal(local.predict_proba(X), remote.predict_proba(X))
+
+        for label, predictor in (('in-process', local), ('sidecar', remote)):
+            samples = []
+            for reading in readings:
+                start = time.perf_counter()
+                predictor.predict(reading)
+                samples.append((time.perf_counter() - start) * 1000)
+            results.append((f'predict() {label}, 1 client', percentiles(samples)))
+
+            samples = []
+
+            def run_client(chunk):
+                for reading in chunk:
+                    start = time.perf_counter()
+                    predictor.predict(reading)
+                    samples.append((time.perf_counter() - start) * 1000)
+
+            with ThreadPoolExecutor(max_workers=clients) as executor:
+                list(executor.map(run_client, [readings[i::clients] for i in range(clients)]))
+            results.append((f'predict() {label}, {clients} clients', percentiles(samples)))
+
+            start = time.perf_counter()
+            predictor.predict_proba(X)
+            results.append((f'predict_proba {label}, {len(X):,} rows',
+                            f'{(time.perf_counter() - start) * 1000:.1f} ms'))
+
+        results.append(('client', client.get_metrics()))
+        client.close()
+        report(f'INFERENCE SIDECAR ({workers} workers)', results)
+    finally:
+        sidecar.terminate()
+        sidecar.wait()
+
+
+@benchmark('risk-batch')
+def bench_risk_batch(rows=10000, large_rows=1000000, check=2000):
+    """predict_all_risks per patient vs predict_all_risks_batch at 10k and 1M rows"""
+    import pandas as pd
+
+    from advanced_ai_model import AdvancedHealthRiskPredictor
+
+    predictor = AdvancedHealthRiskPredictor()
+    frame = pd.DataFrame(sample_vitals(rows)).drop(columns='user_id')
+
+    start = time.perf_counter()
+    scalar = [predictor.predict_all_risks(vitals) for vitals in frame.to_dict('records')]
+    scalar_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = predictor.predict_all_risks_batch(frame)
+    batch_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    materialized = batch.to_list()
+    materialize_seconds = time.perf_counter() - start
+
+    mismatches = sum(materialized[i] != scalar[i] for i in range(min(check, rows)))
+    results = [
+        (f'{rows:,} rows predict_all_risks loop', f'{scalar_seconds:.2f} s ({rows / scalar_seconds:,.0f} rows/s)'),
+        (f'{rows:,} rows batch (arrays)', f'{batch_seconds:.3f} s ({rows / batch_seconds:,.0f} rows/s)'),
+        (f'{rows:,} rows batch + all dicts', f'{batch_seconds + materialize_seconds:.2f} s'),
+        (f'rows differing from scalar (of {min(check, rows):,})', mismatches)
+    ]
+
+    rng = np.random.default_rng(1)
+    large = np.column_stack([
+        rng.integers(18, 90, large_rows), rng.integers(90, 200, large_rows),
+        rng.integers(60, 120, large_rows), rng.integers(70, 320, large_rows),
+        rng.integers(50, 130, large_rows), rng.integers(85, 101, large_rows)
+    ]).astype(float)
+    tracemalloc.start()
+    start = time.perf_counter()
+    large_batch = predictor.predict_all_risks_batch(large)
+    large_seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    results.append((f'{large_rows:,} rows batch (arrays)',
+                    f'{large_seconds:.2f} s ({large_rows / large_seconds:,.0f} rows/s), '
+                    f'peak {peak / 2**20:,.0f} MiB'))
+    results.append((f'{large_rows:,} rows scalar (extrapolated)', f'{scalar_seconds * large_rows / rows:,.0f} s'))
+    critical = int((large_batch.status_band == 0).sum())
+    results.append(('CRITICAL rows in 1M batch', f'{critical:,}'))
+
+    report('ADVANCED RISK BATCH', results)
+
+
+@benchmark('fused-risk')
+def bench_fused_risk(iterations=500, holdout=20000, batch_rows=32):
+    """Separate engines vs joint walk vs fused multi-output forest: accuracy, latency, memory"""
+    import pickle
+
+    from advanced_ai_model import AdvancedHealthRiskPredictor
+    from tree_inference import compile_model
+
+    predictor = AdvancedHealthRiskPredictor(fused=True)  # Unpickles: fused model isn't in the array export
+    accuracy = predictor.evaluate_fused_model(n_samples=holdout)
+    fused_engine = compile_model(predictor.fused_model)
+    joint = predictor.joint_engine
+    risk_types = predictor.RISK_TYPES
+
+    X = (predictor.generate_synthetic_training_data(holdout, seed=7)[0] - predictor.scaler.mean_) \
+        / predictor.scaler.scale_
+    joint_proba = joint.predict_proba_compiled(X)
+    identical = all(np.array_equal(joint_proba[risk_type], predictor.models[risk_type].predict_proba(X))
+                    for risk_type in risk_types)
+    fused_proba = fused_engine.predict_proba(X)
+    max_gap = max(float(np.abs(fused_proba[i][:, 1] - joint_proba[risk_type][:, 1]).max())
+                  for i, risk_type in enumerate(risk_types))
+
+    results = [(f'{risk_type} holdout accuracy (separate / fused)',
+                f"{accuracy[risk_type]['separate']:.2%} / {accuracy[risk_type]['fused']:.2%}")
+               for risk_type in risk_types]
+    results.append(('joint walk identical to separate models', identical))
+    results.append(('max |fused - separate| P(high)', f'{max_gap:.3f}'))
+
+    paths = (
+        ('separate engines', lambda rows: [predictor.engines[risk_type].predict_proba(rows)
+                                           for risk_type in risk_types]),
+        ('joint walk', joint.predict_proba),
+        ('fused forest', fused_engine.predict_proba)
+    )
+    for size in (1, batch_rows):
+        rows = X[:size]
+        for label, func in paths:
+            start = time.perf_counter()
+            for _ in range(iterations):
+                func(rows)
+            results.append((f'{label}, {size} row(s)', f'{(time.perf_counter() - start) / iterations * 1000:.3f} ms'))
+
+    separate_bytes = sum(engine.nbytes for engine in predictor.engines.values())
+    results.append(('node arrays: separate engines', f'{separate_bytes / 1024:,.0f} KiB'))
+    results.append(('node arrays: + joint walk', f'{(separate_bytes + joint.nbytes) / 1024:,.0f} KiB'))
+    results.append(('node arrays: fused forest', f'{fused_engine.nbytes / 1024:,.0f} KiB'))
+    separate_pickle = sum(len(pickle.dumps(predictor.models[risk_type])) for risk_type in risk_types)
+    results.append(('pickled models: separate / fused',
+                    f'{separate_pickle / 1024:,.0f} / {len(pickle.dumps(predictor.fused_model)) / 1024:,.0f} KiB'))
+    results.append((f'fused within {predictor.FUSED_TOLERANCE:.1%} tolerance',
+                    predictor.fused_within_tolerance()))
+
+    report('FUSED RISK MODEL', results)
+
+
+@benchmark('model-reload')
+def bench_model_reload(seconds=3.0, clients=8, reload_every_ms=50):
+    """Predict latency/errors while hot-reloading registry versions, and shadow scoring cost"""
+    import copy
+
+    from ai_model import FEATURES, HealthRiskPredictor
+    from model_artifact import export_artifact
+    from model_registry import ModelRegistry
+
+    registry = ModelRegistry(tempfile.mkdtemp())
+    predictor = HealthRiskPredictor(registry=registry)
+    name = predictor.REGISTRY_NAME
+    first = predictor.version
+
+    # Candidate: the same forest pruned to 30 trees (different probabilities)
+    current = predictor.load_sklearn_model()
+    candidate = copy.deepcopy(current)
+    candidate.estimators_ = candidate.estimators_[:30]
+    candidate.n_estimators = 30
+    second = registry.publish(name, candidate, metadata={'note': 'pruned to 30 trees'}, activate=False,
+                              export=lambda path: export_artifact(path, {name: candidate}, FEATURES))
+
+    rows = np.array([[reading[feature] for feature in ('age', 'bp_systolic', 'bp_diastolic',
+                                                       'blood_sugar', 'heart_rate', 'spo2')]
+                     for reading in sample_vitals(500)], dtype=float)
+    expected = [current.predict_proba(rows), candidate.predict_proba(rows)]
+
+    def hammer(during=None):
+        """Clients call predict_proba for `seconds`; returns (latencies, errors, bad results)"""
+        stop = time.monotonic() + seconds
+        samples, errors, wrong = [], [0], [0]
+
+        def run_client(offset):
+            i = offset
+            while time.monotonic() < stop:
+                row = rows[i % len(rows)]
+                start = time.perf_counter()
+                try:
+                    proba = predictor.predict_proba(row.reshape(1, -1))[0]
+                except Exception:
+                    errors[0] += 1
+                    continue
+                samples.append((time.perf_counter() - start) * 1000)
+                if not any(np.array_equal(proba, version_proba[i % len(rows)]) for version_proba in expected):
+                    wrong[0] += 1
+                i += clients
+
+        threads = [threading.Thread(target=run_client, args=(offset,)) for offset in range(clients)]
+        for thread in threads:
+            thread.start()
+        if during is not None:
+            during(stop)
+        for thread in threads:
+            thread.join()
+        return samples, errors[0], wrong[0]
+
+    results = []
+    samples, errors, wrong = hammer()
+    results.append(('steady (no reloads)', percentiles(samples)))
+
+    reload_ms = []
+
+    def keep_reloading(stop):
+        versions = (second, first)
+        while time.monotonic() < stop:
+            registry.activate(name, versions[len(reload_ms) % 2])
+            start = time.perf_counter()
+            predictor.reload()
+            reload_ms.append((time.perf_counter() - start) * 1000)
+            time.sleep(reload_every_ms / 1000)
+
+    samples, errors, wrong = hammer(keep_reloading)
+    results.append((f'during {len(reload_ms)} reloads', percentiles(samples)))
+    results.append(('failed / wrong-model results', f'{errors} / {wrong} of {len(samples) + errors:,}'))
+    results.append(('reload (load + verify + swap)', percentiles(reload_ms)))
+
+    registry.activate(name, first)
+    predictor.reload()
+    predictor.start_shadow(second)
+    samples, errors, wrong = hammer()
+    results.append((f'with v{second} shadow-scored', percentiles(samples)))
+    results.append(('shadow', predictor.stop_shadow()))
+
+    report(f'MODEL HOT RELOAD ({clients} clients, {seconds:g} s per phase)', results)
+
+
+@benchmark('risk-table')
+def bench_risk_table(rows=100000, iterations=2000, batch_rows=1000,
+                     coarse='age=2,bp_systolic=2,bp_diastolic=2,blood_sugar=3,heart_rate=2,spo2=1'):
+    """Precomputed risk lookup table vs the compiled forest: size, build time, latency, disagreement"""
+    from ai_model import FEATURES, HealthRiskPredictor
+    from risk_table import RiskTable, build_risk_table
+
+    predictor = HealthRiskPredictor()
+    engine = predictor.engine
+    X = np.array([[reading[name] for name in FEATURES] for reading in sample_vitals(rows)], dtype=float)
+    # Off-grid readings too (e.g. averaged vitals, decimal blood sugar)
+    X = np.vstack([X, X + np.random.default_rng(1).uniform(-0.5, 0.5, X.shape)])
+    live = engine.predict_proba_compiled(X)
+
+    def per_row_us(func):
+        start = time.perf_counter()
+        for i in range(iterations):
+            func(X[i:i + 1])
+        return (time.perf_counter() - start) / iterations * 1e6
+
+    results = [('compiled forest, 1 row', f'{per_row_us(engine.predict_proba):.1f} us')]
+    start = time.perf_counter()
+    engine.predict_proba_compiled(X[:batch_rows])
+    results.append((f'compiled forest, {batch_rows:,} rows', f'{(time.perf_counter() - start) * 1000:.2f} ms'))
+
+    configs = (('exact', {}), ('coarse', {key: float(value) for key, value in
+                                          (item.split('=') for item in coarse.split(',') if item)}))
+    for label, resolution in configs:
+        table = build_risk_table(engine, FEATURES, resolution)
+        path = os.path.join(tempfile.mkdtemp(), 'table')
+        table.save(path)
+        start = time.perf_counter()
+        table = RiskTable.load(path)
+        load_ms = (time.perf_counter() - start) * 1000
+        table.bind(engine)
+
+        proba = table.predict_proba(X)
+        fallback_rate = table.get_metrics()['fallback_rate']
+        disagree = np.mean(np.argmax(proba, axis=1) != np.argmax(live, axis=1))
+        meta = table.meta
+        results.append((f'{label}: cells (covered)', f"{meta['cells']:,} ({meta['covered_cells'] / meta['cells']:.1%})"))
+        results.append((f'{label}: size / codebook rows', f"{table.nbytes / 1024:,.0f} KiB / {meta['codebook_rows']:,}"))
+        results.append((f'{label}: build / load', f"{meta['build_seconds']:.2f} s / {load_ms:.1f} ms"))
+        results.append((f'{label}: lookup, 1 row', f'{per_row_us(table.predict_proba):.1f} us'))
+        start = time.perf_counter()
+        table.predict_proba(X[:batch_rows])
+        results.append((f'{label}: lookup, {batch_rows:,} rows', f'{(time.perf_counter() - start) * 1000:.2f} ms'))
+        results.append((f'{label}: rows sent to the model', f'{fallback_rate:.1%}'))
+        results.append((f'{label}: disagreement / max |diff|',
+                        f'{disagree:.4%} / {np.abs(proba - live).max():.3g} ({len(X):,} rows)'))
+
+    report('RISK LOOKUP TABLE', results)
+
+_RETRAIN_SCRIPT = '''
+import json, sys
+from model_registry import ModelRegistry
+from retraining import retrain
+report = retrain(sys.argv[1], ModelRegistry(sys.argv[2]), max_train_rows=int(sys.argv[3]), n_jobs=int(sys.argv[4]))
+print(json.dumps(report))
+'''
+
+
+def _training_database(rows, chunk=100000):
+    """Database with the app's schema holding rows readings, each with the model's stored prediction"""
+    import sqlite3
+
+    app = load_app()
+    engine = app.predictor.engine
+    with sqlite3.connect(app.DATABASE) as source:
+        schema = [sql for (sql,) in source.execute("SELECT sql FROM sqlite_master "
+                                                   "WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%'")]
+    path = os.path.join(tempfile.mkdtemp(), 'training.db')
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA synchronous = OFF')
+    for sql in schema:
+        conn.execute(sql)
+    rng = np.random.default_rng(3)
+    for start in range(0, rows, chunk):
+        n = min(chunk, rows - start)
+        X = np.column_stack([rng.integers(18, 90, n), rng.integers(90, 200, n), rng.integers(60, 120, n),
+                             rng.integers(70, 320, n), rng.integers(50, 130, n), rng.integers(85, 101, n)])
+        proba = engine.predict_proba(X)
+        best = np.argmax(proba, axis=1)
+        ids = range(start + 1, start + n + 1)
+        conn.executemany('INSERT INTO health_records (id, user_id, age, bp_systolic, bp_diastolic, blood_sugar, '
+                         'heart_rate, spo2) VALUES (?, 1, ?, ?, ?, ?, ?, ?)',
+                         ((i, *row) for i, row in zip(ids, X.tolist())))
+        conn.executemany('INSERT INTO predictions (user_id, record_id, risk_level, risk_score) VALUES (1, ?, ?, ?)',
+                         zip(ids, np.array(['Low', 'Medium', 'High'])[best].tolist(),
+                             proba[np.arange(n), best].tolist()))
+        conn.commit()
+    conn.close()
+    return path
+
+
+@benchmark('retraining')
+def bench_retraining(rows='1000000,10000000', max_train_rows=200000, n_jobs=-1):
+    """Streaming retrain from SQLite: time per stage and peak memory at each table size"""
+    import subprocess
+
+    results = []
+    for size in (int(value) for value in str(rows).split(',')):
+        start = time.perf_counter()
+        db_path = _training_database(size)
+        results.append((f'{size:,} rows: build test database',
+                        f'{time.perf_counter() - start:,.0f} s ({os.path.getsize(db_path) / 2 ** 20:,.0f} MiB)'))
+
+        process = subprocess.Popen([sys.executable, '-c', _RETRAIN_SCRIPT, db_path, tempfile.mkdtemp(),
+                                    str(max_train_rows), str(n_jobs)], stdout=subprocess.PIPE, text=True)
+        output = process.stdout.read()
+        _, status, usage = os.wait4(process.pid, 0)
+        if status:
+            raise RuntimeError(f'retraining exited with status {status}')
+        summary = json.loads(output[output.index('{"rows"'):])
+        timings = summary['timings']
+        results.append((f'{size:,} rows: stream + sample', f"{timings['read']:,.1f} s "
+                                                          f"({summary['rows'] / timings['read']:,.0f} rows/s)"))
+        results.append((f'{size:,} rows: fit ({summary["train_rows"]:,} rows)', f"{timings['fit']:,.1f} s"))
+        results.append((f'{size:,} rows: evaluate + publish',
+                        f"{timings['evaluate'] + timings.get('publish', 0):,.1f} s "
+                        f"(holdout accuracy {summary['metrics']['accuracy']:.2%}, "
+                        f"{'published v' + str(summary['version']) if summary['version'] else summary['failures']})"))
+        results.append((f'{size:,} rows: total / peak RSS',
+                        f"{timings['total']:,.1f} s / {usage.ru_maxrss / 1024:,.0f} MiB"))
+        os.remove(db_path)
+
+    report(f'RETRAINING (sample {max_train_rows:,} rows, n_jobs={n_jobs})', results)
+
+
+@benchmark('bed-allocation')
+def bench_bed_allocation(sizes='1000,10000,100000', operations=20000, occupied=0.9):
+    """HospitalBedManager reserve/confirm/release/availability cost as the bed count grows"""
+    from hospital_intelligence import BedStatus, BedType, HospitalBedManager
+
+    results = []
+    for size in (int(value) for value in str(sizes).split(',')):
+        start = time.perf_counter()
+        manager = HospitalBedManager(inventory=[
+            (BedType.GENERAL, 'GEN', size, ['Basic monitoring'], {'occupied': int(size * occupied)})
+        ])
+        build_ms = (time.perf_counter() - start) * 1000
+
+        def per_op_us(func, count=operations):
+            start = time.perf_counter()
+            for i in range(count):
+                func(i)
+            return (time.perf_counter() - start) / count * 1e6
+
+        # Reserve -> admit -> discharge cycles (each call timed on its own)
+        elapsed = np.zeros(3)
+        for i in range(operations):
+            t0 = time.perf_counter()
+            bed_id = manager.reserve_bed(BedType.GENERAL, f'P{i}', f'E{i}')['bed_id']
+            t1 = time.perf_counter()
+            manager.confirm_admission(f'E{i}')
+            t2 = time.perf_counter()
+            manager.release_bed(bed_id)
+            elapsed += (t1 - t0, t2 - t1, time.perf_counter() - t2)
+        reserve, confirm, release = elapsed / operations * 1e6
+        availability = per_op_us(lambda i: manager.get_availability())
+
+        # The previous representation: one list per type, scanned for the first free bed
+        beds = [{'id': bed_id, 'status': bed['status']} for bed_id, bed in sorted(manager.beds.items())]
+        scan = per_op_us(lambda i: next(bed for bed in beds if bed['status'] == BedStatus.AVAILABLE), count=100)
+
+        results.append((f'{size:,} beds: build', f'{build_ms:,.1f} ms'))
+        results.append((f'{size:,} beds: reserve / confirm / release',
+                        f'{reserve:.2f} / {confirm:.2f} / {release:.2f} us'))
+        results.append((f'{size:,} beds: get_availability() (all types)', f'{availability:.2f} us'))
+        results.append((f'{size:,} beds: linear scan for a free bed', f'{scan:,.2f} us ({occupied:.0%} occupied)'))
+
+    report(f'BED ALLOCATION ({operations:,} operations each)', results)
+
+
+@benchmark('bed-expiry')
+def bench_bed_expiry(beds=100000, reservations=50000, calls=20000):
+    """Reservation expiry: cost per lapsed reservation and per-call check overhead"""
+    from datetime import datetime, timedelta
+
+    from hospital_intelligence import BedStatus, BedType, HospitalBedManager
+
+    manager = HospitalBedManager(inventory=[(BedType.GENERAL, 'GEN', beds, ['Basic monitoring'], {})])
+    released = []
+    manager.add_release_listener(released.append)
+    base = datetime.now()
+
+    # Nothing due: every call pays one heap peek
+    for i in range(reservations):
+        manager.reserve_bed(BedType.GENERAL, f'P{i}', f'E{i}', duration_minutes=30 + i % 60)
+    start = time.perf_counter()
+    for _ in range(calls):
+        manager.get_availability(BedType.GENERAL)
+    with_heap = (time.perf_counter() - start) / calls * 1e6
+    heaps = manager._expiry_heaps
+    heap_size = len(heaps[BedType.GENERAL])
+    manager._expiry_heaps = {}
+    start = time.perf_counter()
+    for _ in range(calls):
+        manager.get_availability(BedType.GENERAL)
+    without_heap = (time.perf_counter() - start) / calls * 1e6
+    manager._expiry_heaps = heaps
+
+    # A third were confirmed: their heap entries are stale and must be skipped, not released
+    for i in range(0, reservations, 3):
+        manager.confirm_admission(f'E{i}')
+    confirmed = len(range(0, reservations, 3))
+
+    # The previous approach: scan every bed for a lapsed reservation
+    horizon = base + timedelta(minutes=120)
+    start = time.perf_counter()
+    lapsed = [bed for bed in manager.beds.values()
+              if bed['status'] == BedStatus.RESERVED and bed['expires_at'] <= horizon]
+    scan_ms = (time.perf_counter() - start) * 1000
+
+    # Expire in 60 one-minute ticks, then everything at once
+    ticks = []
+    for minute in range(30, 90):
+        start = time.perf_counter()
+        ticks.append((len(manager.expire_reservations(base + timedelta(minutes=minute, seconds=1))),
+                      time.perf_counter() - start))
+    expired = sum(count for count, _ in ticks)
+    tick_seconds = sum(seconds for _, seconds in ticks)
+    availability = manager.get_availability(BedType.GENERAL)
+
+    report(f'BED RESERVATION EXPIRY ({beds:,} beds, {reservations:,} reservations)', [
+        ('heap entries', f'{heap_size:,}'),
+        ('get_availability(), nothing due', f'{with_heap:.2f} us ({without_heap:.2f} us without the check)'),
+        ('expired (confirmed ones skipped)', f'{expired:,} of {reservations:,} ({confirmed:,} confirmed)'),
+        ('release events delivered', f'{len(released):,}'),
+        ('expire cost per reservation', f'{tick_seconds / max(expired, 1) * 1e6:.2f} us'),
+        ('expire cost per one-minute tick', f'{tick_seconds / len(ticks) * 1000:.2f} ms'),
+        ('full scan for lapsed beds', f'{scan_ms:,.1f} ms per pass ({len(lapsed):,} found)'),
+        ('available / reserved after expiry', f"{availability['available']:,} / {manager.pools[BedType.GENERAL].count(BedStatus.RESERVED):,}"),
+    ])
+
+
+@benchmark('bed-waiting-list')
+def bench_bed_waiting_list(sizes='1000,10000,100000', operations=5000, seed=0):
+    """Bed waiting list: queue, position, cancel and match-on-release cost as the queue grows"""
+    import bisect
+
+    from hospital_intelligence import BedStatus, BedType, HospitalBedManager
+
+    rng = np.random.default_rng(seed)
+    results = []
+    for size in (int(value) for value in str(sizes).split(',')):
+        manager = HospitalBedManager(inventory=[(BedType.GENERAL, 'GEN', 1, ['Basic monitoring'], {'occupied': 1})])
+        waiting = manager.waiting_lists[BedType.GENERAL]
+        severities = rng.integers(1, 11, size=size + operations).tolist()
+
+        start = time.perf_counter()
+        for i in range(size):
+            manager.reserve_bed(BedType.GENERAL, f'P{i}', f'E{i}', severity=severities[i])
+        queue_us = (time.perf_counter() - start) / size * 1e6
+
+        probes = [f'E{i}' for i in rng.integers(0, size, size=operations)]
+        start = time.perf_counter()
+        for emergency_id in probes:
+            waiting.position(emergency_id)
+        position_us = (time.perf_counter() - start) / operations * 1e6
+
+        # Each release hands the bed to the head of the queue; discharge it again
+        bed_id = next(iter(manager.pools[BedType.GENERAL].by_status[BedStatus.OCCUPIED]))
+        releases = min(operations, size // 2)
+        start = time.perf_counter()
+        for _ in range(releases):
+            manager.release_bed(bed_id)
+        match_us = (time.perf_counter() - start) / releases * 1e6
+
+        cancels = [f'E{i}' for i in rng.permutation(size)[:operations] if f'E{i}' in waiting]
+        start = time.perf_counter()
+        for emergency_id in cancels:
+            manager.cancel_waiting(emergency_id)
+        cancel_us = (time.perf_counter() - start) / max(len(cancels), 1) * 1e6
+
+        # Plain sorted list: insort to add, list.index for the position
+        keys = []
+        start = time.perf_counter()
+        for i in range(size):
+            bisect.insort(keys, (-severities[i], i))
+        insort_us = (time.perf_counter() - start) / size * 1e6
+        lookups = [(-severities[i], i) for i in rng.integers(0, size, size=min(operations, 200))]
+        start = time.perf_counter()
+        for key in lookups:
+            keys.index(key)
+        index_us = (time.perf_counter() - start) / len(lookups) * 1e6
+
+        results.append((f'{size:,} waiting: queue / position / cancel',
+                        f'{queue_us:.2f} / {position_us:.2f} / {cancel_us:.2f} us'))
+        results.append((f'{size:,} waiting: release + match head', f'{match_us:.2f} us'))
+        results.append((f'{size:,} waiting: sorted list insort / index', f'{insort_us:.2f} / {index_us:,.2f} us'))
+
+    report(f'BED WAITING LIST ({operations:,} operations each)', results)
+
+
+def _bed_invariant_errors(manager, busy_expected):
+    """Inconsistencies in a HospitalBedManager's state (empty list: consistent)"""
+    from hospital_intelligence import BedStatus
+
+    errors = []
+    seen = 0
+    for bed_type, pool in manager.pools.items():
+        for status, beds in pool.by_status.items():
+            seen += len(beds)
+            errors += [f'{bed_id} filed under {status.name} but is {bed["status"].name}'
+                       for bed_id, bed in beds.items() if bed['status'] != status or bed['bed_type'] != bed_type]
+    if seen != len(manager.beds):
+        errors.append(f'{seen} beds in pools, {len(manager.beds)} exist')
+
+    busy = [bed for bed in manager.beds.values() if bed['status'] in (BedStatus.RESERVED, BedStatus.OCCUPIED)]
+    if len(busy) != busy_expected:
+        errors.append(f'{len(busy)} beds reserved or occupied, expected {busy_expected}')
+    for bed in busy:
+        if 'emergency_id' in bed and manager.reservations.get(bed['emergency_id'], {}).get('bed_id') != bed['id']:
+            errors.append(f"{bed['id']} held for {bed['emergency_id']} without a matching reservation")
+        if bed.get('emergency_id') in manager._waiting:
+            errors.append(f"{bed.get('emergency_id')} holds {bed['id']} and is still waiting")
+
+    for bed_type, waiting in manager.waiting_lists.items():
+        if len(waiting) != sum(1 for waits_for in manager._waiting.values() if waits_for == bed_type):
+            errors.append(f'{bed_type.name} waiting list out of sync')
+        if len(waiting):
+            for usable in [bed_type] + manager.ALTERNATIVE_BED_TYPES.get(bed_type, []):
+                if manager.pools[usable].count(BedStatus.AVAILABLE):
+                    errors.append(f'{bed_type.name} patients wait while a {usable.name} bed is free')
+    return errors
+
+
+@benchmark('bed-concurrency')
+def bench_bed_concurrency(threads='1,2,4,8,16,32', operations=40000, beds_per_type=10, hold=8,
+                          switch_interval=1e-5, seed=0):
+    """Concurrent reserve/confirm/release stress test: invariants and reservations/sec by thread count"""
+    import random
+
+    from hospital_intelligence import BedStatus, BedType, HospitalBedManager
+
+    bed_types = [BedType.ICU, BedType.HDU, BedType.OXYGEN, BedType.GENERAL]
+    results = []
+    default_interval = sys.getswitchinterval()
+    sys.setswitchinterval(switch_interval)  # Switch threads far more often than usual to provoke races
+    for thread_count in (int(value) for value in str(threads).split(',')):
+        manager = HospitalBedManager(inventory=[
+            (bed_type, bed_type.value, beds_per_type, [], {'occupied': beds_per_type // 5})
+            for bed_type in bed_types
+        ])
+        busy_start = sum(1 for bed in manager.beds.values() if bed['status'] != BedStatus.AVAILABLE)
+        counters = {'freed': 0, 'matched': 0}
+        counters_lock = threading.Lock()
+
+        def on_release(event):
+            with counters_lock:  # Listeners run outside the manager's locks
+                counters['freed'] += 1
+                counters['matched'] += event['matched'] is not None
+        manager.add_release_listener(on_release)
+        owners = {}  # bed_id -> emergency that reserve_bed() handed it to
+        violations = []
+        per_thread = operations // thread_count
+        direct = [0] * thread_count
+        barrier = threading.Barrier(thread_count + 1)
+
+        def worker(index):
+            rng = random.Random(seed * 1000 + index)
+            mine = []  # Emergencies this thread holds a bed or a waiting place for
+            barrier.wait()
+            for i in range(per_thread):
+                emergency_id = f'T{index}-E{i}'
+                result = manager.reserve_bed(rng.choice(bed_types), f'P{index}-{i}', emergency_id,
+                                             severity=rng.randint(1, 10))
+                if result['success']:
+                    direct[index] += 1
+                    holder = owners.setdefault(result['bed_id'], emergency_id)
+                    if holder != emergency_id:
+                        violations.append(f"{result['bed_id']} given to {emergency_id} while {holder} holds it")
+                    if rng.random() < 0.5:
+                        manager.confirm_admission(emergency_id)
+                mine.append(emergency_id)
+
+                while len(mine) > hold:
+                    emergency_id = mine.pop(rng.randrange(len(mine)))
+                    if manager.cancel_waiting(emergency_id):
+                        continue
+                    reservation = manager.reservations.get(emergency_id)
+                    if reservation is None:
+                        continue  # Still being matched; counted via the release events
+                    if owners.get(reservation['bed_id']) == emergency_id:
+                        del owners[reservation['bed_id']]
+                    manager.release_bed(reservation['bed_id'])
+
+        workers = [threading.Thread(target=worker, args=(index,)) for index in range(thread_count)]
+        for thread in workers:
+            thread.start()
+        barrier.wait()
+        start = time.perf_counter()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        busy_expected = busy_start + sum(direct) + counters['matched'] - counters['freed']
+        errors = violations + _bed_invariant_errors(manager, busy_expected)
+        reservations = per_thread * thread_count
+        results.append((f'{thread_count} threads',
+                        f'{reservations / elapsed:,.0f} reservations/s, '
+                        f"{counters['matched']:,} matched from waiting lists, "
+                        f"{'invariants OK' if not errors else f'{len(errors)} VIOLATIONS: ' + errors[0]}"))
+    sys.setswitchinterval(default_interval)
+
+    report(f'BED RESERVATION CONCURRENCY ({operations:,} reserve_bed calls per run, '
+           f'{beds_per_type} beds per type)', results)
+
+
+@benchmark('bed-recovery')
+def bench_bed_recovery(events=1000000, beds=10000, snapshot_every=50000, seed=0):
+    """Event-sourced bed state: logging cost, log size and restart time after N events"""
+    import random
+    import shutil
+
+    from bed_event_store import BedEventStore
+    from hospital_intelligence import BedType, HospitalBedManager
+
+    inventory = [(BedType.GENERAL, 'GEN', beds, ['Basic monitoring'], {'occupied': beds // 2})]
+    path = os.path.join(tempfile.mkdtemp(), 'bed_events.db')
+    rng = random.Random(seed)
+
+    def run_workload(manager, stop):
+        """Reserve (or queue), admit some, release or cancel at random once the ward is full"""
+        held = []
+        i = 0
+        while not stop():
+            i += 1
+            emergency_id = f'E{i}'
+            result = manager.reserve_bed(BedType.GENERAL, f'P{i}', emergency_id, severity=rng.randint(1, 10))
+            if result['success'] and rng.random() < 0.7:
+                manager.confirm_admission(emergency_id)
+            held.append(emergency_id)
+            if len(held) > beds // 2:
+                emergency_id = held.pop(rng.randrange(len(held)))
+                if not manager.cancel_waiting(emergency_id) and emergency_id in manager.reservations:
+                    manager.release_bed(manager.reservations[emergency_id]['bed_id'])
+        return i
+
+    # Same workload without a store, for the per-request logging overhead
+    plain = HospitalBedManager(inventory=inventory)
+    plain_requests = iter(range(100000))
+    start = time.perf_counter()
+    run_workload(plain, lambda: next(plain_requests, None) is None)
+    plain_us = (time.perf_counter() - start) / 100000 * 1e6
+
+    store = BedEventStore(path, snapshot_every=snapshot_every, keep_snapshots=None)
+    manager = HospitalBedManager(inventory=inventory, event_store=store)
+    start = time.perf_counter()
+    requests = run_workload(manager, lambda: store.last_seq >= events)
+    store.flush()
+    log_seconds = time.perf_counter() - start
+    live_state = manager.snapshot_state()
+    snapshots = store.get_metrics()['snapshots']
+    store.close()
+    size_mib = sum(os.path.getsize(path + suffix) for suffix in ('', '-wal') if os.path.exists(path + suffix)) / 2**20
+
+    def recover(from_snapshot):
+        start = time.perf_counter()
+        restarted_store = BedEventStore(path, keep_snapshots=None)
+        restarted = HospitalBedManager(inventory=inventory)
+        stats = restarted_store.recover(restarted._restore_snapshot, restarted._apply_event, from_snapshot)
+        elapsed = time.perf_counter() - start
+        identical = restarted.snapshot_state() == live_state
+        restarted_store.close()
+        return elapsed, stats, identical
+
+    snapshot_seconds, snapshot_stats, snapshot_ok = recover(True)
+    full_seconds, full_stats, full_ok = recover(False)
+    rss = _rss_mib(os.getpid())
+    shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+
+    report(f'BED EVENT LOG RECOVERY ({events:,} events, {beds:,} beds)', [
+        ('requests to produce the log', f'{requests:,} ({log_seconds:.1f} s incl. flush, {events / log_seconds:,.0f} events/s)'),
+        ('reserve_bed round, no log / with log', f'{plain_us:.1f} / {log_seconds / requests * 1e6:.1f} us per request'),
+        ('log size', f'{size_mib:,.1f} MiB ({size_mib * 2**20 / events:.0f} bytes/event), {snapshots} snapshots'),
+        ('restart: newest snapshot + tail', f"{snapshot_seconds * 1000:,.0f} ms "
+                                            f"({snapshot_stats['replayed_events']:,} events replayed, "
+                                            f"state {'identical' if snapshot_ok else 'DIFFERS'})"),
+        ('restart: full replay', f"{full_seconds * 1000:,.0f} ms ({full_stats['replayed_events']:,} events, "
+                                 f"{full_seconds / max(full_stats['replayed_events'], 1) * 1e6:.2f} us/event, "
+                                 f"state {'identical' if full_ok else 'DIFFERS'})"),
+        ('process RSS after recovery', f'{rss:,.0f} MiB'),
+    ])
+
+
+def _parse_value(text):
+    """Parse a key=value argument into int/float/str"""
+    for cast in (int, float):
+        try:
+            return cast(text)
+        except ValueError:
+            pass
+    return text
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print("Available benchmarks:")
+        for name, func in BENCHMARKS.items():
+            print(f"   {name:<24} {func.__doc__}")
+        sys.exit(0 if len(sys.argv) < 2 else 1)
+
+    kwargs = dict(arg.split('=', 1) for arg in sys.argv[2:])
+    BENCHMARKS[sys.argv[1]](**{key: _parse_value(value) for key, value in kwargs.items()})
@@ -0,0 +1,340 @@
+"""
+DATABASE CONNECTION LAYER
+Pooled WAL-mode SQLite connections + lock-contention retry + pool metrics
++ versioned schema migrations + query plan regression checks
+"""
+
+import ast
+import os
+import queue
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Pragmas applied to every pooled connection
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',       # Readers never block the writer
+    'synchronous': 'NORMAL',     # Safe with WAL, avoids an fsync per commit
+    'cache_size': -16000,        # ~16 MB page cache per connection
+    'mmap_size': 268435456,      # 256 MB memory-mapped reads
+    'busy_timeout': 5000,        # Wait up to 5s on a locked database
+    'temp_store': 'MEMORY'
+}
+
+
+def is_lock_error(error: Exception) -> bool:
+    """Check if an error is SQLite lock contention (retryable)"""
+    message = str(error).lower()
+    return isinstance(error, sqlite3.OperationalError) and (
+        'database is locked' in message or 'database is busy' in message
+        or 'database table is locked' in message
+    )
+
+
+def configure_connection(conn: sqlite3.Connection, pragmas: Optional[Dict] = None) -> sqlite3.Connection:
+    """Apply performance pragmas to a connection"""
+    for name, value in (pragmas or DEFAULT_PRAGMAS).items():
+        conn.execute(f'PRAGMA {name} = {value}')
+    return conn
+
+
+class ConnectionPool:
+    """
+    Per-worker pool of reusable SQLite connections
+
+    - Connections stay open between requests (page cache survives)
+    - WAL mode + tuned pragmas on every connection
+    - Writes start with BEGIN IMMEDIATE so lock upgrades never deadlock
+    - run_with_retry() retries a whole transaction with exponential backoff
+    - A forked worker process gets a fresh pool automatically
+    """
+
+    def __init__(self, database: str, max_size: int = 8, timeout: float = 10.0,
+                 pragmas: Optional[Dict] = None, max_retries: int = 5,
+                 retry_base_delay: float = 0.01, retry_max_delay: float = 0.5):
+        self.database = database
+        self.max_size = max_size
+        self.timeout = timeout
+        self.pragmas = pragmas or DEFAULT_PRAGMAS
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+
+        self._lock = threading.Lock()
+        self._reset_pool()
+
+    def _reset_pool(self) -> None:
+        """Start with an empty pool owned by the current process"""
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._metrics = {
+            'checkouts': 0,
+            'connections_created': 0,
+            'total_wait_ms': 0.0,
+            'max_wait_ms': 0.0,
+            'pool_timeouts': 0,
+            'lock_retries': 0,
+            'lock_failures': 0
+        }
+
+    def _create_connection(self) -> sqlite3.Connection:
+        """Open a new connection with pool settings"""
+        conn = sqlite3.connect(
+            self.database,
+            timeout=self.pragmas.get('busy_timeout', 5000) / 1000,
+            isolation_level='IMMEDIATE',
+            check_same_thread=False  # Connections move between request threads
+        )
+        conn.row_factory = sqlite3.Row
+        return configure_connection(conn, self.pragmas)
+
+    def _checkout(self) -> sqlite3.Connection:
+        """Take an idle connection, open a new one, or wait for one"""
+        with self._lock:
+            if self._pid != os.getpid():
+                # Inherited from parent process after fork - never share those
+                self._reset_pool()
+
+        start = time.perf_counter()
+        conn = None
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.max_size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    conn = self._create_connection()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+                with self._lock:
+                    self._metrics['connections_created'] += 1
+            else:
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self._metrics['pool_timeouts'] += 1
+                    raise sqlite3.OperationalError(
+                        f'Connection pool exhausted (max_size={self.max_size})'
+                    )
+
+        wait_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self._metrics['checkouts'] += 1
+            self._metrics['total_wait_ms'] += wait_ms
+            self._metrics['max_wait_ms'] = max(self._metrics['max_wait_ms'], wait_ms)
+        return conn
+
+    def _checkin(self, conn: sqlite3.Connection) -> None:
+        """Return a connection to the pool with no open transaction"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # Broken connection - drop it and let the pool open a new one
+            with self._lock:
+                self._created -= 1
+            conn.close()
+            return
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """Check out a pooled connection for the duration of a with-block"""
+        conn = self._checkout()
+        try:
+            yield conn
+        finally:
+            self._checkin(conn)
+
+    def run_with_retry(self, operation: Callable[[sqlite3.Connection], object], durable: bool = False):
+        """
+        Run operation(conn) as one transaction, retrying on lock contention
+
+        The operation must be safe to re-run from the start: it is rolled
+        back before every retry. Backoff is exponential with jitter.
+        durable=True commits with synchronous=FULL so the transaction is
+        on disk (not just in the WAL) before this returns.
+        """
+        delay = self.retry_base_delay
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self.connection() as conn:
+                    if not durable:
+                        return operation(conn)
+                    conn.execute('PRAGMA synchronous = FULL')
+                    try:
+                        return operation(conn)
+                    finally:
+                        if conn.in_transaction:
+                            conn.rollback()
+                        conn.execute(f"PRAGMA synchronous = {self.pragmas.get('synchronous', 'NORMAL')}")
+            except sqlite3.OperationalError as e:
+                if not is_lock_error(e):
+                    raise
+                if attempt == self.max_retries:
+                    with self._lock:
+                        self._metrics['lock_failures'] += 1
+                    raise
+                with self._lock:
+                    self._metrics['lock_retries'] += 1
+            time.sleep(delay * (1 + random.random()))
+            delay = min(delay * 2, self.retry_max_delay)
+
+    def get_metrics(self) -> Dict:
+        """Pool usage and contention metrics"""
+        with self._lock:
+            metrics = dict(self._metrics)
+            open_connections = self._created
+        checkouts = metrics['checkouts']
+        metrics['avg_wait_ms'] = round(metrics['total_wait_ms'] / checkouts, 3) if checkouts else 0.0
+        metrics['total_wait_ms'] = round(metrics['total_wait_ms'], 3)
+        metrics['max_wait_ms'] = round(metrics['max_wait_ms'], 3)
+        metrics['open_connections'] = open_connections
+        metrics['idle_connections'] = self._idle.qsize()
+        metrics['in_use_connections'] = open_connections - metrics['idle_connections']
+        metrics['max_size'] = self.max_size
+        return metrics
+
+    def close_all(self) -> None:
+        """Close every idle connection (call on shutdown)"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+
+def apply_migrations(conn: sqlite3.Connection, migrations: List[Tuple[int, str, List[str]]]) -> int:
+    """
+    Apply pending schema migrations in version order
+
+    migrations: list of (version, description, [sql statements]).
+    The applied version is tracked in PRAGMA user_version; each migration
+    runs in its own BEGIN IMMEDIATE transaction so concurrent workers
+    starting up apply it exactly once.
+
+    Returns the schema version after migrating.
+    """
+    for version, description, statements in sorted(migrations, key=lambda m: m[0]):
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            current = conn.execute('PRAGMA user_version').fetchone()[0]
+            if current >= version:
+                conn.rollback()
+                continue
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f'PRAGMA user_version = {int(version)}')
+            conn.commit()
+            print(f"✅ Applied migration {version}: {description}")
+        except Exception:
+            conn.rollback()
+            raise
+
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def extract_sql_queries(source_path: str) -> List[str]:
+    """Collect every SELECT/UPDATE/DELETE string literal from a Python file"""
+    with open(source_path, encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+
+    queries = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Constant) and isinstance(node.value, str):
+            sql = ' '.join(node.value.split())
+            if sql.upper().startswith(('SELECT ', 'UPDATE ', 'DELETE ')):
+                queries.append(sql)
+    return queries
+
+
+def find_full_scans(conn: sqlite3.Connection, queries: List[str]) -> List[Dict]:
+    """
+    Run EXPLAIN QUERY PLAN on each query and report table scans
+
+    A plan step counts as a regression if SQLite scans a whole table or
+    index ("SCAN ...") or sorts with a temporary B-tree instead of reading
+    rows in index order. Placeholders are bound to NULL.
+    """
+    problems = []
+    for sql in queries:
+        params = [None] * sql.count('?')
+        for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall():
+            detail = row[3]
+            if detail == 'SCAN CONSTANT ROW':
+                continue  # SELECT without a table, e.g. last_insert_rowid()
+            if detail.startswith('SCAN ') or 'USE TEMP B-TREE' in detail:
+                problems.append({'query': sql, 'plan': detail})
+    return problems
+
+
+def check_query_plans(source_path: str = 'app.py') -> List[Dict]:
+    """
+    Check every query in source_path against a freshly migrated schema
+
+    Also checks the /api/doctor/emergencies SQL built at runtime, for every
+    combination of filters and cursor. The schema comes from schema.py, so
+    the Flask app (and its model) is never imported.
+    """
+    from emergency_queries import representative_emergency_queries
+    from schema import create_schema
+
+    conn = sqlite3.connect(':memory:')
+    try:
+        create_schema(conn)
+        return find_full_scans(conn, extract_sql_queries(source_path) + representative_emergency_queries())
+    finally:
+        conn.close()
+
+
+# Example usage
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'check-plans':
+        # Query plan regression check: python database.py check-plans
+        source = sys.argv[2] if len(sys.argv) > 2 else 'app.py'
+        full_scans = check_query_plans(source)
+        for problem in full_scans:
+            print(f"❌ {problem['plan']}\n   {problem['query']}")
+        print(f"{'❌' if full_scans else '✅'} {len(full_scans)} query plan regressions in {source}")
+        sys.exit(1 if full_scans else 0)
+
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+
+    db_path = os.path.join(tempfile.mkdtemp(), 'pool_demo.db')
+    pool = ConnectionPool(db_path, max_size=4)
+
+    with pool.connection() as conn:
+        conn.execute('CREATE TABLE counters (id INTEGER PRIMARY KEY, value INTEGER)')
+        conn.execute('INSERT INTO counters (id, value) VALUES (1, 0)')
+        conn.commit()
+        print(f"Journal mode: {conn.execute('PRAGMA journal_mode').fetchone()[0]}")
+
+    def increment(_):
+        def operation(conn):
+            conn.execute('UPDATE counters SET value = value + 1 WHERE id = 1')
+            conn.commit()
+        pool.run_with_retry(operation)
+
+    print("=== 16 THREADS x 200 WRITES ===")
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        list(executor.map(increment, range(3200)))
+
+    with pool.connection() as conn:
+        print(f"Counter: {conn.execute('SELECT value FROM counters').fetchone()[0]}")
+    print(f"Pool metrics: {pool.get_metrics()}")
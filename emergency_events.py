@@ -0,0 +1,320 @@
+"""
+EMERGENCY EVENT STREAM
+Emergency event log (SQLite table) + per-worker fan-out + Server-Sent Events (SSE) formatting
+
+The emergency_events table is the source of truth: every change is
+recorded with record_event() in the same transaction as the change
+itself, and its row id is the SSE event id. Each worker process runs an
+EmergencyEventBus that polls the table for new rows, so a dashboard sees
+every change whichever worker made it and can resume on any worker.
+"""
+
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Event types pushed to dashboards
+EVENT_TYPES = ('created', 'dispatched', 'resolved')
+
+# Schema for the app's migrations (ids must never be reused, hence AUTOINCREMENT)
+EVENT_TABLE_SQL = '''CREATE TABLE IF NOT EXISTS emergency_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    event_type TEXT NOT NULL,
+    emergency_id INTEGER,
+    data TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)'''
+
+
+def format_sse(event_id: Optional[int], event_type: str, data) -> str:
+    """Encode one SSE message (id / event / data lines + blank line)"""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event_type}')
+    lines.append(f'data: {json.dumps(data, default=str)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+def record_event(conn: sqlite3.Connection, event_type: str, data: Dict) -> int:
+    """
+    Add an event to the log inside the caller's transaction; returns its id
+
+    Call before conn.commit() of the change it describes, so the event
+    exists exactly when the change does.
+    """
+    if event_type not in EVENT_TYPES:
+        raise ValueError(f'Unknown emergency event type: {event_type}')
+    return conn.execute(
+        'INSERT INTO emergency_events (event_type, emergency_id, data) VALUES (?, ?, ?)',
+        (event_type, data.get('id'), json.dumps(data, default=str))
+    ).lastrowid
+
+
+def latest_event_id(conn: sqlite3.Connection) -> int:
+    """Id of the newest committed event (0 if there is none)"""
+    return conn.execute('SELECT COALESCE(MAX(id), 0) FROM emergency_events').fetchone()[0]
+
+
+class EmergencyEventBus:
+    """
+    Fan-out of the emergency event log to every dashboard connected to this worker
+
+    - A background thread polls the table every poll_interval seconds while
+      streams are open; notify() after a local commit polls right away
+    - The newest history_size events are buffered; a client resuming from
+      an older id is caught up from the table
+    - An id newer than the table (e.g. from a replaced database) gets a
+      'reset' event: the client re-fetches the snapshot
+    """
+
+    def __init__(self, pool, history_size: int = 1000, poll_interval: float = 0.5):
+        self.pool = pool
+        self.history_size = history_size
+        self.poll_interval = poll_interval
+
+        self._events = deque(maxlen=history_size)  # (event_id, event_type, data)
+        self._head = None  # Newest event id seen (None until the first poll)
+        self._floor = None  # Every event after this id is buffered
+        self._condition = threading.Condition()
+        self._poll_lock = threading.Lock()  # One poll at a time
+        self._lock = threading.Lock()
+        self._pid = None
+        self._thread = None
+        self._wakeup = threading.Event()
+        self._listeners = 0
+        self._closed = False
+        self._metrics = {
+            'polls': 0,
+            'polled_events': 0,
+            'poll_errors': 0,
+            'store_reads': 0,
+            'connections_opened': 0,
+            'connections_closed': 0,
+            'events_sent': 0,
+            'replayed_events': 0,
+            'resets': 0,
+            'heartbeats': 0
+        }
+        atexit.register(self.close)
+
+    def _ensure_poller(self) -> None:
+        """Start the poller thread (again, in a forked worker process)"""
+        with self._lock:
+            if self._closed or (self._thread is not None and self._pid == os.getpid()):
+                return
+            self._pid = os.getpid()
+            self._wakeup = threading.Event()
+            self._thread = threading.Thread(target=self._run, name='emergency-events', daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        """Poller thread: read new rows while anyone is listening"""
+        wakeup = self._wakeup
+        while True:
+            wakeup.wait(self.poll_interval if self._listeners else None)
+            wakeup.clear()
+            if self._closed:
+                return
+            if not self._listeners:
+                continue
+            try:
+                self.poll()
+            except sqlite3.Error:
+                with self._condition:
+                    self._metrics['poll_errors'] += 1
+
+    def notify(self) -> None:
+        """Wake the poller after committing an event in this worker"""
+        self._wakeup.set()
+
+    def _fetch(self, after_id: int) -> List[Tuple]:
+        """Up to history_size committed events after after_id, oldest first"""
+        with self.pool.connection() as conn:
+            rows = conn.execute('''
+                SELECT id, event_type, data FROM emergency_events
+                WHERE id > ? ORDER BY id LIMIT ?
+            ''', (after_id, self.history_size)).fetchall()
+        return [(row[0], row[1], json.loads(row[2])) for row in rows]
+
+    def poll(self) -> int:
+        """Buffer events committed since the last poll and wake streams; returns how many"""
+        with self._poll_lock:
+            if self._head is None:
+                with self.pool.connection() as conn:
+                    head = latest_event_id(conn)
+                with self._condition:
+                    self._head = self._floor = head
+
+            polled = 0
+            while True:
+                events = self._fetch(self._head)
+                with self._condition:
+                    self._metrics['polls'] += 1
+                    for event in events:
+                        if len(self._events) == self.history_size:
+                            self._floor = self._events[0][0]
+                        self._events.append(event)
+                    if events:
+                        self._head = events[-1][0]
+                        self._metrics['polled_events'] += len(events)
+                        self._condition.notify_all()
+                polled += len(events)
+                if len(events) < self.history_size:
+                    return polled
+
+    @property
+    def last_event_id(self) -> int:
+        """Id of the newest committed event (a client holding it has seen everything)"""
+        with self.pool.connection() as conn:
+            return latest_event_id(conn)
+
+    def _events_after(self, last_id: int) -> Tuple[List[Tuple], bool, bool]:
+        """Buffered events newer than last_id, whether last_id is unknown, whether it predates the buffer (lock held)"""
+        if last_id > self._head:
+            return [], True, False  # Not an id of this event log
+        if last_id < self._floor:
+            return [], False, True
+        newer = []
+        for event in reversed(self._events):
+            if event[0] <= last_id:
+                break
+            newer.append(event)
+        newer.reverse()
+        return newer, False, False
+
+    def wait_for_events(self, last_id: int, timeout: float) -> Tuple[List[Tuple], bool]:
+        """Block up to timeout seconds for events newer than last_id"""
+        with self._condition:
+            events, gap, behind = self._events_after(last_id)
+            if not (events or gap or behind):
+                self._condition.wait(timeout)
+                events, gap, behind = self._events_after(last_id)
+        if behind:
+            # Older than the buffer: read the next page from the table
+            events = self._fetch(last_id)
+            with self._condition:
+                self._metrics['store_reads'] += 1
+        return events, gap
+
+    def stream(self, last_event_id: Optional[int] = None, heartbeat_seconds: float = 15.0,
+               retry_ms: int = 3000) -> Iterator[str]:
+        """
+        SSE message generator for one connection
+
+        last_event_id: resume point (Last-Event-ID); None = only new events
+        heartbeat_seconds: idle interval before a ':' comment keeps proxies
+            and the browser from timing the connection out
+        """
+        with self._condition:
+            self._metrics['connections_opened'] += 1
+            self._listeners += 1
+        try:
+            self._ensure_poller()
+            self.notify()
+            self.poll()  # Judge the client's id against the table, not a stale buffer
+            with self._condition:
+                cursor = self._head if last_event_id is None else last_event_id
+            resuming = last_event_id is not None
+
+            yield f'retry: {retry_ms}\n\n'
+            while True:
+                events, gap = self.wait_for_events(cursor, heartbeat_seconds)
+                if gap:
+                    # Can't replay: client re-fetches /api/doctor/emergencies
+                    with self._condition:
+                        cursor = self._head
+                        self._metrics['resets'] += 1
+                    yield format_sse(cursor, 'reset', {'last_event_id': cursor})
+                    continue
+                if not events:
+                    with self._condition:
+                        self._metrics['heartbeats'] += 1
+                    yield f': heartbeat {int(time.time())}\n\n'
+                    continue
+
+                with self._condition:
+                    self._metrics['events_sent'] += len(events)
+                    if resuming:
+                        self._metrics['replayed_events'] += len(events)
+                resuming = False
+                for event_id, event_type, data in events:
+                    cursor = event_id
+                    yield format_sse(event_id, event_type, data)
+        finally:
+            with self._condition:
+                self._metrics['connections_closed'] += 1
+                self._listeners -= 1
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Stop the poller thread"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread if self._pid == os.getpid() else None
+        if thread is not None and thread.is_alive():
+            self._wakeup.set()
+            thread.join(timeout)
+
+    def get_metrics(self) -> Dict:
+        """Poll / fan-out counters"""
+        with self._condition:
+            metrics = dict(self._metrics)
+            metrics['buffered_events'] = len(self._events)
+            metrics['last_event_id'] = self._head
+            metrics['open_connections'] = self._listeners
+        metrics['history_size'] = self.history_size
+        metrics['poll_interval_ms'] = self.poll_interval * 1000
+        return metrics
+
+
+# Example usage
+if __name__ == "__main__":
+    import tempfile
+
+    from database import ConnectionPool
+
+    pool = ConnectionPool(os.path.join(tempfile.mkdtemp(), 'events_demo.db'))
+    with pool.connection() as conn:
+        conn.execute(EVENT_TABLE_SQL)
+        conn.commit()
+
+    def publish(event_type, data):
+        def operation(conn):
+            event_id = record_event(conn, event_type, data)
+            conn.commit()
+            return event_id
+        return pool.run_with_retry(operation)
+
+    # Two buses on one table stand in for two worker processes
+    bus, other_worker = EmergencyEventBus(pool, history_size=3), EmergencyEventBus(pool)
+    first = publish('created', {'id': 1, 'emergency_type': 'SOS_MANUAL'})
+    publish('dispatched', {'id': 1, 'status': 'DISPATCHED'})
+
+    print("=== RESUME AFTER FIRST EVENT (OTHER WORKER) ===")
+    stream = other_worker.stream(last_event_id=first, heartbeat_seconds=0.1)
+    for _ in range(3):
+        print(next(stream), end='')
+    stream.close()
+
+    print("=== RESUME FROM AN ID OLDER THAN THE BUFFER ===")
+    for i in range(5):
+        publish('resolved', {'id': i})
+    bus.poll()
+    stream = bus.stream(last_event_id=first, heartbeat_seconds=0.1)
+    for _ in range(4):
+        print(next(stream), end='')
+    stream.close()
+
+    print("=== RESUME FROM AN UNKNOWN ID ===")
+    stream = bus.stream(last_event_id=first + 100, heartbeat_seconds=0.1)
+    next(stream)
+    print(next(stream), end='')
+    stream.close()
+    print(f"Metrics: {bus.get_metrics()}")
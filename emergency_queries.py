@@ -0,0 +1,148 @@
+"""
+EMERGENCY LIST QUERIES
+SQL for /api/doctor/emergencies: filters, field selection, keyset cursors
+"""
+
+import base64
+import itertools
+import json
+from datetime import datetime, timezone
+
+# /api/doctor/emergencies page size (default, max)
+EMERGENCY_PAGE_SIZE = 50
+EMERGENCY_MAX_PAGE_SIZE = 500
+
+# fields= selector: public name -> column (id + created_at always included for the cursor)
+EMERGENCY_FIELDS = {
+    'id': 'e.id',
+    'user_id': 'e.user_id',
+    'emergency_type': 'e.emergency_type',
+    'status': 'e.status',
+    'severity': 'e.severity',
+    'location': 'e.location',
+    'doctor_id': 'e.doctor_id',
+    'ambulance_id': 'e.ambulance_id',
+    'vitals_summary': 'e.vitals_summary',
+    'created_at': 'e.created_at',
+    'resolved_at': 'e.resolved_at',
+    'name': 'u.name',
+    'phone': 'u.phone',
+    'abha_id': 'u.abha_id'
+}
+
+
+def encode_emergency_cursor(created_at, emergency_id):
+    """Opaque keyset cursor for the row a page ended on"""
+    raw = json.dumps([created_at, emergency_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_emergency_cursor(cursor):
+    """Inverse of encode_emergency_cursor; raises ValueError if malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, emergency_id = json.loads(raw)
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if not isinstance(created_at, str) or not isinstance(emergency_id, int):
+        raise ValueError('Invalid cursor')
+    return created_at, emergency_id
+
+
+def parse_timestamp(value, name):
+    """
+    ISO 8601 / SQLite timestamp -> UTC 'YYYY-MM-DD HH:MM:SS' (how created_at is stored)
+
+    Values with an offset are converted to UTC; values without one are taken as UTC.
+    """
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f'Invalid {name} timestamp')
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc)
+    return parsed.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def build_emergency_query(args):
+    """
+    SQL for one page of /api/doctor/emergencies from the query string
+
+    Keyset pagination: the page after a cursor is
+        WHERE (created_at, id) < (cursor created_at, cursor id)
+    which SQLite answers by seeking into idx_emergencies_status_created_id,
+    so page 1000 costs the same as page 1.
+    Returns: (sql, params, fields, limit); raises ValueError on bad input
+    """
+    fields = list(EMERGENCY_FIELDS)
+    if args.get('fields'):
+        fields = [field.strip() for field in args['fields'].split(',') if field.strip()]
+        unknown = [field for field in fields if field not in EMERGENCY_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        fields = ['id', 'created_at'] + [field for field in fields if field not in ('id', 'created_at')]
+
+    try:
+        limit = int(args.get('limit', EMERGENCY_PAGE_SIZE))
+    except ValueError:
+        raise ValueError('Invalid limit')
+    if not 1 <= limit <= EMERGENCY_MAX_PAGE_SIZE:
+        raise ValueError(f'limit must be between 1 and {EMERGENCY_MAX_PAGE_SIZE}')
+
+    conditions = ['e.status = ?']
+    params = [args.get('status', 'ACTIVE')]
+
+    # emergency_type is a ", "-joined list of conditions; match whole entries
+    if args.get('emergency_type'):
+        types = [t.strip() for t in args['emergency_type'].split(',') if t.strip()]
+        conditions.append('(' + ' OR '.join(["(', ' || e.emergency_type || ', ') LIKE ?"] * len(types)) + ')')
+        params.extend(f'%, {t}, %' for t in types)
+
+    if args.get('since'):
+        conditions.append('e.created_at >= ?')
+        params.append(parse_timestamp(args['since'], 'since'))
+    if args.get('until'):
+        conditions.append('e.created_at < ?')
+        params.append(parse_timestamp(args['until'], 'until'))
+
+    for name, operator in (('min_severity', '>='), ('max_severity', '<=')):
+        if args.get(name):
+            try:
+                params.append(int(args[name]))
+            except ValueError:
+                raise ValueError(f'Invalid {name}')
+            conditions.append(f'e.severity {operator} ?')
+
+    if args.get('cursor'):
+        conditions.append('(e.created_at, e.id) < (?, ?)')
+        params.extend(decode_emergency_cursor(args['cursor']))
+
+    sql = f"""
+        SELECT {', '.join(f'{EMERGENCY_FIELDS[field]} AS {field}' for field in fields)}
+        FROM emergencies e
+        JOIN users u ON e.user_id = u.id
+        WHERE {' AND '.join(conditions)}
+        ORDER BY e.created_at DESC, e.id DESC
+        LIMIT ?
+    """
+    # One extra row tells us whether there is a next page
+    params.append(limit + 1)
+    return sql, params, fields, limit
+
+
+def representative_emergency_queries():
+    """build_emergency_query() SQL for every combination of filters and cursor (for plan checks)"""
+    filters = {
+        'emergency_type': 'CRITICAL_SPO2,SOS_MANUAL',
+        'since': '2026-01-01T00:00:00Z',
+        'until': '2026-01-02T00:00:00Z',
+        'min_severity': '5',
+        'max_severity': '9',
+        'cursor': encode_emergency_cursor('2026-01-01 12:00:00', 1)
+    }
+    queries = []
+    for size in range(len(filters) + 1):
+        for names in itertools.combinations(filters, size):
+            sql, _, _, _ = build_emergency_query({name: filters[name] for name in names})
+            queries.append(' '.join(sql.split()))
+    return queries
@@ -3,9 +3,13 @@ HOSPITAL-SIDE INTELLIGENCE SYSTEM
 Real-time bed management + Doctor alerts + Clinical decision support
 """
 
+import atexit
+import heapq
+import itertools
+import threading
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
-from enum import Enum
+from typing import Callable, Dict, List, Optional
+from enum import Enum, IntEnum
 
 class BedType(Enum):
     """Bed types in hospital"""
@@ -24,183 +28,773 @@ class BedStatus(Enum):
     MAINTENANCE = "MAINTENANCE"
 
 
-class HospitalBedManager:
-    """Real-time bed availability and reservation system"""
+class BedEventKind(IntEnum):
+    """Bed state changes written to a bed event log (values are stored)"""
+    RESERVED = 1
+    ADMITTED = 2
+    RELEASED = 3  # Cancelled or discharged
+    EXPIRED = 4
+    MAINTENANCE = 5
+    RETURNED_TO_SERVICE = 6
+    WAITING = 7
+    WAITING_CANCELLED = 8
+
+
+# _free_bed reason -> logged event
+_RELEASE_EVENTS = {
+    'cancelled': BedEventKind.RELEASED,
+    'discharged': BedEventKind.RELEASED,
+    'expired': BedEventKind.EXPIRED,
+    'returned_to_service': BedEventKind.RETURNED_TO_SERVICE
+}
+
+# Per-bed fields that only exist while a bed is reserved or occupied
+_BED_FIELDS = ('reserved_for', 'emergency_id', 'reserved_at', 'expires_at', 'patient_id', 'admitted_at')
+
+
+def _timestamp(value: Optional[datetime]) -> Optional[float]:
+    return None if value is None else value.timestamp()
+
+
+def _datetime(value: Optional[float]) -> Optional[datetime]:
+    return None if value is None else datetime.fromtimestamp(value)
+
+
+class BedPool:
+    """
+    Beds of one BedType, indexed by status
+    
+    Each status holds an insertion-ordered dict of bed_id -> bed, so moving
+    a bed between statuses, taking an available bed and every count are
+    O(1) however large the ward. Available beds are taken from the end
+    (popitem), so a just-released bed is handed out first.
+    """
+    
+    def __init__(self, bed_type: BedType):
+        self.bed_type = bed_type
+        self.by_status = {status: {} for status in BedStatus}
+    
+    @property
+    def total(self) -> int:
+        return sum(len(beds) for beds in self.by_status.values())
+    
+    def count(self, status: BedStatus) -> int:
+        return len(self.by_status[status])
+    
+    def add(self, bed: Dict) -> None:
+        self.by_status[bed['status']][bed['id']] = bed
+    
+    def move(self, bed: Dict, status: BedStatus) -> None:
+        """Change a bed's status"""
+        del self.by_status[bed['status']][bed['id']]
+        bed['status'] = status
+        self.by_status[status][bed['id']] = bed
+    
+    def take_available(self) -> Optional[Dict]:
+        """Remove and return an available bed (None if there is none)"""
+        available = self.by_status[BedStatus.AVAILABLE]
+        if not available:
+            return None
+        _, bed = available.popitem()
+        return bed
+
+
+class _ArrivalQueue:
+    """
+    Waiting entries of one severity level in arrival order
+    
+    A Fenwick tree over the slots counts the live ones, so a cancelled
+    entry just empties its slot and an entry's rank is a prefix sum. Slots
+    are compacted once most of them are empty.
+    """
     
     def __init__(self):
-        self.beds = self._initialize_beds()
+        self.slots = []  # Entry, or None once removed
+        self.slot_of = {}  # emergency_id -> slot
+        self.tree = [0]  # 1-based: tree[i] counts live slots in (i - lowbit(i), i]
+        self.front = 0  # No live slot before this one
+    
+    def __len__(self) -> int:
+        return len(self.slot_of)
+    
+    def _prefix(self, i: int) -> int:
+        """Live entries in the first i slots"""
+        total = 0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+    
+    def append(self, entry: Dict) -> None:
+        self.slot_of[entry['emergency_id']] = len(self.slots)
+        self.slots.append(entry)
+        i = len(self.slots)
+        self.tree.append(1 + self._prefix(i - 1) - self._prefix(i - (i & -i)))
+    
+    def rank(self, emergency_id: str) -> int:
+        """Entries of this level ahead of emergency_id"""
+        return self._prefix(self.slot_of[emergency_id])
+    
+    def first(self) -> Optional[Dict]:
+        return self.slots[self.front] if self.slot_of else None
+    
+    def remove(self, emergency_id: str) -> Dict:
+        slot = self.slot_of.pop(emergency_id)
+        entry = self.slots[slot]
+        self.slots[slot] = None
+        i = slot + 1
+        while i < len(self.tree):
+            self.tree[i] -= 1
+            i += i & -i
+        
+        if len(self.slots) > 2 * len(self.slot_of) + 64:
+            self._compact()
+        else:
+            while self.front < len(self.slots) and self.slots[self.front] is None:
+                self.front += 1
+        return entry
+    
+    def _compact(self) -> None:
+        self.slots = [entry for entry in self.slots if entry is not None]
+        self.slot_of = {entry['emergency_id']: slot for slot, entry in enumerate(self.slots)}
+        self.tree = [0] + [1] * len(self.slots)
+        for i in range(1, len(self.tree)):
+            parent = i + (i & -i)
+            if parent < len(self.tree):
+                self.tree[parent] += self.tree[i]
+        self.front = 0
+
+
+class WaitingList:
+    """
+    Patients waiting for one BedType, most severe first, then by arrival
+    
+    One _ArrivalQueue per severity level (1-10): adding, cancelling and
+    looking up a patient's position are O(log n) plus a sum over the
+    levels, and the next patient is found in O(levels).
+    """
+    
+    MAX_SEVERITY = 10
+    
+    def __init__(self, bed_type: BedType):
+        self.bed_type = bed_type
+        self.levels = [_ArrivalQueue() for _ in range(self.MAX_SEVERITY)]  # levels[0]: severity 10
+        self.entries = {}  # emergency_id -> entry
+    
+    def __len__(self) -> int:
+        return len(self.entries)
+    
+    def __contains__(self, emergency_id: str) -> bool:
+        return emergency_id in self.entries
+    
+    def _level(self, entry: Dict) -> int:
+        return self.MAX_SEVERITY - entry['severity']
+    
+    def add(self, entry: Dict) -> int:
+        """Queue an entry (severity clamped to 1-10); returns its position"""
+        entry['severity'] = min(max(int(round(entry['severity'])), 1), self.MAX_SEVERITY)
+        self.levels[self._level(entry)].append(entry)
+        self.entries[entry['emergency_id']] = entry
+        return self.position(entry['emergency_id'])
+    
+    def remove(self, emergency_id: str) -> Optional[Dict]:
+        entry = self.entries.pop(emergency_id, None)
+        if entry is not None:
+            self.levels[self._level(entry)].remove(emergency_id)
+        return entry
+    
+    def position(self, emergency_id: str) -> Optional[int]:
+        """1-based queue position (None if not waiting)"""
+        entry = self.entries.get(emergency_id)
+        if entry is None:
+            return None
+        level = self._level(entry)
+        return sum(len(queue) for queue in self.levels[:level]) + self.levels[level].rank(emergency_id) + 1
+    
+    def peek(self) -> Optional[Dict]:
+        """The patient who gets the next bed"""
+        for queue in self.levels:
+            if queue.slot_of:
+                return queue.first()
+        return None
+
+
+class _LockGroup:
+    """Several locks held together, acquired in the given order"""
+    
+    __slots__ = ('locks',)
+    
+    def __init__(self, locks: List):
+        self.locks = locks
+    
+    def __enter__(self):
+        for lock in self.locks:
+            lock.acquire()
+    
+    def __exit__(self, *exc_info):
+        for lock in reversed(self.locks):
+            lock.release()
+
+
+class HospitalBedManager:
+    """
+    Real-time bed availability and reservation system
+    
+    Reservations lapse at expires_at: a min-heap of (expires_at, ...) is
+    checked on every call, so a lapsed bed is released before anything
+    reads or reserves beds (O(1) when nothing is due, O(log n) per expiry).
+    expire_reservations() can also be called from a periodic job. Each
+    freed bed is reported to the release listeners.
+    
+    Patients who find no bed wait in a per-type WaitingList. A freed bed
+    goes straight to the most severe, longest-waiting patient whose type
+    (or one of its ALTERNATIVE_BED_TYPES) it is.
+    
+    Thread-safe with one lock per BedType. A reservation normally takes
+    only its own type's lock; the alternative-bed fallback takes its
+    alternatives' too, and freeing a bed takes those of every type whose
+    waiting list may claim it. Multiple locks are always acquired in
+    BedType order, so no two calls can deadlock.
+    
+    With an event_store (bed_event_store.BedEventStore) every state change
+    is logged under the lock that guards it, and the manager starts from
+    the store's newest snapshot plus the events after it instead of the
+    inventory's census.
+    """
+    
+    # Bed types to try, in order, when the requested one is full
+    # Upgrade path: GENERAL → OXYGEN → HDU → ICU
+    # Downgrade path: ICU → HDU → OXYGEN → GENERAL
+    ALTERNATIVE_BED_TYPES = {
+        BedType.ICU: [BedType.HDU],
+        BedType.HDU: [BedType.ICU, BedType.OXYGEN],
+        BedType.OXYGEN: [BedType.HDU, BedType.GENERAL],
+        BedType.GENERAL: [BedType.OXYGEN]
+    }
+    
+    # (bed type, bed id prefix, number of beds, equipment, starting census)
+    DEFAULT_INVENTORY = [
+        (BedType.ICU, 'ICU', 20, ['Ventilator', 'Cardiac Monitor', 'IV Pump'],
+         {'occupied': 12, 'reserved': 2, 'maintenance': 1}),
+        (BedType.HDU, 'HDU', 30, ['Oxygen', 'Monitor', 'IV Pump'],
+         {'occupied': 20, 'reserved': 1, 'maintenance': 1}),
+        (BedType.OXYGEN, 'OXY', 40, ['Oxygen Concentrator', 'Pulse Oximeter'],
+         {'occupied': 22, 'reserved': 2, 'maintenance': 1}),
+        (BedType.GENERAL, 'GEN', 100, ['Basic monitoring'],
+         {'occupied': 60, 'reserved': 3, 'maintenance': 2})
+    ]
+    
+    def __init__(self, inventory: Optional[List] = None, event_store=None):
+        self.beds = {}  # bed_id -> bed
+        self.pools = self._initialize_beds(inventory or self.DEFAULT_INVENTORY)
         self.reservations = {}
+        
+        # Per bed type: (expires_at, tie-breaker, emergency_id, bed_id); entries for
+        # reservations that were confirmed or released since are skipped when they surface
+        self._expiry_heaps = {bed_type: [] for bed_type in BedType}
+        self._expiry_order = itertools.count()
+        self.release_listeners: List[Callable[[Dict], None]] = []
+        
+        self.waiting_lists = {bed_type: WaitingList(bed_type) for bed_type in BedType}
+        self._waiting = {}  # emergency_id -> BedType it waits for
+        self._arrival_order = itertools.count()
+        # Bed types whose waiting lists may claim a freed bed of each type
+        self._claimant_types = {
+            bed_type: [bed_type] + [
+                waiting_type
+                for waiting_type, alternatives in self.ALTERNATIVE_BED_TYPES.items()
+                if bed_type in alternatives
+            ]
+            for bed_type in BedType
+        }
+        
+        # One lock per bed type guards its pool, beds, expiry heap and waiting
+        # list. Several are always taken in BedType declaration order.
+        self._locks = {bed_type: threading.Lock() for bed_type in BedType}
+        self._lock_rank = {bed_type: rank for rank, bed_type in enumerate(BedType)}
+        self._claimant_locks = {bed_type: self._locked(types) for bed_type, types in self._claimant_types.items()}
+        
+        self._ticker = None
+        self._ticker_stop = threading.Event()
+        
+        self.event_store = None
+        if event_store is not None:
+            event_store.recover(self._restore_snapshot, self._apply_event)
+            self.event_store = event_store  # Replayed changes are not logged again
     
-    def _initialize_beds(self) -> Dict:
-        """Initialize hospital bed inventory"""
-        return {
-            BedType.ICU: {
-                'total': 20,
-                'available': 5,
-                'occupied': 12,
-                'reserved': 2,
-                'maintenance': 1,
-                'beds': [
-                    {'id': f'ICU-{i:02d}', 'status': BedStatus.AVAILABLE, 
-                     'equipment': ['Ventilator', 'Cardiac Monitor', 'IV Pump']}
-                    for i in range(1, 21)
-                ]
-            },
-            BedType.HDU: {
-                'total': 30,
-                'available': 8,
-                'occupied': 20,
-                'reserved': 1,
-                'maintenance': 1,
-                'beds': [
-                    {'id': f'HDU-{i:02d}', 'status': BedStatus.AVAILABLE,
-                     'equipment': ['Oxygen', 'Monitor', 'IV Pump']}
-                    for i in range(1, 31)
-                ]
-            },
-            BedType.OXYGEN: {
-                'total': 40,
-                'available': 15,
-                'occupied': 22,
-                'reserved': 2,
-                'maintenance': 1,
-                'beds': [
-                    {'id': f'OXY-{i:02d}', 'status': BedStatus.AVAILABLE,
-                     'equipment': ['Oxygen Concentrator', 'Pulse Oximeter']}
-                    for i in range(1, 41)
-                ]
-            },
-            BedType.GENERAL: {
-                'total': 100,
-                'available': 35,
-                'occupied': 60,
-                'reserved': 3,
-                'maintenance': 2,
-                'beds': [
-                    {'id': f'GEN-{i:03d}', 'status': BedStatus.AVAILABLE,
-                     'equipment': ['Basic monitoring']}
-                    for i in range(1, 101)
-                ]
-            }
+    def _initialize_beds(self, inventory: List) -> Dict:
+        """Build a BedPool per BedType (types without beds get an empty pool)"""
+        pools = {bed_type: BedPool(bed_type) for bed_type in BedType}
+        for bed_type, prefix, count, equipment, census in inventory:
+            # Census statuses go to the lowest bed numbers, the rest start available
+            statuses = ([BedStatus.OCCUPIED] * census.get('occupied', 0)
+                        + [BedStatus.RESERVED] * census.get('reserved', 0)
+                        + [BedStatus.MAINTENANCE] * census.get('maintenance', 0))
+            width = max(2, len(str(count)))
+            # Added highest number first, so take_available() hands out the lowest
+            for i in range(count, 0, -1):
+                bed = {
+                    'id': f'{prefix}-{i:0{width}d}',
+                    'bed_type': bed_type,
+                    'status': statuses[i - 1] if i <= len(statuses) else BedStatus.AVAILABLE,
+                    'equipment': list(equipment)
+                }
+                self.beds[bed['id']] = bed
+                pools[bed_type].add(bed)
+        return pools
+    
+    def _locked(self, bed_types) -> _LockGroup:
+        """The locks of several bed types, acquired in BedType order"""
+        return _LockGroup([self._locks[bed_type]
+                           for bed_type in sorted(set(bed_types), key=self._lock_rank.__getitem__)])
+    
+    def add_release_listener(self, callback: Callable[[Dict], None]) -> None:
+        """Call callback(event) whenever a reserved or occupied bed becomes available"""
+        self.release_listeners.append(callback)
+    
+    def expire_reservations(self, now: Optional[datetime] = None) -> List[Dict]:
+        """Release every reservation past its expires_at; returns the release events"""
+        now = now or datetime.now()
+        events = []
+        for bed_type, heap in self._expiry_heaps.items():
+            if not self._due(heap, now):
+                continue
+            with self._claimant_locks[bed_type]:
+                while heap and heap[0][0] <= now:
+                    expires_at, _, emergency_id, bed_id = heapq.heappop(heap)
+                    bed = self.beds[bed_id]
+                    if (bed['status'] != BedStatus.RESERVED or bed.get('emergency_id') != emergency_id
+                            or bed.get('expires_at') != expires_at):
+                        continue  # Confirmed, released or re-reserved since
+                    events.append(self._free_bed(bed, 'expired'))
+        self._emit(events)
+        return events
+    
+    @staticmethod
+    def _due(heap: List, now: datetime) -> bool:
+        try:
+            return heap[0][0] <= now
+        except IndexError:  # Empty, or emptied by another thread since
+            return False
+    
+    def _expire_due(self) -> None:
+        # Cheap peek on every call (before any lock is held); heaps are only
+        # popped when something lapsed
+        now = datetime.now()
+        for heap in self._expiry_heaps.values():
+            if heap and self._due(heap, now):
+                self.expire_reservations(now)
+                break
+        if self.event_store is not None and self.event_store.claim_snapshot():
+            try:
+                self.take_snapshot()
+            except Exception as e:
+                # The bed operation itself succeeded; the next event retries the snapshot
+                print(f"⚠️ Bed state snapshot failed: {e}")
+            finally:
+                self.event_store.release_snapshot()
+    
+    def start_expiry_ticker(self, interval_seconds: float = 5.0) -> None:
+        """Also expire reservations from a background thread (for idle periods)"""
+        if self._ticker is not None and self._ticker.is_alive():
+            return
+        self._ticker_stop.clear()
+        self._ticker = threading.Thread(target=self._tick, args=(interval_seconds,),
+                                        name='bed-expiry', daemon=True)
+        self._ticker.start()
+        atexit.register(self.close)
+    
+    def _tick(self, interval_seconds: float) -> None:
+        while not self._ticker_stop.wait(interval_seconds):
+            try:
+                self.expire_reservations()
+            except Exception as e:
+                print(f"⚠️ Bed expiry tick failed: {e}")
+    
+    def close(self, timeout: float = 5.0) -> None:
+        """Stop the expiry ticker"""
+        self._ticker_stop.set()
+        if self._ticker is not None and self._ticker.is_alive():
+            self._ticker.join(timeout)
+    
+    def _free_bed(self, bed: Dict, reason: str) -> Dict:
+        """
+        Make a bed available and offer it to the waiting lists
+        
+        The caller holds the locks of the bed's claimant types. Returns the
+        release event; 'matched' names the waiting patient the bed was
+        reserved for, if any.
+        """
+        event = {
+            'event': 'bed_released',
+            'reason': reason,
+            'bed_id': bed['id'],
+            'bed_type': bed['bed_type'].value,
+            'emergency_id': bed.get('emergency_id'),
+            'patient_id': bed.get('patient_id') or bed.get('reserved_for'),
+            'released_at': datetime.now()
         }
+        self._clear_bed(bed)
+        self._record(_RELEASE_EVENTS[reason], bed['id'], at=_timestamp(event['released_at']))
+        event['matched'] = self._match_waiting(bed['bed_type'])
+        return event
+    
+    def _clear_bed(self, bed: Dict) -> None:
+        emergency_id = bed.get('emergency_id')
+        if emergency_id is not None and self.reservations.get(emergency_id, {}).get('bed_id') == bed['id']:
+            self.reservations.pop(emergency_id, None)
+        for key in _BED_FIELDS:
+            bed.pop(key, None)
+        self.pools[bed['bed_type']].move(bed, BedStatus.AVAILABLE)
+    
+    def _match_waiting(self, bed_type: BedType) -> Optional[Dict]:
+        """Reserve an available bed_type bed for the best waiting patient it suits"""
+        candidates = [entry for entry in (self.waiting_lists[waiting_type].peek()
+                                          for waiting_type in self._claimant_types[bed_type]) if entry]
+        if not candidates:
+            return None
+        entry = min(candidates, key=lambda candidate: (-candidate['severity'], candidate['arrival']))
+        
+        bed = self.pools[bed_type].take_available()
+        result = self._reserve(bed, entry['patient_id'], entry['emergency_id'], entry['duration_minutes'])
+        if entry['bed_type'] != bed_type:
+            result['is_alternative'] = True
+            result['preferred_type'] = entry['bed_type'].value
+        result.update(patient_id=entry['patient_id'], emergency_id=entry['emergency_id'],
+                      severity=entry['severity'],
+                      waited_seconds=round((datetime.now() - entry['added_at']).total_seconds(), 1))
+        return result
+    
+    def _emit(self, events: List[Dict]) -> None:
+        # Called with no lock held, so listeners may call back into the manager
+        for event in events:
+            for callback in self.release_listeners:
+                try:
+                    callback(event)
+                except Exception as e:
+                    print(f"⚠️ Bed release listener failed: {e}")
     
     def get_availability(self, bed_type: BedType = None) -> Dict:
         """Get real-time bed availability"""
+        self._expire_due()
         if bed_type:
-            return {
-                'bed_type': bed_type.value,
-                'total': self.beds[bed_type]['total'],
-                'available': self.beds[bed_type]['available'],
-                'occupied': self.beds[bed_type]['occupied'],
-                'reserved': self.beds[bed_type]['reserved'],
-                'occupancy_rate': round((self.beds[bed_type]['occupied'] / 
-                                       self.beds[bed_type]['total']) * 100, 1)
-            }
+            return self._availability(bed_type)
         
         # Return all bed types
         return {
-            bed_type.value: self.get_availability(bed_type)
+            bed_type.value: self._availability(bed_type)
             for bed_type in BedType
         }
     
+    def _availability(self, bed_type: BedType) -> Dict:
+        pool = self.pools[bed_type]
+        with self._locks[bed_type]:
+            total = pool.total
+            occupied = pool.count(BedStatus.OCCUPIED)
+            counts = {
+                'available': pool.count(BedStatus.AVAILABLE),
+                'occupied': occupied,
+                'reserved': pool.count(BedStatus.RESERVED),
+                'maintenance': pool.count(BedStatus.MAINTENANCE),
+                'waiting': len(self.waiting_lists[bed_type])
+            }
+        return {
+            'bed_type': bed_type.value,
+            'total': total,
+            **counts,
+            'occupancy_rate': round((occupied / total) * 100, 1) if total else 0.0
+        }
+    
     def reserve_bed(self, bed_type: BedType, patient_id: str, 
-                   emergency_id: str, duration_minutes: int = 30) -> Optional[Dict]:
-        """Reserve bed for incoming emergency"""
-        
-        # Check availability
-        if self.beds[bed_type]['available'] == 0:
-            # Try to find alternative
-            return self._find_alternative_bed(bed_type, patient_id, emergency_id)
-        
-        # Find first available bed
-        for bed in self.beds[bed_type]['beds']:
-            if bed['status'] == BedStatus.AVAILABLE:
-                # Reserve the bed
-                bed['status'] = BedStatus.RESERVED
-                bed['reserved_for'] = patient_id
-                bed['reserved_at'] = datetime.now()
-                bed['expires_at'] = datetime.now() + timedelta(minutes=duration_minutes)
-                
-                # Update counts
-                self.beds[bed_type]['available'] -= 1
-                self.beds[bed_type]['reserved'] += 1
-                
-                # Store reservation
-                self.reservations[emergency_id] = {
-                    'bed_id': bed['id'],
-                    'bed_type': bed_type.value,
-                    'patient_id': patient_id,
-                    'reserved_at': bed['reserved_at'],
-                    'expires_at': bed['expires_at']
-                }
-                
-                return {
-                    'success': True,
-                    'bed_id': bed['id'],
-                    'bed_type': bed_type.value,
-                    'equipment': bed['equipment'],
-                    'expires_in_minutes': duration_minutes
-                }
+                   emergency_id: str, duration_minutes: int = 30, severity: int = 5) -> Optional[Dict]:
+        """Reserve bed for incoming emergency (severity 1-10 orders the waiting list)"""
+        self._expire_due()
         
-        return None
-    
-    def _find_alternative_bed(self, preferred_type: BedType, 
-                             patient_id: str, emergency_id: str) -> Optional[Dict]:
-        """Find alternative bed if preferred type not available"""
+        # Fast path: only this type's lock
+        if emergency_id not in self._waiting:
+            with self._locks[bed_type]:
+                if emergency_id not in self._waiting:
+                    bed = self.pools[bed_type].take_available()
+                    if bed is not None:
+                        return self._reserve(bed, patient_id, emergency_id, duration_minutes)
         
-        # Upgrade path: GENERAL → OXYGEN → HDU → ICU
-        # Downgrade path: ICU → HDU → OXYGEN → GENERAL
+        # Fallback (and waiting-list retries) need the alternatives' locks too,
+        # plus the list the emergency already waits on
+        fallback_types = [bed_type] + self.ALTERNATIVE_BED_TYPES.get(bed_type, [])
+        while True:
+            waiting_type = self._waiting.get(emergency_id)
+            lock_types = fallback_types + ([waiting_type] if waiting_type else [])
+            with self._locked(lock_types):
+                if self._waiting.get(emergency_id) != waiting_type:
+                    continue  # Matched or re-queued by another thread meanwhile
+                bed = self.pools[bed_type].take_available()
+                if bed is not None:
+                    return self._reserve(bed, patient_id, emergency_id, duration_minutes)
+                # Try to find alternative
+                return self._find_alternative_bed(bed_type, patient_id, emergency_id, duration_minutes, severity)
+    
+    def _reserve(self, bed: Dict, patient_id: str, emergency_id: str, duration_minutes: int) -> Dict:
+        """Reserve a bed already taken out of the available pool (its type's lock held)"""
+        reserved_at = datetime.now()
+        self._mark_reserved(bed, patient_id, emergency_id, reserved_at, reserved_at + timedelta(minutes=duration_minutes))
+        self._record(BedEventKind.RESERVED, bed['id'], emergency_id=emergency_id, patient_id=patient_id,
+                     at=_timestamp(reserved_at), expires_at=_timestamp(bed['expires_at']))
         
-        alternatives = {
-            BedType.ICU: [BedType.HDU],
-            BedType.HDU: [BedType.ICU, BedType.OXYGEN],
-            BedType.OXYGEN: [BedType.HDU, BedType.GENERAL],
-            BedType.GENERAL: [BedType.OXYGEN]
+        return {
+            'success': True,
+            'bed_id': bed['id'],
+            'bed_type': bed['bed_type'].value,
+            'equipment': bed['equipment'],
+            'expires_in_minutes': duration_minutes
         }
+    
+    def _mark_reserved(self, bed: Dict, patient_id: str, emergency_id: str,
+                       reserved_at: datetime, expires_at: datetime) -> None:
+        bed_type = bed['bed_type']
+        waiting_type = self._waiting.pop(emergency_id, None)
+        if waiting_type is not None:
+            self.waiting_lists[waiting_type].remove(emergency_id)
+        
+        # Reserve the bed
+        bed['status'] = BedStatus.RESERVED
+        bed['reserved_for'] = patient_id
+        bed['emergency_id'] = emergency_id
+        bed['reserved_at'] = reserved_at
+        bed['expires_at'] = expires_at
+        self.pools[bed_type].add(bed)
+        heapq.heappush(self._expiry_heaps[bed_type], (expires_at, next(self._expiry_order), emergency_id, bed['id']))
         
-        for alt_type in alternatives.get(preferred_type, []):
-            if self.beds[alt_type]['available'] > 0:
-                result = self.reserve_bed(alt_type, patient_id, emergency_id)
-                if result:
-                    result['is_alternative'] = True
-                    result['preferred_type'] = preferred_type.value
-                    return result
+        # Store reservation
+        self.reservations[emergency_id] = {
+            'bed_id': bed['id'],
+            'bed_type': bed_type.value,
+            'patient_id': patient_id,
+            'reserved_at': reserved_at,
+            'expires_at': expires_at
+        }
+    
+    def _find_alternative_bed(self, preferred_type: BedType, patient_id: str,
+                             emergency_id: str, duration_minutes: int = 30, severity: int = 5) -> Optional[Dict]:
+        """Find alternative bed if preferred type not available (locks of all these types held)"""
+        for alt_type in self.ALTERNATIVE_BED_TYPES.get(preferred_type, []):
+            bed = self.pools[alt_type].take_available()
+            if bed is not None:
+                result = self._reserve(bed, patient_id, emergency_id, duration_minutes)
+                result['is_alternative'] = True
+                result['preferred_type'] = preferred_type.value
+                return result
         
         return {
             'success': False,
             'message': 'No beds available',
-            'waiting_list_position': self._add_to_waiting_list(patient_id, preferred_type)
+            'waiting_list_position': self._add_to_waiting_list(
+                patient_id, preferred_type, emergency_id, duration_minutes, severity)
         }
     
-    def _add_to_waiting_list(self, patient_id: str, bed_type: BedType) -> int:
-        """Add patient to waiting list"""
-        # Simplified waiting list
-        return 1  # Position in queue
+    def _add_to_waiting_list(self, patient_id: str, bed_type: BedType, emergency_id: str,
+                             duration_minutes: int = 30, severity: int = 5) -> int:
+        """Add patient to waiting list; returns the position in queue"""
+        waiting_type = self._waiting.get(emergency_id)
+        if waiting_type is not None:
+            # Retried request: keep the original place in the queue
+            return self.waiting_lists[waiting_type].position(emergency_id)
+        
+        added_at = datetime.now()
+        position = self._queue_waiting(patient_id, bed_type, emergency_id, duration_minutes, severity, added_at)
+        self._record(BedEventKind.WAITING, bed_type.value, emergency_id=emergency_id, patient_id=patient_id,
+                     at=_timestamp(added_at), severity=severity, duration=duration_minutes)
+        return position
+    
+    def _queue_waiting(self, patient_id: str, bed_type: BedType, emergency_id: str,
+                       duration_minutes: int, severity: int, added_at: datetime) -> int:
+        self._waiting[emergency_id] = bed_type
+        return self.waiting_lists[bed_type].add({
+            'emergency_id': emergency_id,
+            'patient_id': patient_id,
+            'bed_type': bed_type,
+            'severity': severity,
+            'duration_minutes': duration_minutes,
+            'added_at': added_at,
+            'arrival': next(self._arrival_order)
+        })
+    
+    def get_waiting_position(self, emergency_id: str) -> Optional[Dict]:
+        """Where a waiting emergency stands in its bed type's queue (None if not waiting)"""
+        self._expire_due()
+        bed_type = self._waiting.get(emergency_id)
+        if bed_type is None:
+            return None
+        waiting = self.waiting_lists[bed_type]
+        with self._locks[bed_type]:
+            position = waiting.position(emergency_id)
+            if position is None:
+                return None  # Matched meanwhile
+            return {
+                'bed_type': bed_type.value,
+                'position': position,
+                'waiting': len(waiting)
+            }
+    
+    def cancel_waiting(self, emergency_id: str) -> bool:
+        """Take an emergency off the waiting list"""
+        bed_type = self._waiting.get(emergency_id)
+        if bed_type is None:
+            return False
+        with self._locks[bed_type]:
+            if self._waiting.get(emergency_id) != bed_type:
+                return False  # Matched meanwhile
+            del self._waiting[emergency_id]
+            self.waiting_lists[bed_type].remove(emergency_id)
+            self._record(BedEventKind.WAITING_CANCELLED, bed_type.value, emergency_id=emergency_id)
+        return True
     
     def confirm_admission(self, emergency_id: str) -> bool:
         """Confirm patient admission (convert reservation to occupied)"""
-        if emergency_id not in self.reservations:
+        self._expire_due()  # A lapsed reservation can no longer be confirmed
+        reservation = self.reservations.get(emergency_id)
+        if reservation is None:
             return False
         
-        reservation = self.reservations[emergency_id]
-        bed_type = BedType(reservation['bed_type'])
-        bed_id = reservation['bed_id']
+        bed = self.beds[reservation['bed_id']]
+        with self._locks[bed['bed_type']]:
+            if bed['status'] != BedStatus.RESERVED or bed.get('emergency_id') != emergency_id:
+                return False
+            self.pools[bed['bed_type']].move(bed, BedStatus.OCCUPIED)
+            bed['patient_id'] = bed['reserved_for']
+            bed['admitted_at'] = datetime.now()
+            self._record(BedEventKind.ADMITTED, bed['id'], at=_timestamp(bed['admitted_at']))
+        return True
+    
+    def release_bed(self, bed_id: str) -> bool:
+        """Free a reserved or occupied bed (cancellation or discharge)"""
+        self._expire_due()
+        bed = self.beds.get(bed_id)
+        if bed is None:
+            return False
         
-        # Find and update bed
-        for bed in self.beds[bed_type]['beds']:
-            if bed['id'] == bed_id:
-                bed['status'] = BedStatus.OCCUPIED
-                bed['patient_id'] = reservation['patient_id']
-                bed['admitted_at'] = datetime.now()
-                
-                # Update counts
-                self.beds[bed_type]['reserved'] -= 1
-                self.beds[bed_type]['occupied'] += 1
-                
-                return True
+        with self._claimant_locks[bed['bed_type']]:
+            if bed['status'] not in (BedStatus.RESERVED, BedStatus.OCCUPIED):
+                return False
+            reason = 'discharged' if bed['status'] == BedStatus.OCCUPIED else 'cancelled'
+            event = self._free_bed(bed, reason)
+        self._emit([event])
+        return True
+    
+    def set_maintenance(self, bed_id: str, in_maintenance: bool = True) -> bool:
+        """Take an available bed out of service, or return one to service"""
+        self._expire_due()
+        bed = self.beds.get(bed_id)
+        if bed is None:
+            return False
         
-        return False
-
+        if in_maintenance:
+            with self._locks[bed['bed_type']]:
+                if bed['status'] != BedStatus.AVAILABLE:
+                    return False
+                self.pools[bed['bed_type']].move(bed, BedStatus.MAINTENANCE)
+                self._record(BedEventKind.MAINTENANCE, bed_id)
+            return True
+        
+        with self._claimant_locks[bed['bed_type']]:
+            if bed['status'] != BedStatus.MAINTENANCE:
+                return False
+            event = self._free_bed(bed, 'returned_to_service')
+        self._emit([event])
+        return True
+    
+    def _record(self, kind: BedEventKind, target: str, **fields) -> None:
+        # Called under the lock guarding the change, so the log order is the change order
+        if self.event_store is not None:
+            self.event_store.append(kind, target, **fields)
+    
+    def _apply_event(self, kind: int, target: str, emergency_id: Optional[str], patient_id: Optional[str],
+                     at: float, expires_at: Optional[float], severity: Optional[int],
+                     duration: Optional[int]) -> None:
+        """Redo one logged change (recovery; no locks, events or matching)"""
+        if kind == BedEventKind.WAITING:
+            self._queue_waiting(patient_id, BedType(target), emergency_id, duration, severity, _datetime(at))
+            return
+        if kind == BedEventKind.WAITING_CANCELLED:
+            if self._waiting.pop(emergency_id, None) is not None:
+                self.waiting_lists[BedType(target)].remove(emergency_id)
+            return
+        
+        bed = self.beds.get(target)
+        if bed is None:
+            raise ValueError(f"Bed event log refers to {target}, which is not in the inventory")
+        if kind == BedEventKind.RESERVED:
+            del self.pools[bed['bed_type']].by_status[bed['status']][bed['id']]
+            self._mark_reserved(bed, patient_id, emergency_id, _datetime(at), _datetime(expires_at))
+        elif kind == BedEventKind.ADMITTED:
+            self.pools[bed['bed_type']].move(bed, BedStatus.OCCUPIED)
+            bed['patient_id'] = bed.get('reserved_for')
+            bed['admitted_at'] = _datetime(at)
+        elif kind == BedEventKind.MAINTENANCE:
+            self.pools[bed['bed_type']].move(bed, BedStatus.MAINTENANCE)
+        else:  # Released, expired or returned to service
+            self._clear_bed(bed)
+    
+    def _snapshot_state(self) -> Dict:
+        """JSON-able bed and waiting-list state (caller holds every lock)"""
+        beds = [
+            [bed['id'], bed['status'].value, bed.get('reserved_for'), bed.get('emergency_id'),
+             _timestamp(bed.get('reserved_at')), _timestamp(bed.get('expires_at')),
+             bed.get('patient_id'), _timestamp(bed.get('admitted_at'))]
+            for pool in self.pools.values()
+            for status, by_id in pool.by_status.items() if status != BedStatus.AVAILABLE
+            for bed in by_id.values()
+        ]
+        entries = sorted((entry for waiting in self.waiting_lists.values() for entry in waiting.entries.values()),
+                         key=lambda entry: entry['arrival'])
+        waiting = [
+            [entry['emergency_id'], entry['patient_id'], entry['bed_type'].value, entry['severity'],
+             entry['duration_minutes'], _timestamp(entry['added_at'])]
+            for entry in entries
+        ]
+        return {'beds': sorted(beds), 'waiting': waiting}
+    
+    def snapshot_state(self) -> Dict:
+        """The full bed and waiting-list state, as stored in snapshots"""
+        with self._locked(BedType):
+            return self._snapshot_state()
+    
+    def take_snapshot(self) -> int:
+        """Snapshot the state into the event store; returns the last event it covers"""
+        with self._locked(BedType):
+            seq = self.event_store.last_seq
+            state = self._snapshot_state()
+        self.event_store.save_snapshot(seq, state)
+        return seq
+    
+    def _restore_snapshot(self, state: Dict) -> None:
+        """Replace the census state with a snapshot (recovery)"""
+        for pool in self.pools.values():
+            for status in (BedStatus.OCCUPIED, BedStatus.RESERVED, BedStatus.MAINTENANCE):
+                for bed in list(pool.by_status[status].values()):
+                    self._clear_bed(bed)
+        
+        for bed_id, status, reserved_for, emergency_id, reserved_at, expires_at, patient_id, admitted_at in state['beds']:
+            bed = self.beds.get(bed_id)
+            if bed is None:
+                raise ValueError(f"Bed snapshot refers to {bed_id}, which is not in the inventory")
+            fields = dict(zip(_BED_FIELDS, (reserved_for, emergency_id, _datetime(reserved_at),
+                                            _datetime(expires_at), patient_id, _datetime(admitted_at))))
+            bed.update((key, value) for key, value in fields.items() if value is not None)
+            self.pools[bed['bed_type']].move(bed, BedStatus(status))
+            if emergency_id is not None:
+                self.reservations[emergency_id] = {
+                    'bed_id': bed_id,
+                    'bed_type': bed['bed_type'].value,
+                    'patient_id': reserved_for,
+                    'reserved_at': bed['reserved_at'],
+                    'expires_at': bed['expires_at']
+                }
+                if status == BedStatus.RESERVED.value:
+                    heapq.heappush(self._expiry_heaps[bed['bed_type']],
+                                   (bed['expires_at'], next(self._expiry_order), emergency_id, bed_id))
+        
+        for emergency_id, patient_id, bed_type, severity, duration, added_at in state['waiting']:
+            self._queue_waiting(patient_id, BedType(bed_type), emergency_id, duration, severity, _datetime(added_at))
 
 class DoctorAlertSystem:
     """Intelligent doctor alert and clinical decision support"""
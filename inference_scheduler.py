@@ -0,0 +1,239 @@
+"""
+INFERENCE SCHEDULER
+Micro-batching of concurrent single-row predictions into one model call
+"""
+
+import atexit
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+_STOP = object()  # Sentinel that tells the batcher thread to exit
+
+
+class InferenceBatcher:
+    """
+    Shares one vectorized predict_proba call between request threads
+
+    - submit(row) enqueues a feature row and returns a Future; predict(row)
+      waits for it
+    - A background thread takes the oldest row plus everything already
+      queued, keeps collecting for the current window (at most max_delay
+      seconds) or until max_batch_size rows, then runs predict_proba once
+    - The window is adaptive: it doubles while batches find company and
+      halves (down to zero) when waiting collected nothing, so a lone
+      request under light traffic goes straight to the model
+    - Rows that queue up while a batch is running form the next batch
+
+    predict_proba(X) gets an (n, n_features) array and must return one row
+    of probabilities per input row. If it raises, every caller in that
+    batch gets the exception.
+    """
+
+    def __init__(self, predict_proba: Callable, max_batch_size: int = 64,
+                 max_delay: float = 0.002):
+        self.predict_proba = predict_proba
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.min_window = max_delay / 8  # Smallest non-zero window
+
+        self._lock = threading.Lock()
+        self._pid = None
+        self._thread = None
+        self._queue = queue.SimpleQueue()
+        self._closed = False
+        self._window = 0.0  # Current collection window (seconds)
+        self._metrics = {
+            'requests': 0,
+            'batches': 0,
+            'rows_predicted': 0,
+            'failed_batches': 0,
+            'immediate_batches': 0,
+            'max_batch_size_seen': 0,
+            'total_queue_wait_ms': 0.0,
+            'max_queue_wait_ms': 0.0,
+            'total_predict_ms': 0.0
+        }
+        self._batch_sizes = {}  # power-of-two bucket -> batches
+        atexit.register(self.close)
+
+    def _ensure_worker(self) -> None:
+        """Start the batcher thread (again, in a forked worker process); lock held"""
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name='inference-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, row) -> Future:
+        """Queue one feature row; the Future resolves to its probability row"""
+        future = Future()
+        with self._lock:
+            # Checked and queued under the lock: close() can't slip in between
+            if not self._closed:
+                self._ensure_worker()
+                self._metrics['requests'] += 1
+                self._queue.put((row, future, time.monotonic()))
+                return future
+
+        # Shut down: predict in the caller thread
+        future.set_result(self.predict_proba(np.asarray(row, dtype=float).reshape(1, -1))[0])
+        return future
+
+    def predict(self, row, timeout: Optional[float] = None):
+        """Probability row for one feature row (blocks until its batch ran)"""
+        return self.submit(row).result(timeout)
+
+    def _run(self) -> None:
+        """Batcher thread: collect a micro-batch, predict it, resolve futures"""
+        q = self._queue
+        while True:
+            item = q.get()
+            if item is _STOP:
+                return
+
+            batch = [item]
+            stop_after_batch = self._take_queued(batch)
+            waited = False
+            if not stop_after_batch and self._window > 0:
+                stop_after_batch, waited = self._collect_window(batch, deadline=item[2] + self._window)
+            self._adapt_window(len(batch))
+
+            self._predict_batch(batch, waited)
+            if stop_after_batch:
+                return
+
+    def _take_queued(self, batch: List) -> bool:
+        """Add rows that are already waiting; True if the stop sentinel was seen"""
+        while len(batch) < self.max_batch_size:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return False
+            if item is _STOP:
+                return True
+            batch.append(item)
+        return False
+
+    def _collect_window(self, batch: List, deadline: float):
+        """Wait for more rows until the deadline; returns (stop, waited)"""
+        waited = False
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            waited = True
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return True, waited
+            batch.append(item)
+        return False, waited
+
+    def _adapt_window(self, batch_size: int) -> None:
+        """Grow the window while requests overlap, shrink it when they don't"""
+        if batch_size > 1:
+            self._window = min(self.max_delay, max(self._window * 2, self.min_window))
+        elif self._window > 0:
+            self._window = self._window / 2 if self._window / 2 >= self.min_window else 0.0
+
+    def _predict_batch(self, batch: List, waited: bool) -> None:
+        """One model call for the whole batch"""
+        start = time.monotonic()
+        waits_ms = [(start - enqueued_at) * 1000 for _, _, enqueued_at in batch]
+        try:
+            X = np.asarray([row for row, _, _ in batch], dtype=float)
+            probabilities = self.predict_proba(X)
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            with self._lock:
+                self._metrics['failed_batches'] += 1
+            return
+        predict_ms = (time.monotonic() - start) * 1000
+
+        for (_, future, _), probability in zip(batch, probabilities):
+            future.set_result(probability)
+
+        size = len(batch)
+        bucket = 1 << (size - 1).bit_length()
+        with self._lock:
+            self._metrics['batches'] += 1
+            self._metrics['rows_predicted'] += size
+            if not waited:
+                self._metrics['immediate_batches'] += 1
+            self._metrics['max_batch_size_seen'] = max(self._metrics['max_batch_size_seen'], size)
+            self._metrics['total_queue_wait_ms'] += sum(waits_ms)
+            self._metrics['max_queue_wait_ms'] = max(self._metrics['max_queue_wait_ms'], max(waits_ms))
+            self._metrics['total_predict_ms'] += predict_ms
+            self._batch_sizes[bucket] = self._batch_sizes.get(bucket, 0) + 1
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Finish queued rows and stop the batcher thread"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread if self._pid == os.getpid() else None
+        if thread is not None and thread.is_alive():
+            self._queue.put(_STOP)
+            thread.join(timeout)
+        self._resolve_remaining()
+
+    def _resolve_remaining(self) -> None:
+        """Predict rows the thread left behind (it died, or join timed out) in the closing thread"""
+        batch = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                batch.append(item)
+        for start in range(0, len(batch), self.max_batch_size):
+            self._predict_batch(batch[start:start + self.max_batch_size], waited=False)
+
+    def get_metrics(self) -> Dict:
+        """Batch size and queue wait statistics"""
+        with self._lock:
+            metrics = dict(self._metrics)
+            batch_sizes = dict(sorted(self._batch_sizes.items()))
+            metrics['window_ms'] = round(self._window * 1000, 3)
+        batches = metrics['batches']
+        rows = metrics['rows_predicted']
+        metrics['avg_batch_size'] = round(rows / batches, 2) if batches else 0.0
+        metrics['avg_queue_wait_ms'] = round(metrics['total_queue_wait_ms'] / rows, 3) if rows else 0.0
+        metrics['avg_predict_ms'] = round(metrics['total_predict_ms'] / batches, 3) if batches else 0.0
+        metrics['max_queue_wait_ms'] = round(metrics['max_queue_wait_ms'], 3)
+        metrics['total_queue_wait_ms'] = round(metrics['total_queue_wait_ms'], 3)
+        metrics['total_predict_ms'] = round(metrics['total_predict_ms'], 3)
+        metrics['batch_size_histogram'] = {f'<={size}': count for size, count in batch_sizes.items()}
+        metrics['max_batch_size'] = self.max_batch_size
+        metrics['max_delay_ms'] = self.max_delay * 1000
+        return metrics
+
+
+# Example usage
+if __name__ == "__main__":
+    from concurrent.futures import ThreadPoolExecutor
+
+    def slow_model(X):
+        time.sleep(0.001)  # Fixed per-call cost, like a model invocation
+        return np.column_stack([1 - X[:, 0] / 100, X[:, 0] / 100])
+
+    batcher = InferenceBatcher(slow_model, max_batch_size=32, max_delay=0.003)
+    print(f"Single request: {batcher.predict([42.0])}")
+
+    with ThreadPoolExecutor(max_workers=50) as executor:
+        results = list(executor.map(lambda i: batcher.predict([i % 100]), range(2000)))
+    print(f"2000 concurrent requests -> {len(results)} results")
+    print(f"Metrics: {batcher.get_metrics()}")
+    batcher.close()
@@ -0,0 +1,407 @@
+"""
+INFERENCE SIDECAR
+One model-serving process shared by every web worker over a Unix socket
+
+Usage:
+    python inference_server.py [socket_path]     # default: $INFERENCE_SOCKET
+    INFERENCE_SOCKET=/tmp/health-inference.sock python app.py
+    kill -HUP <sidecar pid>                      # reload active registry versions
+
+Wire format (little-endian), one frame per message:
+    header  <BII  (op or status, rows, cols)
+    payload rows * cols float64, row-major
+An error response has status STATUS_ERROR, rows = message length in bytes,
+cols = 0, and the UTF-8 message as payload.
+"""
+
+import os
+import queue
+import signal
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+import numpy as np
+
+DEFAULT_SOCKET_PATH = '/tmp/health-inference.sock'
+
+HEADER = struct.Struct('<BII')
+MAX_ROWS = 100000  # Per request; bounds what one frame can make the server allocate
+
+# Request ops
+OP_INFO = 0           # -> 1 x n: HealthRiskPredictor class labels
+OP_RISK = 1           # n x 6 vitals -> n x 3 risk probabilities (Low/Medium/High)
+OP_ADVANCED = 2       # n x 6 vitals -> n x 6 (low, high) for heart, diabetes, respiratory
+OP_IMPORTANCE = 3     # -> 3 x 6 feature importances, same model order as OP_ADVANCED
+
+# Response status
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+ADVANCED_MODELS = ('heart', 'diabetes', 'respiratory')
+N_FEATURES = 6
+
+
+class InferenceUnavailable(ConnectionError):
+    """Sidecar unreachable, timed out or returned an error"""
+
+
+def _recv_exact(sock, size: int) -> bytes:
+    """Read exactly size bytes (b'' if the peer closed before the first byte)"""
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if count == 0:
+            if received == 0:
+                return b''
+            raise ConnectionError('Connection closed mid-frame')
+        received += count
+    return bytes(buffer)
+
+
+def send_frame(sock, code: int, array: np.ndarray) -> None:
+    """Header + float64 payload in a single send"""
+    array = np.ascontiguousarray(array, dtype='<f8')
+    rows, cols = array.shape
+    sock.sendall(HEADER.pack(code, rows, cols) + array.tobytes())
+
+
+def send_error(sock, message: str) -> None:
+    payload = message.encode('utf-8')
+    sock.sendall(HEADER.pack(STATUS_ERROR, len(payload), 0) + payload)
+
+
+def recv_frame(sock, response: bool = False):
+    """(code, array) of the next frame, or None at a clean end of stream"""
+    header = _recv_exact(sock, HEADER.size)
+    if not header:
+        return None
+    code, rows, cols = HEADER.unpack(header)
+    if response and code == STATUS_ERROR:
+        return code, _recv_exact(sock, rows).decode('utf-8', 'replace')
+    if rows > MAX_ROWS or cols > 64:
+        raise ValueError(f'Frame too large: {rows}x{cols}')
+    payload = _recv_exact(sock, rows * cols * 8) if rows * cols else b''
+    return code, np.frombuffer(payload, dtype='<f8').reshape(rows, cols)
+
+
+@contextmanager
+def _umask(mask: int):
+    """Set the process umask for the with-block (files get their final mode at creation)"""
+    previous = os.umask(mask)
+    try:
+        yield
+    finally:
+        os.umask(previous)
+
+
+class InferenceServer:
+    """
+    Loads HealthRiskPredictor and AdvancedHealthRiskPredictor once and
+    answers prediction frames from any number of worker connections
+
+    - One thread per connection; clients keep connections open (pooled)
+    - Single-row OP_RISK requests from all workers are micro-batched into
+      shared model calls (InferenceBatcher); multi-row requests go direct
+    - With a ModelRegistry, reload() swaps in the active versions while
+      serving (clients keep the feature importances they already fetched)
+    """
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET_PATH, registry=None):
+        # Model modules are imported here so web workers importing the client stay small
+        from advanced_ai_model import AdvancedHealthRiskPredictor
+        from ai_model import HealthRiskPredictor
+        from inference_scheduler import InferenceBatcher
+
+        self.socket_path = socket_path
+        self.registry = registry
+        self.risk_predictor = HealthRiskPredictor(registry=registry)
+        self.advanced_predictor = AdvancedHealthRiskPredictor(registry=registry)
+        self.batcher = InferenceBatcher(self.risk_predictor.predict_proba)
+        self._server = None
+
+        self._lock = threading.Lock()
+        self._metrics = {
+            'connections_opened': 0,
+            'connections_closed': 0,
+            'requests': 0,
+            'rows': 0,
+            'errors': 0
+        }
+
+    def advanced_proba(self, X: np.ndarray) -> np.ndarray:
+        """(low, high) probability pairs for the three advanced models"""
+        predictor = self.advanced_predictor
+        probabilities = predictor.predict_proba_all((X - predictor.scaler.mean_) / predictor.scaler.scale_)
+        return np.hstack([probabilities[risk_type] for risk_type in ADVANCED_MODELS])
+
+    def feature_importances(self) -> np.ndarray:
+        importances = self.advanced_predictor.feature_importance_arrays()
+        return np.array([importances[risk_type] for risk_type in ADVANCED_MODELS])
+
+    def handle(self, op: int, X: np.ndarray) -> np.ndarray:
+        """Answer one request frame"""
+        if op == OP_INFO:
+            return np.asarray(self.risk_predictor.get_classes(), dtype=float).reshape(1, -1)
+        if op == OP_IMPORTANCE:
+            return self.feature_importances()
+        if X.shape[1] != N_FEATURES:
+            raise ValueError(f'Expected {N_FEATURES} features, got {X.shape[1]}')
+        if op == OP_RISK:
+            if len(X) == 1:
+                return self.batcher.predict(X[0]).reshape(1, -1)
+            return self.risk_predictor.predict_proba(X)
+        if op == OP_ADVANCED:
+            return self.advanced_proba(X)
+        raise ValueError(f'Unknown op {op}')
+
+    def _serve_connection(self, sock) -> None:
+        with self._lock:
+            self._metrics['connections_opened'] += 1
+        try:
+            while True:
+                frame = recv_frame(sock)
+                if frame is None:
+                    return
+                op, X = frame
+                try:
+                    result = self.handle(op, X)
+                except Exception as e:
+                    with self._lock:
+                        self._metrics['errors'] += 1
+                    send_error(sock, str(e))
+                    continue
+                send_frame(sock, STATUS_OK, result)
+                with self._lock:
+                    self._metrics['requests'] += 1
+                    self._metrics['rows'] += len(X)
+        except (ConnectionError, ValueError) as e:
+            print(f"⚠️ Inference connection dropped: {e}")
+        finally:
+            with self._lock:
+                self._metrics['connections_closed'] += 1
+
+    def serve_forever(self) -> None:
+        """Bind the socket (replacing a stale one) and serve until shutdown()"""
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+        server = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                server._serve_connection(self.request)
+
+        # Created 0o660 (same user/group as the web workers only): a chmod after
+        # bind() would leave a window where any local user could connect
+        with _umask(0o117):
+            self._server = socketserver.ThreadingUnixStreamServer(self.socket_path, Handler)
+        self._server.daemon_threads = True
+        print(f"✅ Inference sidecar listening on {self.socket_path}")
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def shutdown(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+
+    def reload(self) -> None:
+        """Serve the registry's active versions (in-flight requests finish on the old ones)"""
+        from advanced_ai_model import AdvancedHealthRiskPredictor
+
+        if self.registry is None:
+            print("⚠️ Reload ignored: no model registry configured")
+            return
+        try:
+            self.risk_predictor.reload()
+            # Fully built before one attribute swap; advanced_proba reads it once
+            self.advanced_predictor = AdvancedHealthRiskPredictor(registry=self.registry)
+        except Exception as e:
+            print(f"❌ Model reload failed, still serving the previous versions: {e}")
+
+    def get_metrics(self) -> Dict:
+        with self._lock:
+            metrics = dict(self._metrics)
+        metrics['open_connections'] = metrics['connections_opened'] - metrics['connections_closed']
+        metrics['batcher'] = self.batcher.get_metrics()
+        return metrics
+
+
+class InferenceClient:
+    """
+    Pooled connections from a web worker to the inference sidecar
+
+    - Up to pool_size persistent connections, reused LIFO; a caller waits
+      up to timeout seconds when all are busy
+    - A connection that fails mid-request is discarded, never reused
+    - Every failure raises InferenceUnavailable so callers can fall back
+    - The pool is rebuilt after fork (connections are never shared
+      between processes)
+    """
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET_PATH, pool_size: int = 4,
+                 timeout: float = 2.0):
+        self.socket_path = socket_path
+        self.pool_size = pool_size
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        self._pid = None
+        self._idle = None
+        self._open = 0
+        self._classes = None
+        self._importances = None
+        self._metrics = {
+            'requests': 0,
+            'errors': 0,
+            'connections_opened': 0,
+            'pool_waits': 0,
+            'total_round_trip_ms': 0.0
+        }
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    @contextmanager
+    def _connection(self):
+        """Check out a pooled connection (opened on demand)"""
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._idle = queue.LifoQueue()
+                self._open = 0
+            idle = self._idle
+            create = idle.empty() and self._open < self.pool_size
+            if create:
+                self._open += 1
+
+        if create:
+            try:
+                sock = self._connect()
+            except OSError:
+                with self._lock:
+                    self._open -= 1
+                raise
+            with self._lock:
+                self._metrics['connections_opened'] += 1
+        else:
+            try:
+                sock = idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    self._metrics['pool_waits'] += 1
+                try:
+                    sock = idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise TimeoutError('No inference connection available')
+
+        try:
+            yield sock
+        except BaseException:
+            sock.close()
+            with self._lock:
+                if self._idle is idle:
+                    self._open -= 1
+            raise
+        idle.put(sock)
+
+    def call(self, op: int, X: Optional[np.ndarray] = None) -> np.ndarray:
+        """Send one request frame and return the result array"""
+        X = np.zeros((0, N_FEATURES)) if X is None else np.atleast_2d(np.asarray(X, dtype=float))
+        start = time.perf_counter()
+        try:
+            with self._connection() as sock:
+                send_frame(sock, op, X)
+                frame = recv_frame(sock, response=True)
+                if frame is None:
+                    raise ConnectionError('Inference sidecar closed the connection')
+        except (OSError, ValueError) as e:
+            with self._lock:
+                self._metrics['errors'] += 1
+            raise InferenceUnavailable(f'Inference sidecar unavailable: {e}') from e
+
+        status, result = frame
+        with self._lock:
+            self._metrics['requests'] += 1
+            self._metrics['total_round_trip_ms'] += (time.perf_counter() - start) * 1000
+            if status != STATUS_OK:
+                self._metrics['errors'] += 1
+        if status != STATUS_OK:
+            raise InferenceUnavailable(f'Inference sidecar error: {result}')
+        return result
+
+    def predict_proba(self, X) -> np.ndarray:
+        """HealthRiskPredictor probabilities, shape (rows, 3)"""
+        return self.call(OP_RISK, X)
+
+    def predict_all_proba(self, X) -> Dict[str, np.ndarray]:
+        """Advanced model probabilities: risk type -> (rows, 2)"""
+        result = self.call(OP_ADVANCED, X)
+        return {risk_type: result[:, 2 * i:2 * i + 2] for i, risk_type in enumerate(ADVANCED_MODELS)}
+
+    def classes(self) -> np.ndarray:
+        """HealthRiskPredictor class labels (fetched once)"""
+        if self._classes is None:
+            self._classes = self.call(OP_INFO)[0].astype(int)
+        return self._classes
+
+    def feature_importances(self) -> Dict[str, np.ndarray]:
+        """Advanced model feature importances (fetched once)"""
+        if self._importances is None:
+            result = self.call(OP_IMPORTANCE)
+            self._importances = dict(zip(ADVANCED_MODELS, result))
+        return self._importances
+
+    def close(self) -> None:
+        """Close idle connections"""
+        with self._lock:
+            idle = self._idle if self._pid == os.getpid() else None
+        while idle is not None:
+            try:
+                sock = idle.get_nowait()
+            except queue.Empty:
+                break
+            sock.close()
+            with self._lock:
+                self._open -= 1
+
+    def get_metrics(self) -> Dict:
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics['open_connections'] = self._open if self._pid == os.getpid() else 0
+        requests = metrics['requests']
+        metrics['avg_round_trip_ms'] = round(metrics['total_round_trip_ms'] / requests, 3) if requests else 0.0
+        metrics['total_round_trip_ms'] = round(metrics['total_round_trip_ms'], 3)
+        metrics['pool_size'] = self.pool_size
+        metrics['socket_path'] = self.socket_path
+        return metrics
+
+
+if __name__ == "__main__":
+    from model_registry import DEFAULT_REGISTRY_DIR, ModelRegistry
+
+    path = sys.argv[1] if len(sys.argv) > 1 else os.environ.get('INFERENCE_SOCKET', DEFAULT_SOCKET_PATH)
+    registry_dir = os.environ.get('MODEL_REGISTRY_DIR', DEFAULT_REGISTRY_DIR)
+    inference_server = InferenceServer(path, registry=ModelRegistry(registry_dir) if registry_dir else None)
+    # Reload off the signal handler (model loading takes a while)
+    signal.signal(signal.SIGHUP, lambda signum, frame: threading.Thread(
+        target=inference_server.reload, name='model-reload', daemon=True).start())
+    inference_server.serve_forever()
@@ -0,0 +1,165 @@
+"""
+MODEL ARTIFACTS
+Fitted models exported as uncompressed NumPy arrays for memory-mapped loading
+
+Artifact directory layout:
+    meta.json                     format, model names, feature names, trained_at
+    importances.npy               (models x features) feature importances
+    scaler_mean.npy, scaler_scale.npy   StandardScaler parameters (optional)
+    <model name>/                 CompiledForest.save() node arrays
+
+Loading maps the .npy files read-only: no unpickling and no sklearn import,
+and every process that loads the same artifact shares its pages through
+the OS page cache.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime
+
+import numpy as np
+
+from tree_inference import CompiledForest
+
+ARTIFACT_FORMAT = 'health-model-arrays'
+ARTIFACT_FORMAT_VERSION = 1
+
+
+class ArrayScaler:
+    """A fitted StandardScaler's mean_/scale_ and transform(), without sklearn"""
+
+    def __init__(self, mean, scale):
+        self.mean_ = mean
+        self.scale_ = scale
+
+    def transform(self, X):
+        # Same arithmetic as StandardScaler.transform (with_mean, with_std)
+        return (np.asarray(X, dtype=float) - self.mean_) / self.scale_
+
+
+class ModelArtifact:
+    """A loaded artifact: compiled engines plus the metadata saved with them"""
+
+    def __init__(self, path, meta, engines, feature_importances, scaler):
+        self.path = path
+        self.meta = meta
+        self.engines = engines  # name -> CompiledForest over mapped arrays
+        self.feature_importances = feature_importances  # name -> array
+        self.scaler = scaler  # ArrayScaler or None
+        self.feature_names = meta['feature_names']
+        self.trained_at = meta['trained_at']
+
+
+def export_artifact(path, models, feature_names, scaler=None, trained_at=None):
+    """
+    Compile fitted models ({name: forest}) and write them as an artifact
+
+    The directory is built next to path and renamed into place, so a
+    loader sees a complete artifact (processes that already mapped the old
+    one keep their pages until they reload).
+    """
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    building = tempfile.mkdtemp(dir=parent, prefix='.tmp-')
+    try:
+        for name, model in models.items():
+            CompiledForest(model).save(os.path.join(building, name))
+        np.save(os.path.join(building, 'importances.npy'),
+                np.array([model.feature_importances_ for model in models.values()], dtype=np.float64))
+        if scaler is not None:
+            np.save(os.path.join(building, 'scaler_mean.npy'), np.asarray(scaler.mean_, dtype=np.float64))
+            np.save(os.path.join(building, 'scaler_scale.npy'), np.asarray(scaler.scale_, dtype=np.float64))
+
+        meta = {
+            'format': ARTIFACT_FORMAT,
+            'format_version': ARTIFACT_FORMAT_VERSION,
+            'models': list(models),
+            'feature_names': list(feature_names),
+            'scaler': scaler is not None,
+            'trained_at': trained_at or datetime.now().isoformat()
+        }
+        with open(os.path.join(building, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=2)
+
+        _sync_tree(building)
+        _replace_directory(building, path)
+    except BaseException:
+        shutil.rmtree(building, ignore_errors=True)
+        raise
+
+
+def _sync_tree(directory):
+    """fsync every file so the rename never exposes unwritten data"""
+    for root, _, files in os.walk(directory):
+        for name in files:
+            with open(os.path.join(root, name), 'rb') as f:
+                os.fsync(f.fileno())
+
+
+def _replace_directory(source, path):
+    """Rename source to path, moving an existing path out of the way first"""
+    if not os.path.exists(path):
+        os.replace(source, path)
+        return
+    retired = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.old-')
+    os.rmdir(retired)  # Reserve a unique name for the rename
+    os.replace(path, retired)
+    os.replace(source, path)
+    shutil.rmtree(retired, ignore_errors=True)  # Mapped files stay valid until unmapped
+
+
+def load_artifact(path, mmap_mode='r', model_loaders=None):
+    """
+    ModelArtifact from export_artifact() output
+
+    model_loaders: optional {name: callable returning the sklearn model},
+    used by each engine for batches where sklearn's Cython walk is faster
+    """
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    if meta.get('format') != ARTIFACT_FORMAT or meta.get('format_version') != ARTIFACT_FORMAT_VERSION:
+        raise ValueError(f"Unsupported model artifact format in {path}")
+
+    model_loaders = model_loaders or {}
+    engines = {
+        name: CompiledForest.load(os.path.join(path, name), mmap_mode=mmap_mode,
+                                  model_loader=model_loaders.get(name))
+        for name in meta['models']
+    }
+    importances = np.load(os.path.join(path, 'importances.npy'))
+    scaler = None
+    if meta['scaler']:
+        scaler = ArrayScaler(np.load(os.path.join(path, 'scaler_mean.npy')),
+                             np.load(os.path.join(path, 'scaler_scale.npy')))
+    return ModelArtifact(path, meta, engines, dict(zip(meta['models'], importances)), scaler)
+
+
+def artifact_is_current(path, source_path):
+    """True if path holds an artifact at least as new as the pickle it came from"""
+    meta_path = os.path.join(path, 'meta.json')
+    if not os.path.exists(meta_path):
+        return False
+    return not os.path.exists(source_path) or os.path.getmtime(meta_path) >= os.path.getmtime(source_path)
+
+
+# Example usage
+if __name__ == "__main__":
+    import time
+
+    from ai_model import HealthRiskPredictor
+
+    predictor = HealthRiskPredictor()
+    model = predictor.load_sklearn_model()
+    path = os.path.join(tempfile.mkdtemp(), 'health_risk_model')
+    export_artifact(path, {'risk': model}, ['age', 'bp_systolic', 'bp_diastolic',
+                                            'blood_sugar', 'heart_rate', 'spo2'])
+
+    start = time.perf_counter()
+    artifact = load_artifact(path)
+    print(f"Loaded {path} in {(time.perf_counter() - start) * 1000:.2f} ms")
+
+    X = np.random.default_rng(0).uniform([18, 90, 60, 60, 45, 85], [90, 200, 120, 320, 140, 100], size=(1000, 6))
+    identical = np.array_equal(artifact.engines['risk'].predict_proba_compiled(X), model.predict_proba(X))
+    print(f"Bit-identical to the sklearn model: {identical}")
@@ -0,0 +1,365 @@
+"""
+MODEL REGISTRY
+Versioned, checksummed model artifacts and shadow scoring of candidate versions
+"""
+
+import atexit
+import hashlib
+import io
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+try:
+    import fcntl  # Manifest lock between worker processes (POSIX)
+except ImportError:
+    fcntl = None
+
+DEFAULT_REGISTRY_DIR = 'model_registry'
+MANIFEST_FILE = 'manifest.json'
+
+_STOP = object()  # Sentinel that tells the shadow thread to exit
+
+
+class RegistryError(Exception):
+    """Unknown model/version, or an artifact that fails its checksum"""
+
+
+class ModelRegistry:
+    """
+    Directory of versioned model artifacts with a JSON manifest
+
+    Layout:
+        <root>/manifest.json
+        <root>/<name>/v<version>.pkl
+        <root>/<name>/v<version>/      optional memory-mappable export
+
+    The manifest records, per model name, every version's file, SHA-256,
+    size, creation time and metadata, plus the active version (what
+    predictors load) and an optional shadow version (scored on live traffic
+    without serving it).
+
+    Artifacts and the manifest are written to a temp file, fsynced and
+    renamed into place, so a reader sees the old or the new file, never a
+    partial one. Manifest updates hold an flock so worker processes don't
+    lose each other's changes. load() checks the SHA-256 of the exact bytes
+    it unpickles; load_arrays() checks the export directory's digest before
+    handing out its path.
+    """
+
+    def __init__(self, root: str = DEFAULT_REGISTRY_DIR):
+        self.root = root
+        self.manifest_path = os.path.join(root, MANIFEST_FILE)
+        os.makedirs(root, exist_ok=True)
+
+    @contextmanager
+    def _locked(self):
+        """Exclusive manifest lock (no-op where fcntl is unavailable)"""
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.root, '.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _write_atomic(path: str, data: bytes) -> None:
+        """Write via temp file + fsync + rename"""
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def manifest(self) -> Dict:
+        """Current manifest ({'models': {}} for an empty registry)"""
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'models': {}}
+
+    def _save_manifest(self, manifest: Dict) -> None:
+        self._write_atomic(self.manifest_path, json.dumps(manifest, indent=2, sort_keys=True).encode())
+
+    def _model_entry(self, manifest: Dict, name: str) -> Dict:
+        entry = manifest['models'].get(name)
+        if entry is None:
+            raise RegistryError(f'Unknown model {name!r}')
+        return entry
+
+    def _version_entry(self, manifest: Dict, name: str, version: int) -> Dict:
+        entry = self._model_entry(manifest, name)['versions'].get(str(version))
+        if entry is None:
+            raise RegistryError(f'{name} has no version {version}')
+        return entry
+
+    @staticmethod
+    def _directory_digest(path: str) -> str:
+        """SHA-256 over every file's relative path and contents"""
+        digest = hashlib.sha256()
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for file_name in sorted(files):
+                file_path = os.path.join(root, file_name)
+                digest.update(os.path.relpath(file_path, path).encode() + b'\0')
+                with open(file_path, 'rb') as f:
+                    digest.update(f.read())
+        return digest.hexdigest()
+
+    def publish(self, name: str, obj, metadata: Optional[Dict] = None, activate: bool = True,
+                export: Optional[Callable] = None) -> int:
+        """
+        Store obj as the next version of name; returns the version number
+
+        export(path), if given, writes a memory-mappable copy of the version
+        to the directory path (see model_artifact.export_artifact)
+        """
+        buffer = io.BytesIO()
+        import joblib  # Deferred: array-only loads never unpickle
+        joblib.dump(obj, buffer)
+        data = buffer.getvalue()
+
+        model_dir = os.path.join(self.root, name)
+        os.makedirs(model_dir, exist_ok=True)
+        with self._locked():
+            manifest = self.manifest()
+            entry = manifest['models'].setdefault(name, {'active': None, 'shadow': None, 'versions': {}})
+            version = max(map(int, entry['versions']), default=0) + 1
+            file_name = os.path.join(name, f'v{version}.pkl')
+            self._write_atomic(os.path.join(self.root, file_name), data)
+
+            entry['versions'][str(version)] = {
+                'file': file_name,
+                'sha256': hashlib.sha256(data).hexdigest(),
+                'bytes': len(data),
+                'created_at': datetime.now().isoformat(),
+                'metadata': metadata or {}
+            }
+            if export is not None:
+                arrays_dir = os.path.join(name, f'v{version}')
+                export(os.path.join(self.root, arrays_dir))
+                entry['versions'][str(version)]['arrays'] = {
+                    'dir': arrays_dir,
+                    'sha256': self._directory_digest(os.path.join(self.root, arrays_dir))
+                }
+            if activate:
+                entry['active'] = version
+            self._save_manifest(manifest)
+        return version
+
+    def activate(self, name: str, version: int) -> None:
+        """Make version the one predictors load on their next reload"""
+        with self._locked():
+            manifest = self.manifest()
+            self._version_entry(manifest, name, version)
+            self._model_entry(manifest, name)['active'] = version
+            self._save_manifest(manifest)
+
+    def set_shadow(self, name: str, version: Optional[int]) -> None:
+        """Version to shadow-score against live traffic (None: stop)"""
+        with self._locked():
+            manifest = self.manifest()
+            if version is not None:
+                self._version_entry(manifest, name, version)
+            self._model_entry(manifest, name)['shadow'] = version
+            self._save_manifest(manifest)
+
+    def active_version(self, name: str) -> Optional[int]:
+        entry = self.manifest()['models'].get(name)
+        return entry['active'] if entry else None
+
+    def shadow_version(self, name: str) -> Optional[int]:
+        entry = self.manifest()['models'].get(name)
+        return entry['shadow'] if entry else None
+
+    def _resolve(self, manifest: Dict, name: str, version: Optional[int]):
+        """(version, version entry); version None means the active one"""
+        if version is None:
+            version = self._model_entry(manifest, name)['active']
+            if version is None:
+                raise RegistryError(f'{name} has no active version')
+        return int(version), self._version_entry(manifest, name, version)
+
+    def has_arrays(self, name: str, version: Optional[int] = None) -> bool:
+        """True if the version (default: active) has a memory-mappable export"""
+        try:
+            return 'arrays' in self._resolve(self.manifest(), name, version)[1]
+        except RegistryError:
+            return False
+
+    def load_arrays(self, name: str, version: Optional[int] = None):
+        """(version, export directory path) for version (default: active), digest verified"""
+        version, entry = self._resolve(self.manifest(), name, version)
+        if 'arrays' not in entry:
+            raise RegistryError(f'{name} v{version} has no array export')
+        path = os.path.join(self.root, entry['arrays']['dir'])
+        if self._directory_digest(path) != entry['arrays']['sha256']:
+            raise RegistryError(f'{name} v{version} array export failed its checksum')
+        return version, path
+
+    def load(self, name: str, version: Optional[int] = None):
+        """(version, object) for version (default: active), checksum verified"""
+        version, entry = self._resolve(self.manifest(), name, version)
+
+        with open(os.path.join(self.root, entry['file']), 'rb') as f:
+            data = f.read()
+        if hashlib.sha256(data).hexdigest() != entry['sha256']:
+            raise RegistryError(f'{name} v{version} failed its checksum')
+        import joblib
+        return version, joblib.load(io.BytesIO(data))
+
+
+class ShadowScorer:
+    """
+    Scores a candidate model on copies of live predict_proba calls
+
+    - submit() is non-blocking: the live batch and its probabilities are
+      queued for a background thread, so the request path only pays for a
+      queue put (batches are dropped and counted when max_queue are waiting)
+    - The thread runs the candidate on the same rows and records label
+      agreement, probability differences and both models' latency
+    """
+
+    def __init__(self, predict_proba: Callable, version: int, max_queue: int = 256,
+                 latency_samples: int = 1000):
+        self.predict_proba = predict_proba
+        self.version = version
+
+        self._lock = threading.Lock()
+        self._pid = None
+        self._thread = None
+        self.max_queue = max_queue
+        self._queue = queue.SimpleQueue()
+        self._dropped = 0  # Updated without the lock (request path); may undercount
+        self._closed = False
+        self._live_ms = deque(maxlen=latency_samples)
+        self._shadow_ms = deque(maxlen=latency_samples)
+        self._metrics = {
+            'batches': 0,
+            'rows': 0,
+            'agreements': 0,
+            'errors': 0,
+            'total_abs_diff': 0.0,
+            'max_abs_diff': 0.0
+        }
+        atexit.register(self.close)
+
+    def _ensure_worker(self) -> None:
+        """Start the scoring thread (again, in a forked worker process)"""
+        if self._thread is not None and self._pid == os.getpid():
+            return  # Request path: no lock once running
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._queue = queue.SimpleQueue()
+            self._thread = threading.Thread(target=self._run, name='shadow-scorer', daemon=True)
+            self._thread.start()
+
+    def submit(self, X, live_proba, live_ms: float) -> None:
+        """Queue a live batch for comparison (never blocks)"""
+        if self._closed:
+            return
+        self._ensure_worker()
+        # SimpleQueue: no Python-level lock for request threads to contend on
+        if self._queue.qsize() >= self.max_queue:
+            self._dropped += 1
+            return
+        self._queue.put((X, live_proba, live_ms))
+
+    def _run(self) -> None:
+        q = self._queue
+        while True:
+            item = q.get()
+            if item is _STOP:
+                return
+            X, live_proba, live_ms = item
+            try:
+                start = time.perf_counter()
+                shadow_proba = self.predict_proba(X)
+                shadow_ms = (time.perf_counter() - start) * 1000
+                abs_diff = np.abs(np.asarray(shadow_proba) - np.asarray(live_proba)).max(axis=1)
+                agreements = int(np.sum(np.argmax(shadow_proba, axis=1) == np.argmax(live_proba, axis=1)))
+            except Exception as e:
+                print(f"⚠️ Shadow scoring failed: {e}")
+                with self._lock:
+                    self._metrics['errors'] += 1
+                continue
+
+            with self._lock:
+                self._metrics['batches'] += 1
+                self._metrics['rows'] += len(abs_diff)
+                self._metrics['agreements'] += agreements
+                self._metrics['total_abs_diff'] += float(abs_diff.sum())
+                self._metrics['max_abs_diff'] = max(self._metrics['max_abs_diff'], float(abs_diff.max()))
+                self._live_ms.append(live_ms)
+                self._shadow_ms.append(shadow_ms)
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Score what is queued and stop the thread"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread if self._pid == os.getpid() else None
+        if thread is not None and thread.is_alive():
+            self._queue.put(_STOP)
+            thread.join(timeout)
+
+    def get_metrics(self) -> Dict:
+        """Agreement and latency of the candidate vs the live model"""
+        with self._lock:
+            metrics = dict(self._metrics)
+            live_ms = list(self._live_ms)
+            shadow_ms = list(self._shadow_ms)
+        rows = metrics['rows']
+        metrics['dropped_batches'] = self._dropped
+        metrics['version'] = self.version
+        metrics['agreement_rate'] = round(metrics['agreements'] / rows, 4) if rows else None
+        metrics['mean_abs_diff'] = round(metrics['total_abs_diff'] / rows, 6) if rows else None
+        metrics['max_abs_diff'] = round(metrics['max_abs_diff'], 6)
+        del metrics['total_abs_diff']
+        for label, samples in (('live', live_ms), ('shadow', shadow_ms)):
+            if samples:
+                p50, p99 = np.percentile(samples, [50, 99])
+                metrics[f'{label}_p50_ms'] = round(float(p50), 3)
+                metrics[f'{label}_p99_ms'] = round(float(p99), 3)
+        return metrics
+
+
+# Example usage
+if __name__ == "__main__":
+    from ai_model import HealthRiskPredictor
+
+    registry = ModelRegistry(tempfile.mkdtemp())
+    predictor = HealthRiskPredictor(registry=registry)
+    print(f"Serving v{predictor.version}: {registry.manifest()['models']['health_risk']['versions']}")
+
+    candidate = registry.publish('health_risk', predictor.load_sklearn_model(), metadata={'note': 'demo copy'}, activate=False)
+    predictor.start_shadow(candidate)
+    X = np.random.default_rng(0).uniform([18, 90, 60, 60, 45, 85], [90, 200, 120, 320, 140, 100], size=(500, 6))
+    for row in X:
+        predictor.predict_proba(row.reshape(1, -1))
+    print(f"Shadow v{candidate}: {predictor.stop_shadow()}")
+
+    registry.activate('health_risk', candidate)
+    print(f"Reloaded to v{predictor.reload()}")
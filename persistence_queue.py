@@ -0,0 +1,222 @@
+"""
+WRITE-BEHIND PERSISTENCE QUEUE
+Bounded in-process queue + background group commit for routine writes
+"""
+
+import atexit
+import os
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+_STOP = object()  # Sentinel that tells the writer thread to drain and exit
+
+
+class WriteBehindQueue:
+    """
+    Write-behind pipeline for rows the client does not need to wait for
+
+    - submit() enqueues and returns immediately
+    - A background writer drains the queue in group commits: up to
+      max_batch_size items, or whatever arrived within max_batch_delay
+    - Backpressure: when the queue is full, submit() waits put_timeout
+      seconds and then writes the item synchronously in the caller thread
+    - close() (also registered with atexit) drains everything before exit
+
+    write_batch(conn, items) must insert the items and commit; it runs
+    through the connection pool's lock-retry layer. on_commit(items), if
+    given, is called with the items once they are committed.
+    """
+
+    def __init__(self, pool, write_batch: Callable, max_queue_size: int = 10000,
+                 max_batch_size: int = 500, max_batch_delay: float = 0.05,
+                 put_timeout: float = 0.5, on_commit: Optional[Callable] = None):
+        self.pool = pool
+        self.write_batch = write_batch
+        self.on_commit = on_commit
+        self.max_queue_size = max_queue_size
+        self.max_batch_size = max_batch_size
+        self.max_batch_delay = max_batch_delay
+        self.put_timeout = put_timeout
+
+        self._lock = threading.Lock()
+        self._pid = None
+        self._thread = None
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._closed = False
+        self._submitting = 0  # submit() calls past the _closed check, not yet queued
+        self._submitted = threading.Condition(self._lock)
+        self._metrics = {
+            'enqueued': 0,
+            'items_committed': 0,
+            'batches_committed': 0,
+            'max_batch_size_seen': 0,
+            'max_queue_depth_seen': 0,
+            'backpressure_writes': 0,
+            'failed_items': 0,
+            'total_commit_ms': 0.0
+        }
+        atexit.register(self.close)
+
+    def _ensure_writer(self) -> None:
+        """Start the writer thread (again, in a forked worker process); lock held"""
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._queue = queue.Queue(maxsize=self.max_queue_size)
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+
+    def submit(self, item) -> bool:
+        """
+        Queue an item for background persistence
+
+        Returns True if queued, False if it had to be written synchronously
+        (queue full or already shut down).
+        """
+        with self._lock:
+            closed = self._closed
+            if not closed:
+                self._ensure_writer()
+                self._submitting += 1  # close() waits for this put before stopping the writer
+        if closed:
+            self._write_now([item])
+            return False
+
+        try:
+            try:
+                self._queue.put(item, timeout=self.put_timeout)
+            except queue.Full:
+                with self._lock:
+                    self._metrics['backpressure_writes'] += 1
+                self._write_now([item])
+                return False
+
+            with self._lock:
+                self._metrics['enqueued'] += 1
+                self._metrics['max_queue_depth_seen'] = max(
+                    self._metrics['max_queue_depth_seen'], self._queue.qsize()
+                )
+            return True
+        finally:
+            with self._lock:
+                self._submitting -= 1
+                if not self._submitting:
+                    self._submitted.notify_all()
+
+    def _write_now(self, items: List) -> None:
+        """Persist items in the calling thread"""
+        self.pool.run_with_retry(lambda conn: self.write_batch(conn, items))
+        if self.on_commit is not None:
+            try:
+                self.on_commit(items)
+            except Exception as e:
+                print(f"⚠️ Write-behind on_commit callback failed: {e}")
+
+    def _run(self) -> None:
+        """Writer thread: collect a group of items, commit them together"""
+        q = self._queue
+        while True:
+            item = q.get()
+            if item is _STOP:
+                q.task_done()
+                return
+
+            batch = [item]
+            stop_after_batch = False
+            deadline = time.monotonic() + self.max_batch_delay
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = q.get(timeout=remaining) if remaining > 0 else q.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop_after_batch = True
+                    break
+                batch.append(item)
+
+            self._commit(batch)
+            for _ in batch:
+                q.task_done()
+            if stop_after_batch:
+                q.task_done()
+                self._drain_remaining()
+                return
+
+    def _drain_remaining(self) -> None:
+        """Commit anything still queued at shutdown"""
+        q = self._queue
+        while True:
+            batch = []
+            while len(batch) < self.max_batch_size:
+                try:
+                    item = q.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not _STOP:
+                    batch.append(item)
+                else:
+                    q.task_done()
+            if not batch:
+                return
+            self._commit(batch)
+            for _ in batch:
+                q.task_done()
+
+    def _commit(self, batch: List) -> None:
+        """Group commit; on failure retry item by item so one bad row can't drop the rest"""
+        start = time.perf_counter()
+        try:
+            self._write_now(batch)
+            committed = len(batch)
+        except Exception as e:
+            print(f"⚠️ Write-behind batch of {len(batch)} failed: {e}. Retrying per item...")
+            committed = 0
+            for item in batch:
+                try:
+                    self._write_now([item])
+                    committed += 1
+                except Exception as item_error:
+                    print(f"❌ Write-behind item dropped: {item_error}")
+                    with self._lock:
+                        self._metrics['failed_items'] += 1
+
+        with self._lock:
+            self._metrics['items_committed'] += committed
+            self._metrics['batches_committed'] += 1
+            self._metrics['max_batch_size_seen'] = max(self._metrics['max_batch_size_seen'], len(batch))
+            self._metrics['total_commit_ms'] += (time.perf_counter() - start) * 1000
+
+    def flush(self) -> None:
+        """Block until everything queued so far is committed"""
+        if self._thread is not None and self._pid == os.getpid():
+            self._queue.join()
+
+    def close(self, timeout: float = 30.0) -> None:
+        """Stop accepting background work and flush the queue (flush-on-shutdown)"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            # Submits already past the _closed check queue ahead of the stop sentinel
+            self._submitted.wait_for(lambda: not self._submitting, timeout)
+            thread = self._thread if self._pid == os.getpid() else None
+        if thread is not None and thread.is_alive():
+            self._queue.put(_STOP)
+            thread.join(timeout)
+        if thread is not None and not thread.is_alive():
+            self._drain_remaining()  # Anything the writer didn't get to (e.g. it died)
+
+    def get_metrics(self) -> Dict:
+        """Queue depth and group commit metrics"""
+        with self._lock:
+            metrics = dict(self._metrics)
+        batches = metrics['batches_committed']
+        metrics['queue_depth'] = self._queue.qsize()
+        metrics['max_queue_size'] = self.max_queue_size
+        metrics['avg_batch_size'] = round(metrics['items_committed'] / batches, 2) if batches else 0.0
+        metrics['avg_commit_ms'] = round(metrics['total_commit_ms'] / batches, 3) if batches else 0.0
+        metrics['total_commit_ms'] = round(metrics['total_commit_ms'], 3)
+        return metrics
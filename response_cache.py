@@ -0,0 +1,123 @@
+"""
+RESPONSE CACHE
+Bounded in-process LRU + TTL cache with per-key version counters
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+class VersionedCache:
+    """
+    LRU cache whose entries are tied to a per-key version number
+
+    - bump(key) after a write makes every cached value for that key stale;
+      nothing has to be deleted or recomputed eagerly
+    - put() only stores a value if no bump happened while it was computed,
+      so a slow reader can't cache data that a concurrent write replaced
+    - Entries also expire after ttl_seconds (bounds staleness for writes
+      this process never sees, e.g. another worker process)
+    - At most max_entries values are kept; the least recently used go first
+
+    Version counters are one int per key and are never evicted: resetting
+    a counter could let an old value look current again.
+    """
+
+    def __init__(self, max_entries: int = 4096, ttl_seconds: float = 30.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (version, expires_at, value)
+        self._versions = {}
+        self._metrics = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'invalidations': 0,
+            'version_bumps': 0
+        }
+
+    def version(self, key: Hashable) -> int:
+        """Current version of a key (read it before computing a value)"""
+        with self._lock:
+            return self._versions.get(key, 0)
+
+    def bump(self, key: Hashable) -> int:
+        """Invalidate cached values for a key; returns the new version"""
+        with self._lock:
+            version = self._versions.get(key, 0) + 1
+            self._versions[key] = version
+            self._metrics['version_bumps'] += 1
+            return version
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Cached value if present, unexpired and at the current version"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._metrics['misses'] += 1
+                return None
+
+            version, expires_at, value = entry
+            if version != self._versions.get(key, 0):
+                del self._entries[key]
+                self._metrics['invalidations'] += 1
+                self._metrics['misses'] += 1
+                return None
+            if time.monotonic() >= expires_at:
+                del self._entries[key]
+                self._metrics['expirations'] += 1
+                self._metrics['misses'] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._metrics['hits'] += 1
+            return value
+
+    def put(self, key: Hashable, version: int, value: Any) -> bool:
+        """Store a value computed at `version`; False if it was already stale"""
+        with self._lock:
+            if version != self._versions.get(key, 0):
+                return False
+            self._entries[key] = (version, time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._metrics['evictions'] += 1
+            return True
+
+    def clear(self) -> None:
+        """Drop all cached values (versions are kept)"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_metrics(self) -> Dict:
+        """Hit / miss / eviction counters"""
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics['entries'] = len(self._entries)
+        lookups = metrics['hits'] + metrics['misses']
+        metrics['hit_rate'] = round(metrics['hits'] / lookups, 4) if lookups else 0.0
+        metrics['max_entries'] = self.max_entries
+        metrics['ttl_seconds'] = self.ttl_seconds
+        return metrics
+
+
+# Example usage
+if __name__ == "__main__":
+    cache = VersionedCache(max_entries=2, ttl_seconds=60)
+
+    version = cache.version('user:1')
+    cache.put('user:1', version, {'records': 3})
+    print(f"Hit: {cache.get('user:1')}")
+
+    cache.bump('user:1')  # New vitals submitted
+    print(f"After bump: {cache.get('user:1')}")
+
+    for user in ('user:2', 'user:3', 'user:4'):
+        cache.put(user, cache.version(user), {'records': 0})
+    print(f"Metrics: {cache.get_metrics()}")
@@ -0,0 +1,233 @@
+"""
+RETRAINING PIPELINE
+Retrain the health risk model from stored readings; publish it only if it passes
+
+Readings stream out of SQLite in keyset-paginated chunks (health_records
+joined with the risk level stored for them in predictions), so memory is
+bounded by the sample sizes, never by the table. A fixed slice of record
+ids is held out; every other row feeds a fixed-size uniform reservoir
+sample the forest is fit on (n_jobs trees in parallel). The model is
+published to the ModelRegistry, with its array export, only if its holdout
+metrics clear the bar.
+
+Labels are the risk levels the serving model stored in predictions - the
+only outcome column the schema has. A table of confirmed outcomes can be
+dropped in by changing TRAINING_QUERY.
+
+Usage:
+    python retraining.py                                # health_system.db -> model_registry
+    python retraining.py db=health.db activate=1 n_jobs=4
+"""
+
+import os
+import sqlite3
+import sys
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from ai_model import FEATURES, HealthRiskPredictor
+from model_artifact import export_artifact
+from model_registry import DEFAULT_REGISTRY_DIR, ModelRegistry
+
+# Class index = position (the predictor maps classes 0/1/2 to these)
+RISK_LEVELS = ('Low', 'Medium', 'High')
+
+# Rows per SQLite round trip (each chunk is a short read transaction)
+CHUNK_ROWS = 50000
+
+# Records with id % HOLDOUT_MODULUS == 0 are never trained on
+HOLDOUT_MODULUS = 10
+
+# Same forest as HealthRiskPredictor.train_model
+MODEL_PARAMS = {
+    'n_estimators': 100,
+    'max_depth': 10,
+    'min_samples_split': 2,
+    'random_state': 42
+}
+
+# Holdout bar a retrained model must clear to be published
+DEFAULT_BAR = {
+    'min_accuracy': 0.95,
+    'min_class_recall': 0.90,
+    'min_holdout_rows': 1000
+}
+
+TRAINING_QUERY = f'''
+    SELECT h.id, {', '.join('h.' + name for name in FEATURES)},
+           CASE p.risk_level {' '.join(f"WHEN '{level}' THEN {i}" for i, level in enumerate(RISK_LEVELS))} END
+    FROM health_records h
+    JOIN predictions p ON p.record_id = h.id
+    WHERE h.id > ? AND p.risk_level IN ({', '.join(f"'{level}'" for level in RISK_LEVELS)})
+      AND {' AND '.join(f'h.{name} IS NOT NULL' for name in FEATURES)}
+    ORDER BY h.id
+    LIMIT ?
+'''
+
+
+def stream_training_chunks(db_path: str, chunk_rows: int = CHUNK_ROWS):
+    """Yield (record ids, features float32 (n, 6), labels int8) chunks in id order"""
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    try:
+        last_id = 0
+        while True:
+            rows = conn.execute(TRAINING_QUERY, (last_id, chunk_rows)).fetchall()
+            if not rows:
+                return
+            chunk = np.array(rows, dtype=np.float64)
+            last_id = int(chunk[-1, 0])
+            yield chunk[:, 0].astype(np.int64), chunk[:, 1:-1].astype(np.float32), chunk[:, -1].astype(np.int8)
+    finally:
+        conn.close()
+
+
+class Reservoir:
+    """
+    Uniform fixed-size sample of a row stream (Algorithm R, one chunk at a time)
+
+    Memory is size rows however long the stream is; after n rows every row
+    is in the sample with probability size / n.
+    """
+
+    def __init__(self, size: int, n_features: int, seed: int = 0):
+        self.size = size
+        self.seen = 0
+        self._X = np.empty((size, n_features), dtype=np.float32)
+        self._y = np.empty(size, dtype=np.int8)
+        self._rng = np.random.default_rng(seed)
+
+    def add(self, X: np.ndarray, y: np.ndarray) -> None:
+        fill = min(max(self.size - self.seen, 0), len(X))
+        self._X[self.seen:self.seen + fill] = X[:fill]
+        self._y[self.seen:self.seen + fill] = y[:fill]
+        if fill < len(X):
+            # Row with stream index i replaces a random slot with probability size / (i + 1)
+            positions = self.seen + np.arange(fill, len(X))
+            slots = self._rng.integers(0, positions + 1)
+            keep = slots < self.size
+            self._X[slots[keep]] = X[fill:][keep]  # Repeated slots: the later row wins
+            self._y[slots[keep]] = y[fill:][keep]
+        self.seen += len(X)
+
+    @property
+    def X(self) -> np.ndarray:
+        return self._X[:min(self.seen, self.size)]
+
+    @property
+    def y(self) -> np.ndarray:
+        return self._y[:min(self.seen, self.size)]
+
+
+def holdout_metrics(model, X: np.ndarray, y: np.ndarray) -> Dict:
+    """Accuracy and per-class recall on the holdout sample"""
+    predicted = model.predict(X)
+    recall = {
+        level: round(float(np.mean(predicted[y == i] == i)), 4) if np.any(y == i) else None
+        for i, level in enumerate(RISK_LEVELS)
+    }
+    return {
+        'rows': int(len(y)),
+        'accuracy': round(float(np.mean(predicted == y)), 4),
+        'class_recall': recall
+    }
+
+
+def check_bar(metrics: Dict, classes, bar: Dict) -> List[str]:
+    """Reasons the model fails the bar (empty: publishable)"""
+    failures = []
+    if list(classes) != list(range(len(RISK_LEVELS))):
+        failures.append(f'trained on classes {list(classes)}, need all of {list(RISK_LEVELS)}')
+    if metrics['rows'] < bar['min_holdout_rows']:
+        failures.append(f"holdout has {metrics['rows']} rows, need {bar['min_holdout_rows']}")
+    if metrics['accuracy'] < bar['min_accuracy']:
+        failures.append(f"accuracy {metrics['accuracy']:.4f} < {bar['min_accuracy']}")
+    for level, recall in metrics['class_recall'].items():
+        if recall is None or recall < bar['min_class_recall']:
+            failures.append(f"{level} recall {recall} < {bar['min_class_recall']}")
+    return failures
+
+
+def retrain(db_path: str, registry: Optional[ModelRegistry], max_train_rows: int = 200000,
+            max_holdout_rows: int = 50000, n_jobs: int = -1, bar: Optional[Dict] = None,
+            activate: bool = False, chunk_rows: int = CHUNK_ROWS, seed: int = 0) -> Dict:
+    """
+    Stream, sample, fit, evaluate and (if the bar is met) publish
+
+    Returns a report: row counts, stage timings (s), holdout metrics,
+    bar failures and the published registry version (None if not published).
+    """
+    from sklearn.ensemble import RandomForestClassifier  # Only needed to train
+
+    bar = dict(DEFAULT_BAR, **(bar or {}))
+    timings = {}
+    start = time.perf_counter()
+
+    train = Reservoir(max_train_rows, len(FEATURES), seed=seed)
+    holdout = Reservoir(max_holdout_rows, len(FEATURES), seed=seed + 1)
+    for ids, X, y in stream_training_chunks(db_path, chunk_rows):
+        held = ids % HOLDOUT_MODULUS == 0
+        holdout.add(X[held], y[held])
+        train.add(X[~held], y[~held])
+    timings['read'] = time.perf_counter() - start
+
+    report = {
+        'rows': train.seen + holdout.seen,
+        'train_rows': len(train.y),
+        'holdout_rows': len(holdout.y),
+        'timings': timings,
+        'metrics': None,
+        'failures': [],
+        'version': None
+    }
+    if not len(train.y):
+        report['failures'] = ['no labelled readings']
+        return report
+
+    stage = time.perf_counter()
+    model = RandomForestClassifier(n_jobs=n_jobs, **MODEL_PARAMS)
+    model.fit(train.X, train.y.astype(np.int64))  # Same label dtype as train_model
+    model.set_params(n_jobs=None)  # Serving predicts single rows; no worker pool
+    timings['fit'] = time.perf_counter() - stage
+
+    stage = time.perf_counter()
+    report['metrics'] = holdout_metrics(model, holdout.X, holdout.y)
+    report['failures'] = check_bar(report['metrics'], model.classes_, bar)
+    timings['evaluate'] = time.perf_counter() - stage
+
+    if not report['failures'] and registry is not None:
+        stage = time.perf_counter()
+        name = HealthRiskPredictor.REGISTRY_NAME
+        report['version'] = registry.publish(
+            name, model,
+            metadata={'source': 'retraining', 'database': os.path.abspath(db_path),
+                      'rows': report['rows'], 'train_rows': report['train_rows'],
+                      'holdout': report['metrics']},
+            activate=activate,
+            export=lambda path: export_artifact(path, {name: model}, FEATURES))
+        timings['publish'] = time.perf_counter() - stage
+
+    timings['total'] = time.perf_counter() - start
+    return report
+
+
+# Example usage
+if __name__ == "__main__":
+    options = dict(arg.split('=', 1) for arg in sys.argv[1:])
+    db_path = options.get('db', os.environ.get('HEALTH_DB_PATH', 'health_system.db'))
+    registry = ModelRegistry(options.get('registry', os.environ.get('MODEL_REGISTRY_DIR', DEFAULT_REGISTRY_DIR)))
+
+    result = retrain(db_path, registry,
+                     max_train_rows=int(options.get('max_train_rows', 200000)),
+                     n_jobs=int(options.get('n_jobs', -1)),
+                     activate=options.get('activate', '0') == '1')
+    print(f"Read {result['rows']:,} labelled readings "
+          f"({result['train_rows']:,} sampled for training, {result['holdout_rows']:,} held out)")
+    print(f"Holdout: {result['metrics']}")
+    print(f"Timings: { {stage: round(seconds, 2) for stage, seconds in result['timings'].items()} }")
+    if result['failures']:
+        print("❌ Not published: " + '; '.join(result['failures']))
+        sys.exit(1)
+    print(f"✅ Published health_risk v{result['version']}"
+          f"{' (active; reload the app to serve it)' if options.get('activate') == '1' else ' (inactive)'}")
@@ -0,0 +1,362 @@
+"""
+RISK LOOKUP TABLE
+HealthRiskPredictor's forest precomputed over a grid of vitals cells
+
+A forest is piecewise constant: along each feature its output only changes
+at split thresholds. Cutting every feature at the thresholds gives a grid
+whose cells each have exactly one probability row, so a prediction becomes
+six searchsorted() calls and one array index.
+
+Resolution (minimum cell width per feature, in the feature's units) trades
+size for coverage: where thresholds are closer together than it, only
+every threshold about one resolution apart stays a cell edge. Such a cell
+is evaluated at every piece its inner thresholds cut it into; if the
+forest gives the same output on all of them the cell is stored, otherwise
+it falls back to the model. With no resolution every threshold is a cell
+edge and the table covers everything. Grids over MAX_TABLE_CELLS cells
+are refused (an exact grid of a production forest has ~1e14 cells).
+
+Table directory layout:
+    meta.json          features, resolution, model digest, build stats
+    edges_<i>.npy      cell edges of feature i (float64, sorted)
+    codes.npy          uint16 code per cell (row-major over the features)
+    codebook.npy       (codes x classes) float64 probability rows
+
+Usage:
+    python risk_table.py                     # build next to the model
+    python risk_table.py age=2 blood_sugar=5  # coarser table
+"""
+
+import hashlib
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+
+import numpy as np
+
+from model_artifact import _replace_directory
+from tree_inference import NODE_ARRAYS
+
+# Code of cells that must be answered by the model
+FALLBACK = np.iinfo(np.uint16).max
+
+# Grid cells evaluated per model call while building
+BUILD_CHUNK_ROWS = 65536
+
+# Largest grid build_risk_table() will allocate (2 bytes per cell)
+MAX_TABLE_CELLS = 50_000_000
+
+# Cells cut into more pieces than this by inner thresholds fall back unchecked
+MAX_CHECK_POINTS = 64
+
+# Batches up to this size are located with bisect on Python lists (per-call
+# NumPy overhead dominates six searchsorted() calls on a few rows)
+BISECT_MAX_ROWS = 8
+
+DEFAULT_TABLE_PATH = 'health_risk_table'
+
+
+def engine_digest(engine):
+    """sha256 of a compiled forest's node arrays (ties a table to one model)"""
+    digest = hashlib.sha256()
+    for name in NODE_ARRAYS:
+        digest.update(np.ascontiguousarray(getattr(engine, name)).tobytes())
+    return digest.hexdigest()
+
+
+def _feature_edges(thresholds, resolution):
+    """
+    Cell edges of one feature and the thresholds inside each cell
+
+    Thresholds less than resolution apart form a cluster: its first and
+    last thresholds stay edges, and in between a threshold becomes an edge
+    once it is at least resolution past the previous edge. The others are
+    returned as the inner thresholds of the cell they fall in.
+    """
+    thresholds = np.unique(thresholds)
+    if not resolution:
+        return thresholds, [()] * (len(thresholds) + 1)
+
+    edges, inner = [], []  # inner[i]: thresholds inside the cell ending at edges[i]
+    for cluster in np.split(thresholds, np.flatnonzero(np.diff(thresholds) >= resolution) + 1):
+        if not len(cluster):
+            continue
+        edges.append(cluster[0])
+        inner.append(())
+        pending = []
+        for threshold in cluster[1:].tolist():
+            if threshold - edges[-1] >= resolution or threshold == cluster[-1]:
+                edges.append(threshold)
+                inner.append(tuple(pending))
+                pending = []
+            else:
+                pending.append(threshold)
+    inner.append(())  # Above the last edge
+    return np.asarray(edges, dtype=np.float64), inner
+
+
+def _representatives(edges):
+    """A float32 value inside every cell (lo, hi] of one feature"""
+    points = np.empty(len(edges) + 1, dtype=np.float32)
+    for i, high in enumerate(edges):
+        point = np.float32(high)
+        if point > high:  # float32 rounding moved it past the edge
+            point = np.nextafter(point, np.float32(-np.inf))
+        points[i] = point
+    points[-1] = np.nextafter(np.float32(edges[-1]) if len(edges) else np.float32(0), np.float32(np.inf))
+    return points
+
+
+def _cell_points(edges, inner):
+    """
+    One float32 value per piece of every cell of one feature
+
+    Returns (points, starts, counts): cell j's pieces are
+    points[starts[j]:starts[j] + counts[j]], one per interval its inner
+    thresholds cut it into.
+    """
+    outer = _representatives(edges)
+    points, counts = [], []
+    for j, cuts in enumerate(inner):
+        if cuts:
+            points.extend(_representatives(np.asarray(cuts + (edges[j],)))[:-1])
+        else:
+            points.append(outer[j])
+        counts.append(len(cuts) + 1)
+    counts = np.asarray(counts, dtype=np.intp)
+    return np.asarray(points, dtype=np.float32), np.cumsum(counts) - counts, counts
+
+
+class RiskTable:
+    """
+    Precomputed predict_proba over a threshold-aligned vitals grid
+
+    predict_proba() answers covered rows from the table and the rest from
+    the engine it was built for, so results match the model exactly.
+    """
+
+    def __init__(self, edges, codes, codebook, meta):
+        self.edges = edges  # Per feature, sorted float64 cell edges
+        self.codes = codes  # Flat uint16 cell codes
+        self.codebook = codebook
+        self.meta = meta
+        self.digest = meta['model_digest']
+        self.engine = None  # Set by bind() once the digest matches
+        self._strides = np.array([int(np.prod([len(e) + 1 for e in edges[i + 1:]])) for i in range(len(edges))],
+                                 dtype=np.intp)
+        self._edge_lists = [e.tolist() for e in edges]
+        self._stride_list = self._strides.tolist()
+        self._lock = threading.Lock()
+        self._metrics = {
+            'lookups': 0,
+            'rows': 0,
+            'fallback_rows': 0
+        }
+
+    @property
+    def cell_count(self):
+        return len(self.codes)
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.codebook.nbytes + sum(e.nbytes for e in self.edges)
+
+    def bind(self, engine):
+        """Serve for engine if the table was built from the same model; returns success"""
+        if engine is None or engine_digest(engine) != self.digest:
+            return False
+        self.engine = engine
+        return True
+
+    def cells(self, X):
+        """Flat cell index of every row"""
+        X = np.asarray(X, dtype=np.float32)  # The trees compare float32 inputs
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if len(X) <= BISECT_MAX_ROWS:
+            # bisect_left, like side='left': x <= threshold stays in the cell below
+            return np.array([sum(bisect_left(edges, value) * stride for value, edges, stride
+                                 in zip(row, self._edge_lists, self._stride_list))
+                             for row in X.tolist()], dtype=np.intp)
+        index = np.zeros(len(X), dtype=np.intp)
+        for i, edges in enumerate(self.edges):
+            # side='left': x <= threshold stays in the cell below, as in the trees
+            index += np.searchsorted(edges, X[:, i], side='left') * self._strides[i]
+        return index
+
+    def predict_proba(self, X):
+        """Class probabilities, identical to the bound engine's"""
+        X = np.asarray(X)
+        codes = self.codes.take(self.cells(X))
+        missing = codes == FALLBACK
+        fallback_rows = int(missing.sum())
+        if fallback_rows:
+            probabilities = np.empty((len(codes), self.codebook.shape[1]))
+            probabilities[~missing] = self.codebook.take(codes[~missing], axis=0)
+            rows = X.reshape(len(codes), -1)[missing]
+            probabilities[missing] = self.engine.predict_proba(rows)
+        else:
+            probabilities = self.codebook.take(codes, axis=0)
+
+        with self._lock:
+            self._metrics['lookups'] += 1
+            self._metrics['rows'] += len(codes)
+            self._metrics['fallback_rows'] += fallback_rows
+        return probabilities
+
+    def save(self, path):
+        """Write the table directory (built aside, renamed into place)"""
+        parent = os.path.dirname(os.path.abspath(path))
+        building = tempfile.mkdtemp(dir=parent, prefix='.tmp-')
+        try:
+            for i, edges in enumerate(self.edges):
+                np.save(os.path.join(building, f'edges_{i}.npy'), edges)
+            np.save(os.path.join(building, 'codes.npy'), self.codes)
+            np.save(os.path.join(building, 'codebook.npy'), self.codebook)
+            with open(os.path.join(building, 'meta.json'), 'w') as f:
+                json.dump(self.meta, f, indent=2)
+            _replace_directory(building, path)
+        except BaseException:
+            shutil.rmtree(building, ignore_errors=True)
+            raise
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """RiskTable from save() output (codes memory-mapped)"""
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        edges = [np.load(os.path.join(path, f'edges_{i}.npy')) for i in range(len(meta['features']))]
+        codes = np.asarray(np.load(os.path.join(path, 'codes.npy'), mmap_mode=mmap_mode))
+        return cls(edges, codes, np.load(os.path.join(path, 'codebook.npy')), meta)
+
+    def get_metrics(self):
+        with self._lock:
+            metrics = dict(self._metrics)
+        metrics['fallback_rate'] = round(metrics['fallback_rows'] / metrics['rows'], 4) if metrics['rows'] else 0.0
+        metrics['cells'] = self.cell_count
+        metrics['table_kib'] = round(self.nbytes / 1024, 1)
+        return metrics
+
+
+def _evaluate_cells(engine, pieces, index, counts, piece_counts):
+    """
+    Run engine on every piece of some cells
+
+    index / counts: per feature, each cell's index and piece count.
+    Returns (constant, probabilities): which cells gave the same row on
+    every piece, and that row for each of those cells.
+    """
+    # One grid row per piece: decode each cell's piece number per feature (mixed radix)
+    first_row = np.cumsum(piece_counts) - piece_counts
+    owner = np.repeat(np.arange(len(piece_counts)), piece_counts)
+    piece = np.arange(len(owner)) - first_row[owner]
+    columns = []
+    for i in reversed(range(len(index))):
+        points, starts, _ = pieces[i]
+        columns.append(points[starts[index[i]][owner] + piece % counts[i][owner]])
+        piece = piece // counts[i][owner]
+    probabilities = engine.predict_proba(np.column_stack(columns[::-1]))
+
+    same = np.all(probabilities == probabilities[first_row][owner], axis=1)
+    constant = np.logical_and.reduceat(same, first_row)
+    return constant, probabilities[first_row[constant]]
+
+
+def build_risk_table(engine, features, resolution=None, max_cells=MAX_TABLE_CELLS):
+    """
+    Evaluate engine on every piece of every grid cell and pack the results
+
+    resolution: optional {feature: minimum cell width}; cells that still
+    contain thresholds are stored only where the forest's output is the
+    same on every piece, the rest fall back to the model
+    max_cells: refuse (ValueError) grids larger than this
+    """
+    start = time.perf_counter()
+    resolution = resolution or {}
+    internal = engine.left != np.arange(engine.node_count)
+    split_features = engine.feature[internal]
+    split_thresholds = engine.threshold[internal]
+
+    edges, pieces = [], []
+    for i, name in enumerate(features):
+        feature_edges, inner = _feature_edges(split_thresholds[split_features == i], resolution.get(name))
+        edges.append(feature_edges)
+        pieces.append(_cell_points(feature_edges, inner))
+    shape = tuple(len(e) + 1 for e in edges)
+
+    cell_count = math.prod(shape)
+    if cell_count > max_cells:
+        cells_per_feature = ', '.join(f'{name}={size:,}' for name, size in zip(features, shape))
+        raise ValueError(f'Risk table grid has {cell_count:,} cells (limit {max_cells:,}; '
+                         f'cells per feature: {cells_per_feature}). Set a resolution for the features '
+                         f'with the most cells, e.g. python risk_table.py {features[int(np.argmax(shape))]}=5')
+
+    codes = np.full(cell_count, FALLBACK, dtype=np.uint16)
+    rows = {}  # Probability row bytes -> code
+    codebook = []
+    unchecked = 0
+    for chunk_start in range(0, cell_count, BUILD_CHUNK_ROWS):
+        cell_ids = np.arange(chunk_start, min(chunk_start + BUILD_CHUNK_ROWS, cell_count))
+        index = np.unravel_index(cell_ids, shape)
+        counts = [pieces[i][2][index[i]] for i in range(len(shape))]
+        piece_counts = np.prod(counts, axis=0)
+        checked = piece_counts <= MAX_CHECK_POINTS
+        unchecked += int(np.count_nonzero(~checked))
+        cell_ids, piece_counts = cell_ids[checked], piece_counts[checked]
+        index = [feature_index[checked] for feature_index in index]
+        counts = [feature_counts[checked] for feature_counts in counts]
+
+        # About BUILD_CHUNK_ROWS grid rows per model call
+        total = int(piece_counts.sum())
+        bounds = np.searchsorted(np.cumsum(piece_counts), np.arange(BUILD_CHUNK_ROWS, total, BUILD_CHUNK_ROWS))
+        for part in np.split(np.arange(len(cell_ids)), bounds):
+            if not len(part):
+                continue
+            constant, probabilities = _evaluate_cells(engine, pieces, [feature_index[part] for feature_index in index],
+                                                      [feature_counts[part] for feature_counts in counts],
+                                                      piece_counts[part])
+            unique, inverse = np.unique(probabilities, axis=0, return_inverse=True)
+            part_codes = np.empty(len(unique), dtype=np.int64)
+            for j, row in enumerate(unique):
+                key = row.tobytes()
+                if key not in rows:
+                    rows[key] = len(codebook) if len(codebook) < FALLBACK else FALLBACK
+                    if rows[key] != FALLBACK:
+                        codebook.append(row)
+                part_codes[j] = rows[key]
+            codes[cell_ids[part][constant]] = part_codes[inverse.ravel()]
+
+    covered = int(np.count_nonzero(codes != FALLBACK))
+    meta = {
+        'features': list(features),
+        'resolution': resolution,
+        'model_digest': engine_digest(engine),
+        'cells': cell_count,
+        'covered_cells': covered,
+        'unchecked_cells': unchecked,
+        'fallback_cell_rate': round(1 - covered / cell_count, 6),
+        'codebook_rows': len(codebook),
+        'build_seconds': round(time.perf_counter() - start, 3)
+    }
+    table = RiskTable(edges, codes, np.asarray(codebook, dtype=np.float64).reshape(len(codebook), -1), meta)
+    table.bind(engine)
+    return table
+
+
+if __name__ == "__main__":
+    from ai_model import FEATURES, HealthRiskPredictor
+
+    resolution = {key: float(value) for key, value in (arg.split('=', 1) for arg in sys.argv[1:])}
+    predictor = HealthRiskPredictor()
+    table = build_risk_table(predictor.engine, FEATURES, resolution)
+    table.save(DEFAULT_TABLE_PATH)
+    meta = table.meta
+    print(f"✅ {DEFAULT_TABLE_PATH}: {meta['cells']:,} cells ({meta['covered_cells']:,} covered, "
+          f"{meta['fallback_cell_rate']:.2%} fall back to the model), "
+          f"{table.nbytes / 1024:,.0f} KiB, built in {meta['build_seconds']:.1f} s")
@@ -0,0 +1,116 @@
+"""
+DATABASE SCHEMA
+Base tables + versioned migrations of the app database
+
+Kept apart from app.py so tools (query plan checks, benchmarks) can build
+the schema without importing the Flask app, which loads the model.
+"""
+
+from database import apply_migrations
+from emergency_events import EVENT_TABLE_SQL
+
+# Versioned schema changes: (version, description, statements)
+# Append new entries - never edit one that has shipped
+SCHEMA_MIGRATIONS = [
+    (1, 'Add ABHA ID to users', [
+        'ALTER TABLE users ADD COLUMN abha_id TEXT'
+    ]),
+    (2, 'Indexes for dashboard, SOS and doctor emergency queries', [
+        # Patient dashboard + SOS latest vitals: WHERE user_id = ? ORDER BY timestamp DESC
+        'CREATE INDEX IF NOT EXISTS idx_health_records_user_time '
+        'ON health_records (user_id, timestamp DESC)',
+        'CREATE INDEX IF NOT EXISTS idx_predictions_user_time '
+        'ON predictions (user_id, timestamp DESC)',
+        # Doctor dashboard: WHERE status = 'ACTIVE' ORDER BY created_at DESC
+        'CREATE INDEX IF NOT EXISTS idx_emergencies_status_created '
+        'ON emergencies (status, created_at DESC)'
+    ]),
+    (3, 'Emergency severity + keyset pagination index', [
+        'ALTER TABLE emergencies ADD COLUMN severity INTEGER',
+        # Doctor dashboard pages: WHERE status = ? AND (created_at, id) < (?, ?)
+        # ORDER BY created_at DESC, id DESC
+        'CREATE INDEX IF NOT EXISTS idx_emergencies_status_created_id '
+        'ON emergencies (status, created_at DESC, id DESC)',
+        'DROP INDEX IF EXISTS idx_emergencies_status_created'
+    ]),
+    (4, 'Predictions by record (retraining.py joins them to health_records)', [
+        'CREATE INDEX IF NOT EXISTS idx_predictions_record ON predictions (record_id)'
+    ]),
+    (5, 'Emergency event log (SSE ids, shared by all workers)', [
+        EVENT_TABLE_SQL
+    ])
+]
+
+
+def create_tables(conn):
+    """Create the base tables (later changes are SCHEMA_MIGRATIONS)"""
+    cursor = conn.cursor()
+
+    # Users table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT UNIQUE NOT NULL,
+            name TEXT NOT NULL,
+            role TEXT NOT NULL,
+            phone TEXT,
+            password_hash TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Health records table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS health_records (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            age INTEGER,
+            bp_systolic INTEGER,
+            bp_diastolic INTEGER,
+            blood_sugar REAL,
+            heart_rate INTEGER,
+            spo2 INTEGER,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+
+    # Predictions table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS predictions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            record_id INTEGER NOT NULL,
+            risk_level TEXT NOT NULL,
+            risk_score REAL NOT NULL,
+            recommendations TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (record_id) REFERENCES health_records (id)
+        )
+    ''')
+
+    # Emergencies table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS emergencies (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            emergency_type TEXT NOT NULL,
+            status TEXT DEFAULT 'ACTIVE',
+            location TEXT,
+            doctor_id INTEGER,
+            ambulance_id INTEGER,
+            vitals_summary TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            resolved_at TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+
+    conn.commit()
+
+
+def create_schema(conn):
+    """Create the tables and apply pending migrations; returns the schema version"""
+    create_tables(conn)
+    return apply_migrations(conn, SCHEMA_MIGRATIONS)
@@ -4,11 +4,19 @@ RBAC + Data Masking + Emergency Access Control + ABHA Compliance
 """
 
 from enum import Enum
-from typing import Dict, List, Set, Optional
+from typing import Dict, List, Set, Optional, Tuple
 from datetime import datetime
+from concurrent.futures import Future, ThreadPoolExecutor
+import base64
 import hashlib
+import heapq
+import hmac
+import os
 import secrets
 import re
+import struct
+import threading
+import time
 
 class Role(Enum):
     """User roles in the system"""
@@ -220,27 +228,289 @@ class EmergencyAccessControl:
 
 
 class SecureTokenManager:
-    """Secure API token management"""
+    """
+    HMAC-signed, expiring session tokens - verified in memory, no DB lookup
+    
+    Token: <key id>.<payload>.<signature> (base64url, ~100 chars)
+        payload = user_id (u64) | expiry (u32 unix seconds) | token id (u64) | role
+        signature = HMAC-SHA256(key[key id], "<key id>.<payload>")
+    
+    - Signatures are checked with hmac.compare_digest before the payload
+      is even decoded
+    - Key rotation: add_key() starts signing with a new key while older
+      keys keep verifying until retire_key()
+    - Revocation: token ids map to their expiry and are dropped once the
+      token would have expired anyway, so the set only holds live tokens
+      (per process - share keys, not revocations, across workers)
+    """
+    
+    PAYLOAD = struct.Struct('>QIQ')
+    
+    def __init__(self, keys: Optional[Dict[str, bytes]] = None, active_key_id: Optional[str] = None,
+                 ttl_seconds: int = 8 * 3600):
+        self.ttl_seconds = ttl_seconds
+        self._keys = {}
+        self._active_key_id = None
+        self._lock = threading.Lock()
+        self._revoked = {}        # token id -> expiry
+        self._revoked_expiry = []  # min-heap of (expiry, token id) for pruning
+        
+        for key_id, key in (keys or {'k1': secrets.token_bytes(32)}).items():
+            self.add_key(key_id, key, activate=False)
+        self._active_key_id = active_key_id or list(self._keys)[-1]
+    
+    @staticmethod
+    def _b64encode(data: bytes) -> str:
+        return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
     
     @staticmethod
-    def generate_token(user_id: str, role: Role) -> str:
-        """Generate secure access token"""
-        timestamp = datetime.now().isoformat()
-        random_part = secrets.token_hex(16)
+    def _b64decode(text: str) -> bytes:
+        return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+    
+    def add_key(self, key_id: str, key: bytes, activate: bool = True) -> None:
+        """Add a signing key (and sign new tokens with it if activate)"""
+        if not re.fullmatch(r'[A-Za-z0-9_-]{1,16}', key_id):
+            raise ValueError('Key id must be 1-16 characters of [A-Za-z0-9_-]')
+        if len(key) < 32:
+            raise ValueError('Signing keys must be at least 32 bytes')
+        with self._lock:
+            self._keys = {**self._keys, key_id: bytes(key)}
+            if activate:
+                self._active_key_id = key_id
+    
+    def retire_key(self, key_id: str) -> None:
+        """Stop accepting tokens signed with a key"""
+        with self._lock:
+            if key_id == self._active_key_id:
+                raise ValueError('Activate another key before retiring the active one')
+            self._keys = {k: v for k, v in self._keys.items() if k != key_id}
+    
+    def _sign(self, key: bytes, signed_part: str) -> bytes:
+        return hmac.new(key, signed_part.encode(), hashlib.sha256).digest()
+    
+    def generate_token(self, user_id: int, role: str, ttl_seconds: Optional[int] = None) -> str:
+        """Issue a signed token for a user"""
+        role = role.value if isinstance(role, Role) else role
+        expiry = int(time.time()) + (ttl_seconds or self.ttl_seconds)
+        token_id = secrets.randbits(64)
+        payload = self.PAYLOAD.pack(int(user_id), expiry, token_id) + role.encode()
+        
+        key_id = self._active_key_id
+        signed_part = f'{key_id}.{self._b64encode(payload)}'
+        return f'{signed_part}.{self._b64encode(self._sign(self._keys[key_id], signed_part))}'
+    
+    def verify_token(self, token: str) -> Optional[Dict]:
+        """
+        Claims of a valid token, or None
         
-        # Create token payload
-        payload = f"{user_id}:{role.value}:{timestamp}:{random_part}"
+        Returns: {'user_id', 'role', 'expires_at', 'token_id', 'key_id'}
+        """
+        if not isinstance(token, str) or len(token) > 512:
+            return None
+        signed_part, _, signature = token.rpartition('.')
+        key_id, _, encoded_payload = signed_part.partition('.')
+        key = self._keys.get(key_id)
+        if key is None or not encoded_payload:
+            return None
         
-        # Hash the payload
-        token = hashlib.sha256(payload.encode()).hexdigest()
+        try:
+            signature = self._b64decode(signature)
+        except ValueError:
+            return None
+        if not hmac.compare_digest(self._sign(key, signed_part), signature):
+            return None
         
-        return token
+        payload = self._b64decode(encoded_payload)
+        user_id, expiry, token_id = self.PAYLOAD.unpack_from(payload)
+        if expiry <= time.time() or token_id in self._revoked:
+            return None
+        return {
+            'user_id': user_id,
+            'role': payload[self.PAYLOAD.size:].decode(),
+            'expires_at': expiry,
+            'token_id': token_id,
+            'key_id': key_id
+        }
     
-    @staticmethod
-    def validate_token(token: str) -> bool:
-        """Validate token format and integrity"""
-        # Simplified validation
-        return len(token) == 64 and re.match(r'^[a-f0-9]{64}$', token) is not None
+    def validate_token(self, token: str) -> bool:
+        """Validate token signature, expiry and revocation"""
+        return self.verify_token(token) is not None
+    
+    def revoke_token(self, token: str) -> bool:
+        """Revoke a valid token until it expires (logout)"""
+        claims = self.verify_token(token)
+        if claims is None:
+            return False
+        now = time.time()
+        with self._lock:
+            # Forget revocations of tokens that have expired by now
+            while self._revoked_expiry and self._revoked_expiry[0][0] <= now:
+                _, expired_id = heapq.heappop(self._revoked_expiry)
+                self._revoked.pop(expired_id, None)
+            self._revoked[claims['token_id']] = claims['expires_at']
+            heapq.heappush(self._revoked_expiry, (claims['expires_at'], claims['token_id']))
+        return True
+    
+    def get_metrics(self) -> Dict:
+        """Key ring + revocation set size"""
+        with self._lock:
+            return {
+                'active_key_id': self._active_key_id,
+                'key_ids': list(self._keys),
+                'revoked_tokens': len(self._revoked)
+            }
+    
+    @classmethod
+    def from_env(cls, variable: str = 'SESSION_TOKEN_KEYS', ttl_seconds: int = 8 * 3600) -> 'SecureTokenManager':
+        """
+        Key ring from "kid:hexkey,kid:hexkey" (last one signs)
+        
+        Without it a random per-process key is used: tokens then stop
+        working on restart and aren't shared between worker processes.
+        """
+        spec = os.environ.get(variable, '')
+        keys = {}
+        for item in filter(None, (part.strip() for part in spec.split(','))):
+            key_id, _, hex_key = item.partition(':')
+            keys[key_id] = bytes.fromhex(hex_key)
+        if not keys:
+            print(f"⚠️ {variable} not set - using a random session token key for this process")
+        return cls(keys or None, ttl_seconds=ttl_seconds)
+
+
+class HashingOverloaded(Exception):
+    """Password hashing queue is full - caller should answer 503 and retry later"""
+
+
+class PasswordHashingService:
+    """
+    scrypt password hashing on a bounded worker pool
+    
+    - KDF work runs on max_workers threads (hashlib.scrypt releases the
+      GIL), so a login burst uses at most that many cores and
+      max_workers x ~16 MB of memory - request threads for SOS and
+      vitals keep running
+    - At most max_workers + max_queue hashes are admitted at once;
+      beyond that HashingOverloaded is raised instead of queueing forever
+    - Stored format: scrypt$n$r$p$salt$hash (base64); legacy unsalted
+      sha256 hex digests still verify and are reported as needing rehash
+    """
+    
+    SCHEME = 'scrypt'
+    
+    def __init__(self, max_workers: int = 2, max_queue: int = 32,
+                 n: int = 2 ** 14, r: int = 8, p: int = 1, timeout: float = 10.0):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.n, self.r, self.p = n, r, p
+        self.timeout = timeout
+    
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='kdf')
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._lock = threading.Lock()
+        self._metrics = {
+            'submitted': 0,
+            'completed': 0,
+            'rejected': 0,
+            'legacy_verified': 0,
+            'total_wait_ms': 0.0,
+            'total_compute_ms': 0.0
+        }
+        # Verified against when the account doesn't exist, so a miss costs
+        # the same as a wrong password (no user enumeration by timing)
+        self._dummy_hash = self._hash(secrets.token_hex(16))
+    
+    def _kdf(self, password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+        return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                              maxmem=256 * r * n, dklen=32)
+    
+    def _hash(self, password: str) -> str:
+        salt = secrets.token_bytes(16)
+        digest = self._kdf(password, salt, self.n, self.r, self.p)
+        return '$'.join([self.SCHEME, str(self.n), str(self.r), str(self.p),
+                         base64.b64encode(salt).decode(), base64.b64encode(digest).decode()])
+    
+    def _verify(self, password: str, stored: str) -> Tuple[bool, bool]:
+        if re.fullmatch(r'[a-f0-9]{64}', stored):
+            # Legacy unsalted sha256
+            ok = hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), stored)
+            if ok:
+                with self._lock:
+                    self._metrics['legacy_verified'] += 1
+            return ok, ok
+        try:
+            scheme, n, r, p, salt, digest = stored.split('$')
+            n, r, p = int(n), int(r), int(p)
+            if scheme != self.SCHEME:
+                return False, False
+            computed = self._kdf(password, base64.b64decode(salt), n, r, p)
+        except ValueError:
+            return False, False
+        ok = hmac.compare_digest(computed, base64.b64decode(digest))
+        return ok, ok and (n, r, p) != (self.n, self.r, self.p)
+    
+    def _run(self, func, *args):
+        """Run func on the pool if a slot is free; returns a Future"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._metrics['rejected'] += 1
+            raise HashingOverloaded('Password hashing queue is full')
+    
+        submitted_at = time.perf_counter()
+    
+        def task():
+            started_at = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                finished_at = time.perf_counter()
+                with self._lock:
+                    self._metrics['completed'] += 1
+                    self._metrics['total_wait_ms'] += (started_at - submitted_at) * 1000
+                    self._metrics['total_compute_ms'] += (finished_at - started_at) * 1000
+                self._slots.release()
+    
+        with self._lock:
+            self._metrics['submitted'] += 1
+        return self._executor.submit(task)
+    
+    def hash_password_async(self, password: str) -> Future:
+        """Future resolving to the stored-format hash of a password"""
+        return self._run(self._hash, password)
+    
+    def hash_password(self, password: str) -> str:
+        """Hash a password on the pool, blocking until done"""
+        return self.hash_password_async(password).result(self.timeout)
+    
+    def verify_password(self, password: str, stored: Optional[str]) -> Tuple[bool, bool]:
+        """
+        Check a password against its stored hash (constant-time compare)
+    
+        stored=None (unknown account) burns the same KDF work and fails.
+        Returns: (is_valid, needs_rehash)
+        """
+        if stored is None:
+            self._run(self._verify, password, self._dummy_hash).result(self.timeout)
+            return False, False
+        return self._run(self._verify, password, stored).result(self.timeout)
+    
+    def get_metrics(self) -> Dict:
+        """Pool throughput + queueing metrics"""
+        with self._lock:
+            metrics = dict(self._metrics)
+        completed = metrics['completed']
+        metrics['in_flight'] = metrics['submitted'] - completed
+        metrics['avg_wait_ms'] = round(metrics['total_wait_ms'] / completed, 3) if completed else 0.0
+        metrics['avg_compute_ms'] = round(metrics['total_compute_ms'] / completed, 3) if completed else 0.0
+        metrics['total_wait_ms'] = round(metrics['total_wait_ms'], 3)
+        metrics['total_compute_ms'] = round(metrics['total_compute_ms'], 3)
+        metrics['max_workers'] = self.max_workers
+        metrics['max_queue'] = self.max_queue
+        return metrics
+    
+    def shutdown(self) -> None:
+        """Finish queued work and stop the worker threads"""
+        self._executor.shutdown(wait=True)
 
 
 class AuditLogger:
@@ -365,6 +635,27 @@ if __name__ == "__main__":
     emergency_summary = EmergencyAccessControl.generate_emergency_summary(patient_data)
     print(f"Emergency summary: {emergency_summary}")
     
+    print("\n=== SESSION TOKEN TEST ===")
+    tokens = SecureTokenManager(ttl_seconds=3600)
+    token = tokens.generate_token(42, Role.DOCTOR)
+    print(f"Token: {token}")
+    print(f"Claims: {tokens.verify_token(token)}")
+    tokens.add_key('k2', secrets.token_bytes(32))
+    print(f"Old key still verifies after rotation: {tokens.validate_token(token)}")
+    print(f"Tampered: {tokens.validate_token(token[:-2] + ('AA' if token[-2:] != 'AA' else 'BB'))}")
+    tokens.revoke_token(token)
+    print(f"After revoke: {tokens.validate_token(token)}")
+    
+    print("\n=== PASSWORD HASHING TEST ===")
+    hasher = PasswordHashingService(max_workers=2)
+    legacy = hashlib.sha256(b'doctor123').hexdigest()
+    print(f"Legacy sha256 verify (valid, needs_rehash): {hasher.verify_password('doctor123', legacy)}")
+    upgraded = hasher.hash_password('doctor123')
+    print(f"Upgraded hash: {upgraded[:40]}...")
+    print(f"scrypt verify: {hasher.verify_password('doctor123', upgraded)}")
+    print(f"Wrong password: {hasher.verify_password('wrong', upgraded)}")
+    print(f"Hashing metrics: {hasher.get_metrics()}")
+    
     print("\n=== THREAT DETECTION TEST ===")
     activity = {'authorized': False, 'records_accessed': 150}
     threat = ThreatMitigation.detect_threat(activity)
@@ -14,6 +14,9 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // Load ambulance data
     loadAmbulanceData();
+    
+    // Live emergency assignments
+    startEmergencyFeed();
 });
 
 // Check if user is authenticated
@@ -54,6 +57,55 @@ async function loadAmbulanceData() {
     }
 }
 
+// ============================================================================
+// LIVE EMERGENCIES (Server-Sent Events)
+// ============================================================================
+
+let emergencyFeed = null;
+let currentEmergency = null;
+
+// Snapshot once, then stream created / dispatched / resolved events
+function startEmergencyFeed() {
+    emergencyFeed = new EmergencyFeed({
+        onChange: emergencies => {
+            // Pick up the newest active emergency when idle
+            if (!currentEmergency && emergencies.length > 0) {
+                showEmergency(emergencies[0], 'CRITICAL - AWAITING DISPATCH');
+            }
+        },
+        onEvent: (type, data) => {
+            if (!currentEmergency || data.id !== currentEmergency.id) return;
+            if (type === 'dispatched') {
+                showEmergency(currentEmergency, 'CRITICAL - EN ROUTE');
+            } else if (type === 'resolved') {
+                currentEmergency = null;
+                showEmergency(null, 'NO ACTIVE EMERGENCY');
+                emergencyFeed.notifyChange();
+            }
+        }
+    });
+    emergencyFeed.start().catch(error => console.error('❌ Error loading emergencies:', error));
+}
+
+// Fill the Active Emergency card
+function showEmergency(emergency, status) {
+    currentEmergency = emergency;
+    
+    const statusEl = document.querySelector('.dispatch-status');
+    if (statusEl) {
+        statusEl.textContent = status;
+    }
+    
+    const values = document.querySelectorAll('.patient-condition .condition-value');
+    if (values.length < 4) return;
+    const fields = emergency
+        ? [emergency.name, emergency.emergency_type, emergency.location || 'Unknown', emergency.phone]
+        : ['-', '-', '-', '-'];
+    fields.forEach((value, i) => {
+        values[i].textContent = value || '-';
+    });
+}
+
 // Logout function
 function logout() {
     if (confirm('Are you sure you want to logout?')) {
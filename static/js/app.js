@@ -186,33 +186,39 @@ document.getElementById('sosButton').addEventListener('click', async () => {
 });
 
 // Load emergencies (for doctor)
-async function loadEmergencies() {
-    try {
-        const data = await apiCall('/doctor/emergencies');
-        
-        const listDiv = document.getElementById('emergenciesList');
-        
-        if (data.emergencies && data.emergencies.length > 0) {
-            listDiv.innerHTML = data.emergencies.map(emergency => `
-                <div class="emergency-item">
-                    <h4>🚨 Emergency #${emergency.id}</h4>
-                    <p><strong>Patient:</strong> ${emergency.name} (${emergency.abha_id})</p>
-                    <p><strong>Phone:</strong> ${emergency.phone}</p>
-                    <p><strong>Type:</strong> ${emergency.emergency_type}</p>
-                    <p><strong>Status:</strong> ${emergency.status}</p>
-                    <p><strong>Time:</strong> ${new Date(emergency.created_at).toLocaleString()}</p>
-                    <p><strong>Vitals:</strong> ${emergency.vitals_summary}</p>
-                    <button onclick="dispatchAmbulance(${emergency.id})" class="btn btn-secondary">
-                        🚑 Dispatch Ambulance
-                    </button>
-                </div>
-            `).join('');
-        } else {
-            listDiv.innerHTML = '<p>No active emergencies</p>';
-        }
-    } catch (error) {
+let emergencyFeed = null;
+
+function loadEmergencies() {
+    // Snapshot once, then live updates over /api/emergencies/stream
+    if (emergencyFeed) return;
+    emergencyFeed = new EmergencyFeed({ onChange: renderEmergencies });
+    emergencyFeed.start().catch(error => {
         console.error('Load emergencies error:', error);
         alert('Failed to load emergencies: ' + error.message);
+        emergencyFeed = null;
+    });
+}
+
+function renderEmergencies(emergencies) {
+    const listDiv = document.getElementById('emergenciesList');
+    
+    if (emergencies.length > 0) {
+        listDiv.innerHTML = emergencies.map(emergency => `
+            <div class="emergency-item">
+                <h4>🚨 Emergency #${emergency.id}</h4>
+                <p><strong>Patient:</strong> ${escapeHtml(emergency.name)} (${escapeHtml(emergency.abha_id)})</p>
+                <p><strong>Phone:</strong> ${escapeHtml(emergency.phone)}</p>
+                <p><strong>Type:</strong> ${escapeHtml(emergency.emergency_type)}</p>
+                <p><strong>Status:</strong> ${escapeHtml(emergency.status)}</p>
+                <p><strong>Time:</strong> ${new Date(emergency.created_at).toLocaleString()}</p>
+                <p><strong>Vitals:</strong> ${escapeHtml(emergency.vitals_summary)}</p>
+                <button onclick="dispatchAmbulance(${emergency.id})" class="btn btn-secondary">
+                    🚑 Dispatch Ambulance
+                </button>
+            </div>
+        `).join('');
+    } else {
+        listDiv.innerHTML = '<p>No active emergencies</p>';
     }
 }
 
@@ -226,7 +232,7 @@ async function dispatchAmbulance(emergencyId) {
         
         if (data.success) {
             alert('✅ ' + data.message + '\nETA: ' + data.eta);
-            loadEmergencies();
+            // The list updates itself from the 'dispatched' event
         }
     } catch (error) {
         alert('Dispatch failed: ' + error.message);
@@ -14,6 +14,9 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // Load doctor data
     loadDoctorData();
+    
+    // Live emergency alerts
+    startEmergencyAlerts();
 });
 
 // Check if user is authenticated
@@ -71,6 +74,73 @@ function updateDashboard(userData) {
     console.log('✅ Dashboard updated');
 }
 
+// ============================================================================
+// LIVE EMERGENCY ALERTS (Server-Sent Events)
+// ============================================================================
+
+let emergencyFeed = null;
+
+// Snapshot once, then stream created / dispatched / resolved events
+function startEmergencyAlerts() {
+    emergencyFeed = new EmergencyFeed({
+        onChange: renderEmergencyAlerts,
+        onEvent: (type, data) => console.log(`🚨 Emergency ${type}:`, data.id)
+    });
+    emergencyFeed.start().catch(error => console.error('❌ Error loading emergencies:', error));
+}
+
+// Render the active emergencies list + badge
+function renderEmergencyAlerts(emergencies) {
+    const badgeCount = document.querySelector('#emergencyBadge .badge-count');
+    if (badgeCount) {
+        badgeCount.textContent = emergencies.length;
+    }
+    
+    const listEl = document.querySelector('.emergency-list');
+    if (!listEl) return;
+    
+    if (emergencies.length === 0) {
+        listEl.innerHTML = '<div class="emergency-details">No active emergencies</div>';
+        return;
+    }
+    
+    listEl.innerHTML = emergencies.map(emergency => {
+        // Manual SOS and critical vitals first; AI-risk-only alerts are urgent
+        const critical = emergency.emergency_type === 'SOS_MANUAL' || emergency.emergency_type.includes('CRITICAL');
+        return `
+            <div class="emergency-item ${critical ? 'critical' : 'urgent'}">
+                <div class="emergency-header">
+                    <span class="emergency-status">${critical ? 'CRITICAL' : 'URGENT'}</span>
+                    <span class="emergency-time">${timeAgo(emergency.created_at)}</span>
+                </div>
+                <div class="emergency-patient">Patient: ${escapeHtml(emergency.name)} (ID: ${emergency.user_id})</div>
+                <div class="emergency-details">${escapeHtml(emergency.emergency_type)}${emergency.location ? ' - ' + escapeHtml(emergency.location) : ''}</div>
+                <div class="emergency-vitals">${escapeHtml(emergency.vitals_summary)}</div>
+                <button class="btn-respond" onclick="respondToEmergency(${emergency.id})">Respond Now</button>
+            </div>
+        `;
+    }).join('');
+}
+
+// Dispatch an ambulance; the 'dispatched' event removes the alert
+async function respondToEmergency(emergencyId) {
+    try {
+        const response = await fetch(`${EMERGENCY_API_BASE}/ambulance/dispatch`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ emergency_id: emergencyId })
+        });
+        const data = await response.json();
+        if (data.success) {
+            alert('✅ ' + data.message + '\nETA: ' + data.eta);
+        }
+    } catch (error) {
+        alert('Dispatch failed: ' + error.message);
+    }
+}
+
+window.respondToEmergency = respondToEmergency;
+
 // Logout function
 function logout() {
     if (confirm('Are you sure you want to logout?')) {
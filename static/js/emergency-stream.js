@@ -0,0 +1,120 @@
+/*
+╔══════════════════════════════════════════════════════════════════════════════╗
+║   EMERGENCY STREAM - LIVE EMERGENCY FEED                                     ║
+║   One snapshot fetch + Server-Sent Events instead of polling                 ║
+╚══════════════════════════════════════════════════════════════════════════════╝
+*/
+
+const EMERGENCY_API_BASE = window.location.hostname === 'localhost' || window.location.hostname === '127.0.0.1'
+    ? 'http://localhost:5000/api'
+    : '/api';  // Use relative path in production
+
+// Snapshot = every active emergency (fetched page by page), only the columns the lists render
+const EMERGENCY_SNAPSHOT_PAGE_SIZE = 500;
+const EMERGENCY_LIST_FIELDS = 'user_id,emergency_type,status,severity,location,vitals_summary,name,phone,abha_id';
+
+// Live set of ACTIVE emergencies, kept in sync by /api/emergencies/stream
+class EmergencyFeed {
+    constructor(handlers = {}) {
+        this.handlers = handlers;     // onChange(list), onEvent(type, data)
+        this.active = new Map();      // emergency id -> emergency row
+        this.source = null;
+    }
+
+    // Snapshot once, then apply incremental events from where it left off
+    async start() {
+        this.stop();
+        const active = new Map();
+        let lastEventId = null;
+        let cursor = null;
+        do {
+            const url = `${EMERGENCY_API_BASE}/doctor/emergencies?limit=${EMERGENCY_SNAPSHOT_PAGE_SIZE}`
+                + `&fields=${EMERGENCY_LIST_FIELDS}` + (cursor ? `&cursor=${encodeURIComponent(cursor)}` : '');
+            const response = await fetch(url);
+            const data = await response.json();
+            if (!response.ok) {
+                throw new Error(data.error || `HTTP ${response.status}`);
+            }
+
+            data.emergencies.forEach(emergency => active.set(emergency.id, emergency));
+            // Resume from the first page: replaying a few events twice is harmless, missing one is not
+            if (lastEventId === null) {
+                lastEventId = data.last_event_id;
+            }
+            cursor = data.next_cursor;
+        } while (cursor);
+
+        this.active = active;
+        this.notifyChange();
+        this.open(lastEventId);
+    }
+
+    open(lastEventId) {
+        // On reconnect the browser resends Last-Event-ID itself; the server replays the gap
+        this.source = new EventSource(`${EMERGENCY_API_BASE}/emergencies/stream?last_event_id=${lastEventId}`);
+
+        this.source.addEventListener('created', event => {
+            const emergency = JSON.parse(event.data);
+            this.active.set(emergency.id, emergency);
+            this.emit('created', emergency);
+        });
+
+        ['dispatched', 'resolved'].forEach(type => {
+            this.source.addEventListener(type, event => {
+                const update = JSON.parse(event.data);
+                this.active.delete(update.id);
+                this.emit(type, update);
+            });
+        });
+
+        // Event id the server doesn't know (e.g. database replaced) - take a fresh snapshot
+        this.source.addEventListener('reset', () => {
+            console.log('🔄 Emergency stream reset, reloading snapshot');
+            this.start().catch(error => console.error('❌ Emergency snapshot error:', error));
+        });
+
+        this.source.onerror = () => {
+            console.log('⚠️ Emergency stream disconnected, reconnecting...');
+        };
+    }
+
+    emit(type, data) {
+        if (this.handlers.onEvent) {
+            this.handlers.onEvent(type, data);
+        }
+        this.notifyChange();
+    }
+
+    notifyChange() {
+        if (this.handlers.onChange) {
+            // Newest first, like /api/doctor/emergencies
+            const list = [...this.active.values()].sort((a, b) => b.id - a.id);
+            this.handlers.onChange(list);
+        }
+    }
+
+    stop() {
+        if (this.source) {
+            this.source.close();
+            this.source = null;
+        }
+    }
+}
+
+// Escape server data before putting it into innerHTML
+function escapeHtml(value) {
+    return String(value ?? '').replace(/[&<>"']/g, char => ({
+        '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'
+    }[char]));
+}
+
+// "2 min ago" from an SQLite UTC timestamp
+function timeAgo(timestamp) {
+    const created = new Date(timestamp.replace(' ', 'T') + 'Z');
+    const minutes = Math.max(0, Math.round((Date.now() - created.getTime()) / 60000));
+    if (minutes < 1) return 'just now';
+    if (minutes < 60) return `${minutes} min ago`;
+    return `${Math.round(minutes / 60)} hr ago`;
+}
+
+window.EmergencyFeed = EmergencyFeed;